@@ -0,0 +1,269 @@
+"""
+    Async, read-only catalog API, mounted alongside the Flask app.
+
+        uvicorn asgi:app
+        gunicorn --worker-class uvicorn.workers.UvicornWorker asgi:app
+
+    GET requests for /api/monsters, /api/monsters/<id> and
+    /api/encounters/<id> are answered here, on the event loop, using
+    asyncpg and an async connection pool (ASYNC_POOL_SIZE connections per
+    process, plus ASYNC_POOL_MAX_OVERFLOW; the other DB_* pool settings
+    apply as for the Flask app). Every other request goes to the
+    Flask app, which runs on a thread through asgiref's WSGI adapter.
+
+    Responses match the Flask views', including the catalog ETags, except
+    that unknown ids get a JSON 404. The per-request query budgets of
+    instrumentation.py don't apply here.
+"""
+
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import render_template
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import http_date, parse_date, parse_etags
+from werkzeug.routing import Map, Rule
+
+from app import app as flask_app
+from cache import LRUCache
+from catalog import MonsterCatalog
+from models import CatalogVersion, Encounter, Monster
+from pooling import engine_options, watch_transactions
+from views import catalog_etag, is_fresh, list_monsters
+
+routes = Map([
+    Rule('/api/monsters', endpoint='monsters', methods=['GET']),
+    Rule('/api/monsters/<int:monster_id>', endpoint='monster', methods=['GET']),
+    Rule('/api/encounters/<int:enc_id>', endpoint='encounter', methods=['GET']),
+])
+
+
+def async_url(uri):
+    """The same database, through the asyncpg driver"""
+
+    return make_url(uri).set(drivername="postgresql+asyncpg")
+
+
+def to_json(value):
+    """Serialize like Flask's jsonify outside debug mode"""
+
+    return json.dumps(value, sort_keys=True, separators=(",", ":")) + "\n"
+
+
+class AsyncCatalogStore:
+    """CatalogStore for the event loop
+
+    The database version is checked at most every `interval` seconds;
+    there's no local commit to invalidate it sooner, since this side
+    never writes.
+    """
+
+    def __init__(self, sessions, interval):
+        self.sessions = sessions
+        self.interval = interval
+        self.catalog = None
+        self.checked = 0
+        self.lock = None
+
+    async def get(self):
+        """Return an up-to-date catalog, reloading it if needed"""
+
+        now = time.monotonic()
+
+        if self.catalog is not None and now - self.checked < self.interval:
+            return self.catalog
+
+        # created here so it belongs to the running loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+
+        async with self.lock:
+            if self.catalog is not None and now - self.checked < self.interval:
+                return self.catalog
+
+            async with self.sessions() as session:
+                version = await session.run_sync(CatalogVersion.current)
+                if self.catalog is None or version != self.catalog.version:
+                    self.catalog = await session.run_sync(MonsterCatalog.load)
+
+            self.checked = now
+            return self.catalog
+
+
+class Request:
+    """The parts of an ASGI HTTP scope the catalog views need"""
+
+    def __init__(self, scope):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'),
+                                        keep_blank_values=True))
+        self.headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                        for name, value in scope['headers']}
+
+        self.if_none_match = parse_etags(self.headers.get('if-none-match'))
+        self.if_modified_since = parse_date(self.headers.get('if-modified-since'))
+
+
+class CatalogAPI:
+    """ASGI app: the async catalog views in front of a Flask app"""
+
+    def __init__(self, flask_app):
+        config = flask_app.config
+
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+        url = async_url(config['SQLALCHEMY_DATABASE_URI'])
+        options = dict(engine_options(config, url),
+                       pool_size=config['ASYNC_POOL_SIZE'],
+                       max_overflow=config['ASYNC_POOL_MAX_OVERFLOW'])
+
+        self.engine = create_async_engine(url, **options)
+        watch_transactions(self.engine.sync_engine, config)
+        self.sessions = sessionmaker(self.engine, class_=AsyncSession)
+
+        self.catalog = AsyncCatalogStore(self.sessions, config['CATALOG_CHECK_INTERVAL'])
+        self.stat_blocks = LRUCache(config['STAT_BLOCK_CACHE_SIZE'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http':
+            try:
+                endpoint, kwargs = routes.bind('').match(scope['path'], scope['method'])
+            except HTTPException:
+                pass
+            else:
+                request = Request(scope)
+                response = await getattr(self, endpoint)(request, **kwargs)
+                return await self.respond(send, request, response)
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+
+            elif message['type'] == 'lifespan.shutdown':
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def respond(self, send, request, response):
+        status, body, headers = response
+
+        headers = dict(headers, **{'Access-Control-Allow-Origin': '*'})
+        if body is not None:
+            body = body.encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+            headers['Content-Length'] = str(len(body))
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                        for k, v in headers.items()],
+        })
+        await send({
+            'type': 'http.response.body',
+            'body': body if body is not None and request.method != 'HEAD' else b'',
+        })
+
+    async def cached(self, request, render):
+        """Like views.catalog_cached: answer with a 304 if the client is current
+
+        `render(catalog)` returns (status, body) for a full response.
+        """
+
+        catalog = await self.catalog.get()
+        etag = catalog_etag(catalog, self.flask_app.config['CATALOG_ETAG_SALT'])
+
+        if is_fresh(catalog, etag, request.if_none_match, request.if_modified_since):
+            status, body = 304, None
+        else:
+            status, body = await render(catalog)
+
+            if status != 200:
+                return status, body, {}
+
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f"public, max-age={self.flask_app.config['CATALOG_MAX_AGE']}",
+        }
+        if catalog.updated_at is not None:
+            headers['Last-Modified'] = http_date(catalog.updated_at)
+
+        return status, body, headers
+
+    async def monsters(self, request):
+        """GET /api/monsters (see views.get_monsters)"""
+
+        async def render(catalog):
+            try:
+                return 200, list_monsters(catalog, request.args)
+            except (TypeError, ValueError) as err:
+                return 400, to_json({'error': str(err)})
+
+        return await self.cached(request, render)
+
+    async def monster(self, request, monster_id):
+        """GET /api/monsters/<id> (see views.get_monster_by_id)"""
+
+        async def render(catalog):
+            stat_blocks = self.stat_blocks.at_version(catalog.version)
+
+            key = (monster_id, catalog.version)
+            html = stat_blocks.get(key)
+
+            if html is None:
+                async with self.sessions() as session:
+                    monster = (await session.execute(
+                        select(Monster)
+                        .options(selectinload(Monster.special_abilities),
+                                 selectinload(Monster.actions),
+                                 selectinload(Monster.legendary_actions))
+                        .filter_by(id=monster_id)
+                    )).scalars().first()
+
+                if monster is None:
+                    return 404, to_json({'error': "monster not found"})
+
+                with self.flask_app.app_context():
+                    html = render_template('monster.html', monster=monster)
+                stat_blocks.put(key, html)
+
+            return 200, to_json(html)
+
+        return await self.cached(request, render)
+
+    async def encounter(self, request, enc_id):
+        """GET /api/encounters/<id> (see views.get_encounter_by_id)"""
+
+        async with self.sessions() as session:
+            encounter = (await session.execute(
+                select(Encounter)
+                .options(selectinload(Encounter.hero_groups),
+                         selectinload(Encounter.monster_groups))
+                .filter_by(id=enc_id)
+            )).scalars().first()
+
+        if encounter is None:
+            return 404, to_json({'error': "encounter not found"}), {}
+
+        return 200, to_json(encounter.serialize()), {}
+
+
+app = CatalogAPI(flask_app)
@@ -0,0 +1,170 @@
+"""
+    Async catalog benchmark: the Flask app under gunicorn against asgi.py
+    under uvicorn, on the read-only catalog endpoints.
+
+    python bench/async_catalog.py [--connections 200] [--seconds 10]
+
+For each server it opens --connections keep-alive connections, drives
+them as fast as they will go for --seconds, and reports requests/sec
+and latency. Resident memory of the server's processes is read from
+/proc (so Linux only) before the connections open and again while they
+are all open; the difference over --connections is the memory each
+connection costs. Uses DATABASE_URL like the app does.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ["/api/monsters?limit=20", "/api/monsters?q=dragon&limit=20",
+         "/api/monsters/1", "/api/encounters/1"]
+
+
+def servers(port, workers, threads):
+    bind = f"127.0.0.1:{port}"
+    return {
+        'gunicorn (gthread)': ["gunicorn", "--worker-class", "gthread",
+                               "--workers", str(workers), "--threads", str(threads),
+                               "--bind", bind, "app:app"],
+        'uvicorn (asgi.py)': ["gunicorn", "--worker-class",
+                              "uvicorn.workers.UvicornWorker",
+                              "--workers", str(workers), "--bind", bind, "asgi:app"],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_kb(pid):
+    """Resident memory of a process and all its descendants, in kB"""
+
+    total = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1])
+
+        for task in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{task}/children") as f:
+                total += sum(rss_kb(int(child)) for child in f.read().split())
+    except FileNotFoundError:
+        pass
+
+    return total
+
+
+def wait_ready(port):
+    for _ in range(100):
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+
+    raise SystemExit("server did not become ready")
+
+
+async def get(reader, writer, path):
+    """One keep-alive GET; returns False if the server closed the connection"""
+
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+    await writer.drain()
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    headers = head.decode("latin-1").lower()
+
+    length = 0
+    for line in headers.split("\r\n"):
+        if line.startswith("content-length:"):
+            length = int(line.split(":", 1)[1])
+    await reader.readexactly(length)
+
+    return "connection: close" not in headers
+
+
+async def client(port, number, opened, start, end, times):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await get(reader, writer, PATHS[0])
+    opened.release()
+
+    await start.wait()
+
+    i = number
+    while time.monotonic() < end[0]:
+        began = time.perf_counter()
+        if not await get(reader, writer, PATHS[i % len(PATHS)]):
+            writer.close()
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        times.append(time.perf_counter() - began)
+        i += 1
+
+    writer.close()
+
+
+async def drive(port, pid, connections, seconds):
+    opened = asyncio.Semaphore(0)
+    start = asyncio.Event()
+    end = [0]
+    times = []
+
+    idle = rss_kb(pid)
+
+    tasks = [asyncio.create_task(client(port, n, opened, start, end, times))
+             for n in range(connections)]
+    for _ in range(connections):
+        await opened.acquire()
+
+    loaded = rss_kb(pid)
+
+    end[0] = time.monotonic() + seconds
+    start.set()
+    await asyncio.gather(*tasks)
+
+    return times, idle, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--connections', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8,
+                        help="threads per gthread worker (default 8)")
+    args = parser.parse_args()
+
+    port = free_port()
+
+    for name, command in servers(port, args.workers, args.threads).items():
+        server = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            times, idle, loaded = asyncio.run(
+                drive(port, server.pid, args.connections, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+
+        times = sorted(t * 1000 for t in times)
+        p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+        per_connection = (loaded - idle) / args.connections
+
+        print(f"{name}: {len(times) / args.seconds:8.0f} req/s, "
+              f"p50 {statistics.median(times):6.1f} ms, p99 {p99:6.1f} ms, "
+              f"RSS {idle / 1024:.0f} -> {loaded / 1024:.0f} MB "
+              f"({per_connection:.1f} kB per connection)")
+
+
+if __name__ == "__main__":
+    main()
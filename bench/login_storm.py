@@ -0,0 +1,137 @@
+"""
+    Login storm benchmark: catalog latency while many users log in.
+
+    python bench/login_storm.py [--logins 16] [--seconds 10] [--hash-workers 2]
+
+Starts gunicorn (gthread workers, as in the Procfile) on a free port,
+creates a bench user, then measures GET /api/monsters twice: on its own,
+and while --logins clients log in as fast as they can. Compare runs with
+--hash-workers 0 (bcrypt on the request threads, uncapped) against the
+default pool. Uses DATABASE_URL like the app does.
+"""
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+USERNAME = "bench-login-storm"
+PASSWORD = "bench-password"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def create_user():
+    from app import app
+    from models import db, User
+
+    with app.app_context():
+        if not User.query.filter_by(username=USERNAME).first():
+            User.signup(f"{USERNAME}@example.com", USERNAME, PASSWORD)
+            db.session.commit()
+
+
+def start_server(port, args):
+    env = dict(os.environ, PASSWORD_HASH_WORKERS=str(args.hash_workers))
+    server = subprocess.Popen(
+        ["gunicorn", "--preload", "--worker-class", "gthread",
+         "--workers", str(args.workers), "--threads", str(args.threads),
+         "--bind", f"127.0.0.1:{port}", "app:app"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(base + "/ready", timeout=1).ok:
+                return server, base
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.1)
+
+    server.terminate()
+    raise SystemExit("gunicorn did not become ready")
+
+
+def log_in_forever(base, stop, counts):
+    session = requests.Session()
+    while not stop.is_set():
+        page = session.get(base + "/login").text
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page)
+        resp = session.post(base + "/login", allow_redirects=False, data={
+            'csrf_token': token.group(1) if token else "",
+            'username': USERNAME, 'password': PASSWORD})
+        counts[resp.status_code] = counts.get(resp.status_code, 0) + 1
+        session.get(base + "/logout", allow_redirects=False)
+
+
+def catalog_latencies(base, seconds):
+    times = []
+    session = requests.Session()
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        start = time.perf_counter()
+        session.get(base + "/api/monsters", params={'limit': 20}).raise_for_status()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def report(label, times):
+    times = sorted(times)
+    p99 = times[min(len(times) - 1, int(len(times) * 0.99))]
+    print(f"{label:>12}: {len(times):5} requests, p50 {statistics.median(times):7.1f} ms, "
+          f"p99 {p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=16,
+                        help="concurrent login clients (default 16)")
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--hash-workers', type=int, default=2,
+                        help="PASSWORD_HASH_WORKERS for the server (0: inline)")
+    args = parser.parse_args()
+
+    create_user()
+    server, base = start_server(free_port(), args)
+
+    try:
+        report("quiet", catalog_latencies(base, args.seconds))
+
+        stop, counts = threading.Event(), {}
+        clients = [threading.Thread(target=log_in_forever, args=(base, stop, counts))
+                   for _ in range(args.logins)]
+        for c in clients:
+            c.start()
+
+        try:
+            report("login storm", catalog_latencies(base, args.seconds))
+        finally:
+            stop.set()
+            for c in clients:
+                c.join()
+
+        print(f"{'logins':>12}: " + ", ".join(f"{n} x {status}"
+                                              for status, n in sorted(counts.items())))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+    Startup benchmark: how long a fresh worker takes to import the app
+    and to answer its first request.
+
+    python bench/startup.py [--runs 5] [--config production] [--path /]
+
+Each run starts a new interpreter, so nothing is shared between runs
+except the OS file cache (and the Jinja bytecode cache, where the
+profile has one). Uses DATABASE_URL like the app does.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs in the child interpreter; prints its timings as JSON
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+resp = app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+print(json.dumps({'import': imported - start, 'first': done - imported,
+                  'status': resp.status_code}))
+"""
+
+
+def run_once(config, path):
+    env = dict(os.environ, APP_CONFIG=config)
+    out = subprocess.run([sys.executable, "-c", PROBE, path], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--config', default='production',
+                        help="profile from config.py (default production)")
+    parser.add_argument('--path', default='/',
+                        help="URL of the first request (default /)")
+    args = parser.parse_args()
+
+    results = [run_once(args.config, args.path) for _ in range(args.runs)]
+
+    statuses = {r['status'] for r in results}
+    print(f"{args.config}, {args.runs} runs, GET {args.path} -> {', '.join(map(str, statuses))}")
+
+    for key, label in (('import', "import app"), ('first', "first response")):
+        times = [r[key] * 1000 for r in results]
+        print(f"{label:>15}: median {statistics.median(times):7.1f} ms, "
+              f"min {min(times):7.1f} ms, max {max(times):7.1f} ms")
+
+    total = [(r['import'] + r['first']) * 1000 for r in results]
+    print(f"{'total':>15}: median {statistics.median(total):7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
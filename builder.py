@@ -0,0 +1,180 @@
+"""
+    Encounter auto-builder.
+
+    Searches for groups of monsters whose adjusted XP falls inside the band
+    for a requested difficulty. Monsters are bucketed by XP into an
+    XP-sorted index, the search runs over XP levels and counts rather than
+    over individual monsters, and the last group of every combination is
+    found with a bisect instead of a loop.
+"""
+
+import heapq
+from bisect import bisect_left
+from collections import defaultdict
+
+from difficulty import ENCOUNTER_MULTIPLIERS, MAX_MULTIPLIER_INDEX
+
+DIFFICULTY_LEVELS = ['easy', 'medium', 'hard', 'deadly']
+
+# A "deadly" band has no natural upper limit, so cap it at this multiple
+# of the party's deadly goal.
+DEADLY_CEILING = 1.5
+
+MULTIPLIERS = ENCOUNTER_MULTIPLIERS.tolist()
+
+
+def multiplier(num_monsters):
+    """Encounter multiplier for a monster count"""
+
+    return MULTIPLIERS[min(num_monsters, MAX_MULTIPLIER_INDEX)]
+
+
+def parse_party(party):
+    """Parse a party string such as "4x1,2x3" (4 level-1 and 2 level-3 heroes)"""
+
+    groups = []
+
+    for part in party.split(','):
+        if not part.strip():
+            continue
+
+        num, _, lvl = part.strip().lower().partition('x')
+        if not lvl:
+            raise ValueError(f"party groups look like 4x1, not '{part}'")
+
+        groups.append({'num': int(num), 'lvl': int(lvl)})
+
+    if not groups:
+        raise ValueError("party must include at least one hero group")
+
+    return groups
+
+
+def difficulty_band(thresholds, difficulty):
+    """Return the [low, high) adjusted XP band for a difficulty"""
+
+    if difficulty not in DIFFICULTY_LEVELS:
+        raise ValueError(
+            f"difficulty must be one of {', '.join(DIFFICULTY_LEVELS)}")
+
+    level = DIFFICULTY_LEVELS.index(difficulty)
+    low = thresholds[level]
+
+    if level + 1 < len(DIFFICULTY_LEVELS):
+        high = thresholds[level + 1]
+    else:
+        high = low * DEADLY_CEILING
+
+    return low, high
+
+
+class XPIndex:
+    """Monsters bucketed by XP, with the distinct XP values kept sorted"""
+
+    def __init__(self, monsters):
+        """`monsters` is an iterable of (id, name, cr, xp) tuples"""
+
+        buckets = defaultdict(list)
+        for m in monsters:
+            if m[3] > 0:
+                buckets[m[3]].append(m)
+
+        self.xp = sorted(buckets)
+        self.monsters = [buckets[xp] for xp in self.xp]
+
+    def __len__(self):
+        return len(self.xp)
+
+
+def search(index, low, high, max_groups=2, max_monsters=12):
+    """Find combinations of XP levels with an adjusted XP in [low, high).
+
+    Yields (combination, adjusted XP), where a combination is a tuple of
+    (level, count) pairs and `level` is a position in `index.xp`. Levels
+    within a combination are strictly increasing, so every combination is
+    produced once.
+    """
+
+    xp = index.xp
+
+    def last_group(start, total, num):
+        # the final group is solved for directly: for each count, the XP
+        # per monster that lands in the band is a contiguous range
+        for count in range(1, max_monsters - num + 1):
+            mult = multiplier(num + count)
+            if total * mult >= high:
+                break
+
+            lo = bisect_left(xp, (low / mult - total) / count, lo=start)
+            hi = bisect_left(xp, (high / mult - total) / count, lo=lo)
+
+            for level in range(lo, hi):
+                yield level, count, (total + xp[level] * count) * mult
+
+    def extend(start, chosen, total, num):
+        for level, count, adjusted in last_group(start, total, num):
+            yield chosen + ((level, count),), adjusted
+
+        if len(chosen) + 1 >= max_groups:
+            return
+
+        for level in range(start, len(xp)):
+            for count in range(1, max_monsters - num):
+                new_total = total + xp[level] * count
+
+                # more monsters only ever raise the adjusted XP
+                if new_total * multiplier(num + count + 1) >= high:
+                    break
+
+                yield from extend(level + 1, chosen + ((level, count),),
+                                  new_total, num + count)
+
+            if (total + xp[level]) * multiplier(num + 2) >= high:
+                break
+
+    return extend(0, (), 0, 0)
+
+
+def suggest(monsters, thresholds, difficulty, limit=10, max_groups=2, max_monsters=12):
+    """Suggest up to `limit` monster groups for a difficulty.
+
+    `monsters` is an iterable of (id, name, cr, xp) tuples that already
+    satisfy any filters; `thresholds` are the party's [easy, medium, hard,
+    deadly] XP goals. Suggestions closest to the middle of the band come
+    first, with fewer monster groups breaking ties.
+    """
+
+    low, high = difficulty_band(thresholds, difficulty)
+    index = XPIndex(monsters)
+
+    if not len(index) or high <= 0:
+        return []
+
+    target = (low + high) / 2
+
+    # every match is ranked, but only the best `limit` are ever held
+    best = heapq.nsmallest(
+        limit, search(index, low, high, max_groups, max_monsters),
+        key=lambda found: (abs(found[1] - target), len(found[0]), found[0]))
+
+    suggestions = []
+    for rank, (combo, adjusted) in enumerate(best):
+        groups = []
+        for level, count in combo:
+            # rotate through the monsters sharing an XP value so that
+            # similar suggestions don't all repeat the same monster
+            bucket = index.monsters[level]
+            id, name, cr, xp = bucket[rank % len(bucket)]
+            groups.append(
+                {'id': id, 'name': name, 'cr': cr, 'xp': xp, 'num': count})
+
+        total_xp = sum(g['xp'] * g['num'] for g in groups)
+
+        suggestions.append({
+            'monsters': groups,
+            'total_xp': total_xp,
+            'adjusted_xp': adjusted,
+            'difficulty': difficulty.upper(),
+        })
+
+    return suggestions
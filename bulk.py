@@ -0,0 +1,251 @@
+"""
+    Bulk encounter import and export.
+
+    Encounters arrive as a JSON array or as NDJSON (one encounter per
+    line). Each one is validated on its own as it is read; valid ones are
+    collected into batches and written with one multi-row INSERT per
+    table, and invalid ones are reported back by position without
+    stopping the import. The caller commits once at the end, so an
+    import is a single transaction.
+
+    Exports go the other way: encounters are streamed from a server-side
+    cursor and written out one record at a time, as NDJSON or CSV.
+"""
+
+import csv
+import io
+import json
+
+from sqlalchemy import insert
+
+from models import (db, Encounter, EncounterHero, EncounterMonster, CR_LENGTH,
+                    MAX_INT, parse_list, to_int)
+from difficulty import MAX_LEVEL, MAX_NUM, MAX_XP, parse_groups, rate
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson',
+                'application/jsonl', 'application/x-jsonlines')
+
+
+def read_items(req):
+    """Yield (index, item, error) for each encounter in the request body
+
+    NDJSON bodies are read line by line from the request stream; a line
+    that isn't valid JSON is an error for that item only.
+    """
+
+    if req.mimetype in NDJSON_TYPES:
+        index = 0
+        for line in req.stream:
+            if not line.strip():
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError:
+                yield index, None, "invalid JSON"
+            index += 1
+        return
+
+    items = req.get_json(silent=True)
+    if isinstance(items, dict):
+        items = items.get('encounters')
+
+    if not isinstance(items, list):
+        raise ValueError("expected a JSON array of encounters or NDJSON")
+
+    for index, item in enumerate(items):
+        yield index, item, None
+
+
+def _count(group, key, low, high):
+    try:
+        value = int(group[key])
+    except KeyError:
+        raise ValueError(f"'{key}' is required")
+    except (OverflowError, TypeError, ValueError):
+        raise ValueError(f"'{key}' must be an integer")
+
+    if not low <= value <= high:
+        raise ValueError(f"'{key}' is out of range")
+
+    return value
+
+
+def validate(item):
+    """Check one encounter and return the values of its encounters row
+
+    Raises ValueError describing the first problem found.
+    """
+
+    if not isinstance(item, dict):
+        raise ValueError("encounter must be an object")
+
+    heroes = parse_groups(item.get('heroes'))
+    monsters = parse_groups(item.get('monsters'))
+
+    for h in heroes:
+        if not isinstance(h, dict):
+            raise ValueError("hero groups must be objects")
+        _count(h, 'num', 0, MAX_NUM)
+        _count(h, 'lvl', 1, MAX_LEVEL)
+
+    for m in monsters:
+        if not isinstance(m, dict):
+            raise ValueError("monster groups must be objects")
+        if not isinstance(m.get('name'), str) or not m['name']:
+            raise ValueError("monster groups need a 'name'")
+        _count(m, 'num', 0, MAX_NUM)
+        _count(m, 'xp', 0, MAX_XP)
+        if m.get('id') is not None:
+            _count(m, 'id', 0, MAX_INT)
+        if m.get('cr') is not None and len(str(m['cr'])) > CR_LENGTH:
+            raise ValueError("monster 'cr' is too long")
+
+    heroes = json.dumps(heroes, separators=(',', ':'))
+    monsters = json.dumps(monsters, separators=(',', ':'))
+
+    rating = rate(heroes, monsters)
+
+    return {
+        'heroes': heroes,
+        'monsters': monsters,
+        'summary': Encounter.describe(heroes, monsters),
+        'num_monsters': rating['num_monsters'],
+        'adjusted_xp': rating['adjusted_xp'],
+        'difficulty': rating['difficulty'],
+    }
+
+
+def insert_batch(user_id, rows):
+    """Insert validated encounters and their groups; return the new ids
+
+    Core inserts skip the ORM hooks, so everything the hooks would have
+    filled in is already part of `rows`.
+    """
+
+    if not rows:
+        return []
+
+    values = [dict(row, user_id=user_id) for row in rows]
+
+    if db.engine.dialect.name == "postgresql":
+        # Postgres returns the ids of a multi-row VALUES in order
+        stmt = insert(Encounter.__table__).values(values).returning(Encounter.id)
+        ids = [row[0] for row in db.session.execute(stmt)]
+    else:
+        ids = [db.session.execute(insert(Encounter.__table__).values(v))
+               .inserted_primary_key[0] for v in values]
+
+    heroes, monsters = [], []
+    for enc_id, row in zip(ids, rows):
+        heroes.extend(dict(EncounterHero.values(h), encounter_id=enc_id, position=i)
+                      for i, h in enumerate(json.loads(row['heroes'])))
+        monsters.extend(dict(EncounterMonster.values(m), encounter_id=enc_id, position=i)
+                        for i, m in enumerate(json.loads(row['monsters'])))
+
+    if heroes:
+        db.session.execute(insert(EncounterHero.__table__), heroes)
+    if monsters:
+        db.session.execute(insert(EncounterMonster.__table__), monsters)
+
+    return ids
+
+
+def import_encounters(user_id, items, batch_size=500, max_items=10000):
+    """Validate and insert encounters for a user, without committing
+
+    `items` comes from read_items(). Returns the ids of the inserted
+    encounters (in input order) and a list of {"index", "error"} dicts
+    for the ones that were rejected.
+    """
+
+    ids, errors, batch = [], [], []
+
+    for index, item, error in items:
+        if index >= max_items:
+            errors.append({'index': index,
+                           'error': f"at most {max_items} encounters per import"})
+            break
+
+        if error is None:
+            try:
+                batch.append(validate(item))
+            except (OverflowError, TypeError, ValueError) as err:
+                error = str(err)
+
+        if error is not None:
+            errors.append({'index': index, 'error': error})
+
+        if len(batch) >= batch_size:
+            ids.extend(insert_batch(user_id, batch))
+            batch.clear()
+
+    ids.extend(insert_batch(user_id, batch))
+
+    return ids, errors
+
+
+EXPORT_COLUMNS = ('id', 'summary', 'difficulty', 'adjusted_xp',
+                  'num_monsters', 'heroes', 'monsters')
+
+
+def export_records(user_id, catalog, batch_size=500):
+    """Yield a user's encounters as dictionaries, oldest first
+
+    Rows are fetched `batch_size` at a time from a server-side cursor.
+    Monster groups are refreshed with the catalog's current name, CR and
+    XP (groups whose monster is no longer in the catalog keep the values
+    they were saved with).
+    """
+
+    query = (db.session.query(Encounter.id, Encounter.summary,
+                              Encounter.difficulty, Encounter.adjusted_xp,
+                              Encounter.num_monsters, Encounter.heroes,
+                              Encounter.monsters)
+             .filter(Encounter.user_id == user_id)
+             .order_by(Encounter.id)
+             .yield_per(batch_size))
+
+    for enc_id, summary, difficulty, adjusted_xp, num_monsters, heroes, monsters in query:
+        monsters = parse_list(monsters)
+
+        for m in monsters:
+            current = catalog.lookup(to_int(m.get('id'), None))
+            if current is not None:
+                m.update(current)
+
+        yield {
+            'id': enc_id,
+            'summary': summary,
+            'difficulty': difficulty,
+            'adjusted_xp': adjusted_xp,
+            'num_monsters': num_monsters,
+            'heroes': parse_list(heroes),
+            'monsters': monsters,
+        }
+
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+
+def to_csv(records):
+    """CSV lines; the hero and monster lists are JSON-encoded cells"""
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    writer.writerow(EXPORT_COLUMNS)
+    yield flush()
+
+    for record in records:
+        record['heroes'] = json.dumps(record['heroes'])
+        record['monsters'] = json.dumps(record['monsters'])
+        writer.writerow([record[c] for c in EXPORT_COLUMNS])
+        yield flush()
@@ -0,0 +1,162 @@
+"""
+    Small in-process caches.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe, size-bounded least-recently-used cache
+
+    Entries belong to a version (for example the catalog version); moving
+    the cache to a new version with `at_version` drops everything cached
+    for the old one. Hits, misses and evictions are counted.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.version = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def at_version(self, version):
+        """Clear the cache if it holds entries for a different version"""
+
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.entries.clear()
+                    self.version = version
+
+        return self
+
+    def get(self, key):
+        """Return the cached value for key, or None"""
+
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache value under key, evicting the least recently used entry"""
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Counters for the instrumentation endpoint"""
+
+        lookups = self.hits + self.misses
+
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'version': self.version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class TTLCache:
+    """Thread-safe, size-bounded cache whose entries expire after `ttl` seconds
+
+    For data that other processes may change behind our back, where a
+    short window of staleness is acceptable.
+    """
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+
+        now = time.monotonic()
+
+        with self.lock:
+            try:
+                expires, value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            if expires <= now:
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache value under key for the next `ttl` seconds"""
+
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        """Forget key, if it is cached"""
+
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Counters for the instrumentation endpoint"""
+
+        lookups = self.hits + self.misses
+
+        return {
+            'size': len(self.entries),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,474 @@
+"""
+    In-memory monster catalog.
+
+    The monster catalog is small and almost never changes, so each worker
+    loads it once into column-oriented NumPy arrays and answers the
+    filter form from memory. The copy is reloaded when the catalog
+    version in the database moves on. With CATALOG_FILE set, the columns
+    live in a memory-mapped file shared by every worker instead (see
+    catalog_file.py).
+
+    Filters are answered from bitmap indexes: one bitset (a Python int,
+    bit i standing for row i) per type, size and legendary status, plus
+    cumulative bitsets over the sorted distinct challenge ratings, so a
+    query is a bisect and a few bitwise ANDs.
+"""
+
+import base64
+import json
+import threading
+from bisect import bisect_left, bisect_right
+import time
+import weakref
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from catalog_file import CatalogFileError, read_catalog_file, write_catalog_file
+from models import db, Monster, LegendaryAction, CatalogVersion, format_cr
+from trigrams import TrigramIndex
+
+
+# orderings /api/monsters can sort by; ties are broken by name, then id
+SORT_KEYS = ('name', 'cr', 'size', 'type')
+
+# sizes sort smallest to largest rather than alphabetically
+SIZE_ORDER = ['Tiny', 'Small', 'Medium', 'Large', 'Huge', 'Gargantuan']
+
+# every CatalogStore in this process, so a local commit can reach them all
+_stores = weakref.WeakSet()
+
+
+def to_bits(mask):
+    """Pack a boolean array into a bitset"""
+
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def from_bits(bits, n):
+    """Unpack a bitset of n rows into an array of row numbers"""
+
+    packed = np.frombuffer(bits.to_bytes((n + 7) // 8, 'little'), dtype=np.uint8)
+    return np.flatnonzero(np.unpackbits(packed, count=n, bitorder='little'))
+
+
+def encode_cursor(key):
+    """Turn a keyset tuple into an opaque, URL-safe cursor"""
+
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise ValueError("invalid cursor")
+
+    if not isinstance(key, list):
+        raise ValueError("invalid cursor")
+
+    return tuple(key)
+
+
+def build_columns(rows, legendary_ids):
+    """Turn monster rows into the columns a MonsterCatalog is made of
+
+    `rows` are (id, name, size, type, subtype, challenge_rating, xp).
+    """
+
+    rows = sorted(rows, key=lambda r: (r[1].casefold(), r[0]))
+
+    types = sorted({r[3] for r in rows})
+    sizes = sorted({r[2] for r in rows}, reverse=True)
+
+    type_codes = {t: i for i, t in enumerate(types)}
+    size_codes = {s: i for i, s in enumerate(sizes)}
+
+    ids = np.array([r[0] for r in rows], dtype=np.int32)
+
+    columns = {
+        'types': types,
+        'sizes': sizes,
+        'ids': ids,
+        'cr': np.array([r[5] for r in rows], dtype=np.float64),
+        'xp': np.array([r[6] for r in rows], dtype=np.int32),
+        'type_code': np.array([type_codes[r[3]] for r in rows], dtype=np.uint16),
+        'size_code': np.array([size_codes[r[2]] for r in rows], dtype=np.uint16),
+        'legendary': np.array([r[0] in legendary_ids for r in rows], dtype=bool),
+        'by_id': np.argsort(ids, kind='stable').astype(np.int32),
+        'names': [r[1] for r in rows],
+        'json': [
+            json.dumps({
+                'id': id,
+                'name': name,
+                'challenge_rating': cr,
+                'cr': format_cr(cr),
+                'size': size,
+                'type': type,
+                'subtype': subtype,
+                'xp': xp
+            })
+            for id, name, size, type, subtype, cr, xp in rows
+        ],
+    }
+
+    # each sort order, and each row's position in it; ties are broken
+    # by name, then id
+    name_keys = [(r[1].casefold(), r[0]) for r in rows]
+    size_rank = {s: i for i, s in enumerate(SIZE_ORDER)}
+
+    leading = {
+        'name': lambda r: (),
+        'cr': lambda r: (r[5],),
+        'size': lambda r: (size_rank.get(r[2], len(SIZE_ORDER)), r[2]),
+        'type': lambda r: (r[3],),
+    }
+
+    for key in SORT_KEYS:
+        keys = [leading[key](r) + name_keys[i] for i, r in enumerate(rows)]
+        order = sorted(range(len(rows)), key=keys.__getitem__)
+
+        columns['order_' + key] = np.array(order, dtype=np.int32)
+        columns['rank_' + key] = np.empty(len(rows), dtype=np.int32)
+        columns['rank_' + key][columns['order_' + key]] = np.arange(len(rows))
+
+    return columns
+
+
+class SortKeys:
+    """Keyset tuples of one sort order, computed on access
+
+    keys[i] is the tuple cursors are compared to for the i-th row in
+    that order, so bisect can search a sort order without a list of
+    tuples being kept for every row.
+    """
+
+    def __init__(self, catalog, key):
+        self.catalog = catalog
+        self.key = key
+        self.order = catalog.order[key]
+        self.size_rank = {s: i for i, s in enumerate(SIZE_ORDER)}
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, position):
+        c = self.catalog
+        row = int(self.order[position])
+        name_key = (c.names[row].casefold(), int(c.ids[row]))
+
+        if self.key == 'cr':
+            return (float(c.cr[row]),) + name_key
+        if self.key == 'size':
+            size = c.sizes[c.size_code[row]]
+            return (self.size_rank.get(size, len(SIZE_ORDER)), size) + name_key
+        if self.key == 'type':
+            return (c.types[c.type_code[row]],) + name_key
+
+        return name_key
+
+
+class MonsterCatalog:
+    """Read-only, column-oriented copy of the monsters table
+
+    Row i of every column describes the same monster; rows are in the
+    same (name) order as the original /api/monsters query. The columns
+    are NumPy arrays and sequences of strings, either built in memory
+    (from_rows) or mapped from a catalog file (see catalog_file.py);
+    everything else is derived from them here.
+    """
+
+    def __init__(self, version, columns, updated_at=None):
+        """`columns` holds the arrays and lists built by build_columns()"""
+
+        self.version = version
+        self.updated_at = updated_at
+
+        self.types = columns['types']
+        self.sizes = columns['sizes']
+
+        self.ids = columns['ids']
+        self.cr = columns['cr']
+        self.xp = columns['xp']
+        self.type_code = columns['type_code']
+        self.size_code = columns['size_code']
+        self.legendary = columns['legendary']
+        self.by_id = columns['by_id']
+
+        # ids in ascending order, for looking up a monster's row by id
+        self.sorted_ids = self.ids[self.by_id]
+        self.id_range = np.iinfo(self.ids.dtype)
+
+        self.names = columns['names']
+
+        # each monster is serialized to JSON once, up front
+        self.json = columns['json']
+
+        self.all_bits = (1 << len(self.ids)) - 1
+        self.type_bits = [to_bits(self.type_code == i) for i in range(len(self.types))]
+        self.size_bits = [to_bits(self.size_code == i) for i in range(len(self.sizes))]
+        self.legendary_bits = to_bits(self.legendary)
+        self.ordinary_bits = self.all_bits & ~self.legendary_bits
+
+        # cr_prefix[k] holds every monster whose CR is below cr_values[k]
+        self.cr_values = sorted(set(self.cr.tolist()))
+        self.cr_prefix = [0]
+        for cr in self.cr_values:
+            self.cr_prefix.append(self.cr_prefix[-1] | to_bits(self.cr == cr))
+
+        self.order = {key: columns['order_' + key] for key in SORT_KEYS}
+        self.rank = {key: columns['rank_' + key] for key in SORT_KEYS}
+        self.keys = {key: SortKeys(self, key) for key in SORT_KEYS}
+
+        self._name_index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, version, rows, legendary_ids, updated_at=None):
+        """`rows` are (id, name, size, type, subtype, challenge_rating, xp)"""
+
+        return cls(version, build_columns(rows, legendary_ids), updated_at)
+
+    @classmethod
+    def load(cls, session=None):
+        """Read the catalog from the database"""
+
+        session = session or db.session
+        version, updated_at = CatalogVersion.latest(session)
+
+        rows = (session.query(Monster.id, Monster.name, Monster.size,
+                              Monster.type, Monster.subtype,
+                              Monster.challenge_rating, Monster.xp)
+                .order_by(Monster.name, Monster.id)
+                .all())
+
+        legendary_ids = {r[0] for r in
+                         session.query(LegendaryAction.monster_id).distinct()}
+
+        return cls.from_rows(version, rows, legendary_ids, updated_at)
+
+    @property
+    def name_index(self):
+        """Trigram index over the names, built on first search"""
+
+        if self._name_index is None:
+            self._name_index = TrigramIndex(self.names)
+
+        return self._name_index
+
+    def filter(self, min_cr=0, max_cr=30, type=None, size=None, status='both'):
+        """Return the rows matching the monster filter form, in name order"""
+
+        lo = bisect_left(self.cr_values, float(min_cr))
+        hi = bisect_right(self.cr_values, float(max_cr))
+
+        if lo >= hi:
+            return from_bits(0, len(self))
+
+        bits = self.cr_prefix[hi] ^ self.cr_prefix[lo]
+
+        if type:
+            bits &= (self.type_bits[self.types.index(type)]
+                     if type in self.types else 0)
+
+        if size:
+            bits &= (self.size_bits[self.sizes.index(size)]
+                     if size in self.sizes else 0)
+
+        if status == 'ordinary':
+            bits &= self.ordinary_bits
+        elif status == 'legendary':
+            bits &= self.legendary_bits
+        # else status == 'both' and no filtering is required
+
+        return from_bits(bits, len(self))
+
+    def search(self, rows, text):
+        """Rank the names at `rows` against `text` (see trigrams.py)
+
+        Returns the matching rows and their relevance scores.
+        """
+
+        return self.name_index.search(text, rows)
+
+    def page(self, rows, sort='name', after=None, limit=None):
+        """Order `rows` by `sort` and return one keyset page of them.
+
+        `sort` is one of SORT_KEYS, prefixed with "-" for descending order.
+        `after` is the cursor returned with the previous page. Returns the
+        rows of this page and the cursor for the next one (None when this
+        is the last page).
+        """
+
+        key = sort.lstrip('-')
+        descending = sort.startswith('-')
+
+        if key not in SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)}")
+
+        selected = np.zeros(len(self), dtype=bool)
+        selected[self.rank[key][rows]] = True
+
+        if after is not None:
+            keys = self.keys[key]
+            if descending:
+                selected[bisect_left(keys, after):] = False
+            else:
+                selected[:bisect_right(keys, after)] = False
+
+        positions = np.flatnonzero(selected)
+        if descending:
+            positions = positions[::-1]
+
+        cursor = None
+        if limit is not None and len(positions) > limit:
+            positions = positions[:limit]
+            cursor = encode_cursor(self.keys[key][positions[-1]])
+
+        return self.order[key][positions], cursor
+
+    def page_ranked(self, rows, scores, after=None, limit=None):
+        """Like page(), but ordered by search relevance, then name"""
+
+        name_keys = self.keys['name']
+        name_rank = self.rank['name']
+
+        ranked = sorted((int(score),) + name_keys[name_rank[row]] + (int(row),)
+                        for row, score in zip(rows, scores))
+
+        start = bisect_right(ranked, after + (len(self),)) if after else 0
+        ranked = ranked[start:]
+
+        cursor = None
+        if limit is not None and len(ranked) > limit:
+            ranked = ranked[:limit]
+            cursor = encode_cursor(ranked[-1][:-1])
+
+        return np.array([r[-1] for r in ranked], dtype=np.intp), cursor
+
+    def to_json(self, rows):
+        """JSON array of serialized monsters for the given rows"""
+
+        return "[" + ", ".join(self.json[i] for i in rows) + "]"
+
+    def row(self, monster_id):
+        """The row holding a monster, or None if it isn't in the catalog"""
+
+        if (monster_id is None
+                or not self.id_range.min <= monster_id <= self.id_range.max):
+            return None
+
+        # searching with a scalar of the array's own type, so numpy
+        # doesn't convert the whole array to int64 first
+        key = self.sorted_ids.dtype.type(monster_id)
+        pos = int(self.sorted_ids.searchsorted(key))
+        if pos == len(self) or self.sorted_ids[pos] != key:
+            return None
+
+        return int(self.by_id[pos])
+
+    def lookup(self, monster_id):
+        """Current name, CR and XP of a monster, or None if it isn't in the catalog"""
+
+        i = self.row(monster_id)
+        if i is None:
+            return None
+
+        return {'name': self.names[i], 'cr': format_cr(self.cr[i]),
+                'xp': int(self.xp[i])}
+
+    def candidates(self, rows):
+        """(id, name, cr, xp) tuples for the encounter builder"""
+
+        return [(int(self.ids[i]), self.names[i], format_cr(self.cr[i]),
+                 int(self.xp[i])) for i in rows]
+
+
+class CatalogStore:
+    """Holds the current MonsterCatalog for one app
+
+    The database version is checked at most every CATALOG_CHECK_INTERVAL
+    seconds; commits made by this process invalidate the copy at once.
+    Both the check and the load read from the primary, never the replica,
+    so the copy is shared by every request whichever bind it reads from.
+    If CATALOG_FILE is set, the catalog is mapped from that file, and the
+    first worker to find it missing or stale rewrites it from the database.
+    """
+
+    def __init__(self, app):
+        self.interval = app.config.setdefault('CATALOG_CHECK_INTERVAL', 5)
+        self.path = app.config.setdefault('CATALOG_FILE', None)
+        self.catalog = None
+        self.checked = 0
+        self.lock = threading.Lock()
+
+        app.extensions['catalog'] = self
+        _stores.add(self)
+
+    def get(self):
+        """Return an up-to-date catalog, reloading it if needed"""
+
+        now = time.monotonic()
+        catalog = self.catalog
+
+        if catalog is not None and now - self.checked < self.interval:
+            return catalog
+
+        with self.lock:
+            if self.catalog is not None and now - self.checked < self.interval:
+                return self.catalog
+
+            with Session(db.get_engine()) as session:
+                version = CatalogVersion.current(session)
+                if self.catalog is None or version != self.catalog.version:
+                    self.catalog = self.load(version, session)
+
+            self.checked = now
+            return self.catalog
+
+    def load(self, version, session):
+        """Map the catalog file if it holds `version`, else rebuild it"""
+
+        if self.path is None:
+            return MonsterCatalog.load(session)
+
+        try:
+            catalog = MonsterCatalog(*read_catalog_file(self.path))
+            if catalog.version == version:
+                return catalog
+        except (OSError, CatalogFileError):
+            pass
+
+        write_catalog_file(MonsterCatalog.load(session), self.path)
+        return MonsterCatalog(*read_catalog_file(self.path))
+
+    def invalidate(self):
+        """Force the next get() to go back to the database"""
+
+        self.catalog = None
+
+
+def get_catalog():
+    """Return the monster catalog for the current app"""
+
+    return current_app.extensions['catalog'].get()
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_after_commit(session):
+    """Drop this process's catalogs as soon as it commits a catalog change"""
+
+    if session.info.pop('catalog_changed', False):
+        for store in list(_stores):
+            store.invalidate()
+
+
+@event.listens_for(db.session, "after_rollback")
+def forget_rolled_back_change(session):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,197 @@
+"""
+    Binary, memory-mapped catalog file.
+
+    With several gunicorn workers, each would otherwise hold its own copy
+    of the catalog columns. Instead one worker writes them to a file and
+    every worker maps it read-only, so the OS page cache holds a single
+    shared copy.
+
+    Layout: an 8-byte magic string, a little-endian uint32 header length
+    and 4 bytes of padding, then a JSON header describing the sections
+    that follow it. Numeric columns are stored as fixed-width arrays;
+    string columns (names, pre-serialized JSON) as an array of uint64
+    offsets into a UTF-8 string table. Every section starts on an 8-byte
+    boundary so it can be viewed in place with NumPy.
+
+    A new version is written to a temporary file and renamed over the
+    old one; workers still using the old file keep their mapping until
+    they let it go.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"CKCATLG\x00"
+FORMAT_VERSION = 1
+
+ARRAYS = ('ids', 'cr', 'xp', 'type_code', 'size_code', 'legendary', 'by_id')
+STRINGS = ('names', 'json')
+
+
+class CatalogFileError(ValueError):
+    """The file is not a catalog file this code can read"""
+
+
+class StringColumn:
+    """Read-only sequence of strings stored in a mapped string table"""
+
+    def __init__(self, buffer, offsets, start):
+        self.buffer = buffer
+        self.offsets = offsets
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string column index out of range")
+
+        lo = self.start + int(self.offsets[i])
+        hi = self.start + int(self.offsets[i + 1])
+        return self.buffer[lo:hi].decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def _column(catalog, name):
+    """The array stored in section `name`"""
+
+    if name.startswith(('order_', 'rank_')):
+        kind, key = name.split('_', 1)
+        return getattr(catalog, kind)[key]
+
+    if name == 'legendary':
+        return catalog.legendary.astype(np.uint8)
+
+    return getattr(catalog, name)
+
+
+def write_catalog_file(catalog, path):
+    """Write a MonsterCatalog to path, atomically replacing any old file"""
+
+    arrays = list(ARRAYS) + [f"{kind}_{key}" for key in catalog.order
+                             for kind in ('order', 'rank')]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            sections = {'arrays': {}, 'strings': {}}
+            blobs = []
+
+            # lay the sections out first, so the header can describe them
+            offset = 0
+            for name in arrays:
+                data = np.ascontiguousarray(_column(catalog, name))
+                sections['arrays'][name] = [offset, data.dtype.str, len(data)]
+                blobs.append(data.tobytes())
+                offset += len(blobs[-1]) + (-len(blobs[-1]) % 8)
+
+            for name in STRINGS:
+                encoded = [s.encode("utf-8") for s in getattr(catalog, name)]
+                offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+                offsets[1:] = np.cumsum([len(e) for e in encoded])
+
+                sections['strings'][name] = [offset, offset + offsets.nbytes]
+                blobs.append(offsets.tobytes())
+                blobs.append(b"".join(encoded))
+                offset += offsets.nbytes + int(offsets[-1]) + (-int(offsets[-1]) % 8)
+
+            header = json.dumps({
+                'format_version': FORMAT_VERSION,
+                'version': catalog.version,
+                'updated_at': (catalog.updated_at.isoformat()
+                               if catalog.updated_at else None),
+                'types': catalog.types,
+                'sizes': catalog.sizes,
+                'sections': sections,
+            }).encode("utf-8")
+
+            # section offsets are relative to the first 8-byte boundary
+            # after the header
+            f.write(MAGIC + struct.pack("<I", len(header)) + b"\0" * 4 + header)
+            _pad(f)
+
+            for blob in blobs:
+                f.write(blob)
+                _pad(f)
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp, path)
+
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def read_catalog_file(path):
+    """Map a catalog file read-only
+
+    Returns (version, columns, updated_at), where the columns are NumPy
+    views and StringColumns over the mapping, ready for MonsterCatalog.
+    """
+
+    with open(path, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CatalogFileError("empty catalog file")
+
+    if buffer[:len(MAGIC)] != MAGIC:
+        raise CatalogFileError("not a catalog file")
+
+    (length,) = struct.unpack_from("<I", buffer, len(MAGIC))
+    start = len(MAGIC) + 8
+
+    try:
+        header = json.loads(buffer[start:start + length])
+    except ValueError:
+        raise CatalogFileError("corrupt catalog file header")
+
+    if header.get('format_version') != FORMAT_VERSION:
+        raise CatalogFileError(
+            f"catalog file format {header.get('format_version')} is not supported")
+
+    base = start + length + (-(start + length) % 8)
+    sections = header['sections']
+
+    columns = {'types': header['types'], 'sizes': header['sizes']}
+
+    for name, (offset, dtype, count) in sections['arrays'].items():
+        columns[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                      offset=base + offset)
+
+    columns['legendary'] = columns['legendary'].view(bool)
+
+    for name, (offsets_at, data_at) in sections['strings'].items():
+        offsets = np.frombuffer(buffer, dtype="<u8", count=len(columns['ids']) + 1,
+                                offset=base + offsets_at)
+        columns[name] = StringColumn(buffer, offsets, base + data_at)
+
+    updated_at = header['updated_at']
+    if updated_at is not None:
+        updated_at = datetime.fromisoformat(updated_at)
+
+    return header['version'], columns, updated_at
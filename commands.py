@@ -0,0 +1,188 @@
+"""
+    Command line tools, available through `flask <group> <command>`.
+"""
+
+from collections import Counter
+
+import click
+from sqlalchemy import exists
+from flask.cli import AppGroup
+
+from models import (db, Encounter, EncounterHero, EncounterMonster,
+                    ENCOUNTER_DDL, parse_list, upgrade_schema)
+from difficulty import evaluate, rate
+from snapshot import SnapshotError, export_snapshot, import_snapshot
+
+encounters_cli = AppGroup('encounters', help="Work with saved encounters.")
+catalog_cli = AppGroup('catalog', help="Export and import the monster catalog.")
+
+
+@encounters_cli.command('rate')
+@click.option('--batch-size', default=1000, show_default=True,
+              help="Number of encounters rated per NumPy batch.")
+@click.option('--quiet', is_flag=True,
+              help="Only print the totals for each difficulty.")
+def rate_encounters(batch_size, quiet):
+    """Rate every stored encounter in bulk"""
+
+    query = (db.session.query(Encounter.id, Encounter.heroes, Encounter.monsters)
+             .order_by(Encounter.id)
+             .yield_per(batch_size))
+
+    totals = Counter()
+    batch = []
+
+    def flush():
+        try:
+            ratings = evaluate((heroes, monsters) for _, heroes, monsters in batch)
+            results = zip(ratings['adjusted_xp'], ratings['difficulty'])
+        except (AttributeError, TypeError, ValueError):
+            # one unreadable encounter fails the whole batch; rate this
+            # batch one at a time so only the bad ones go unrated
+            results = [rate_or_none(heroes, monsters) for _, heroes, monsters in batch]
+
+        for (enc_id, _, _), (adjusted, difficulty) in zip(batch, results):
+            if difficulty is None:
+                totals['UNRATED'] += 1
+                if not quiet:
+                    click.echo(f"{enc_id}\tUNRATED")
+                continue
+
+            totals[difficulty] += 1
+            if not quiet:
+                click.echo(f"{enc_id}\t{difficulty}\t{adjusted:g}")
+        batch.clear()
+
+    for row in query:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            flush()
+
+    if batch:
+        flush()
+
+    click.echo(", ".join(f"{k}: {v}" for k, v in sorted(totals.items()))
+               or "No encounters found.")
+
+
+def rate_or_none(heroes, monsters):
+    """(adjusted XP, difficulty) of one stored encounter, or Nones if it can't be read"""
+
+    try:
+        rating = rate(heroes, monsters)
+    except (AttributeError, TypeError, ValueError):
+        return None, None
+
+    return rating['adjusted_xp'], rating['difficulty']
+
+
+@encounters_cli.command('backfill')
+@click.option('--batch-size', default=1000, show_default=True,
+              help="Number of encounters updated per transaction.")
+@click.option('--all', 'everything', is_flag=True,
+              help="Recompute every encounter, not just those missing a summary.")
+def backfill_summaries(batch_size, everything):
+    """Fill in the precomputed summary columns of stored encounters
+
+    Adds the columns (and their index) first if the database predates them.
+    """
+
+    upgrade_schema(db.session, ENCOUNTER_DDL)
+    db.session.commit()
+
+    updated = 0
+    last_id = 0
+
+    while True:
+        query = (db.session.query(Encounter.id, Encounter.heroes, Encounter.monsters)
+                 .filter(Encounter.id > last_id))
+        if not everything:
+            query = query.filter(Encounter.summary.is_(None))
+
+        batch = query.order_by(Encounter.id).limit(batch_size).all()
+        if not batch:
+            break
+
+        # bulk mappings skip the per-object save hooks; the values are
+        # computed here instead
+        db.session.bulk_update_mappings(Encounter, [
+            dict(Encounter.summary_columns(heroes, monsters), id=enc_id)
+            for enc_id, heroes, monsters in batch
+        ])
+        db.session.commit()
+
+        updated += len(batch)
+        last_id = batch[-1][0]
+
+    click.echo(f"Updated {updated} encounters.")
+
+
+@encounters_cli.command('migrate')
+@click.option('--batch-size', default=1000, show_default=True,
+              help="Number of encounters migrated per transaction.")
+def migrate_groups(batch_size):
+    """Copy stored hero and monster lists into encounter_heroes/encounter_monsters
+
+    Safe to run while the app is serving: new saves already write both
+    forms, each batch is its own short transaction, and encounters that
+    already have groups are skipped.
+    """
+
+    migrated = 0
+    last_id = 0
+
+    unmigrated = ~exists().where(EncounterHero.encounter_id == Encounter.id) \
+        & ~exists().where(EncounterMonster.encounter_id == Encounter.id)
+
+    while True:
+        batch = (db.session.query(Encounter.id, Encounter.heroes, Encounter.monsters)
+                 .filter(Encounter.id > last_id, unmigrated)
+                 .order_by(Encounter.id)
+                 .limit(batch_size)
+                 .all())
+        if not batch:
+            break
+
+        heroes, monsters = [], []
+        for enc_id, hero_json, monster_json in batch:
+            heroes.extend(dict(EncounterHero.values(h), encounter_id=enc_id, position=i)
+                          for i, h in enumerate(parse_list(hero_json)))
+            monsters.extend(dict(EncounterMonster.values(m), encounter_id=enc_id, position=i)
+                            for i, m in enumerate(parse_list(monster_json)))
+
+        if heroes:
+            db.session.execute(EncounterHero.__table__.insert(), heroes)
+        if monsters:
+            db.session.execute(EncounterMonster.__table__.insert(), monsters)
+        db.session.commit()
+
+        migrated += len(batch)
+        last_id = batch[-1][0]
+
+    click.echo(f"Migrated {migrated} encounters.")
+
+
+@catalog_cli.command('export')
+@click.argument('path', default='catalog.ndjson.gz')
+def export_catalog(path):
+    """Write the monster catalog to a gzipped NDJSON snapshot"""
+
+    count = export_snapshot(path)
+    click.echo(f"Exported {count} monsters to {path}.")
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--replace', is_flag=True,
+              help="Replace the current catalog instead of requiring an empty one.")
+@click.option('--batch-size', default=5000, show_default=True,
+              help="Number of monsters loaded per COPY.")
+def import_catalog(path, replace, batch_size):
+    """Load a catalog snapshot written by `flask catalog export`"""
+
+    try:
+        count = import_snapshot(path, replace=replace, batch_size=batch_size)
+    except SnapshotError as err:
+        raise click.ClickException(str(err))
+
+    click.echo(f"Imported {count} monsters from {path}.")
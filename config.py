@@ -0,0 +1,123 @@
+"""
+    Configuration profiles for create_app().
+
+    APP_CONFIG picks one of `profiles` when create_app() isn't told which
+    to use; it defaults to production, the lean profile: no debug
+    toolbar, no statement logging, compiled templates cached on disk and
+    the catalog loaded before the first request.
+"""
+
+import os
+
+
+def database_url(default, name="DATABASE_URL"):
+    """A database URL from the environment, spelled the way SQLAlchemy wants"""
+
+    uri = os.environ.get(name, default)
+
+    if uri and uri.startswith("postgres://"):
+        uri = uri.replace("postgres://", "postgresql://", 1)
+
+    return uri
+
+
+class Config:
+    """Settings shared by every profile"""
+
+    SQLALCHEMY_DATABASE_URI = database_url('postgresql:///monsters')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # statement logging is far too noisy for production; per-request query
+    # stats come from instrumentation.py instead
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
+
+    # read-only copy of the database for catalog browsing, and how long
+    # a user who just saved something keeps reading from the primary
+    # (see routing.py)
+    REPLICA_DATABASE_URL = database_url(None, "REPLICA_DATABASE_URL")
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+    # connection pool for each worker process (see pooling.py)
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+
+    # milliseconds before Postgres cancels a statement (0: never)
+    DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 0))
+
+    # connect through PgBouncer in transaction pooling mode
+    DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER') == '1'
+
+    SECRET_KEY = os.environ.get(
+        "SECRET_KEY", "41ee5473cf593c326eacf023b409199c2e3a118f2e8051afbcdb9f7e4c48e406")
+
+    # upper bound on the size of a single /api/encounters/evaluate batch
+    EVALUATE_MAX_ENCOUNTERS = 10000
+
+    # how long browsers and proxies may reuse a catalog response unchecked;
+    # SOURCE_VERSION changes the ETags on deploy, since templates may change
+    CATALOG_MAX_AGE = 60
+    CATALOG_ETAG_SALT = os.environ.get('SOURCE_VERSION', '')[:12]
+
+    # memory-mapped catalog file shared by all workers (unset: one copy each)
+    CATALOG_FILE = os.environ.get('CATALOG_FILE')
+
+    # connections per process for the async catalog API (see asgi.py)
+    ASYNC_POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', 10))
+    ASYNC_POOL_MAX_OVERFLOW = int(os.environ.get('ASYNC_POOL_MAX_OVERFLOW', 10))
+
+    # number of rendered monster stat blocks kept by each worker
+    STAT_BLOCK_CACHE_SIZE = 512
+
+    # saved encounters shown per page of the user page
+    USER_PAGE_SIZE = 25
+
+    # limits for POST /users/<id>/encounters/bulk
+    BULK_MAX_ENCOUNTERS = 10000
+    BULK_BATCH_SIZE = 500
+
+    # bcrypt work factor; existing hashes are upgraded on login
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+
+    # hashes computed at once per process, and the most that may be
+    # running or waiting before logins are turned away (see passwords.py)
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+
+    # install Flask-DebugToolbar (only shown when debugging)
+    DEBUG_TOOLBAR = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # cache compiled templates in this directory (None: a per-user temp
+    # directory); off unless JINJA_BYTECODE_CACHE is set
+    JINJA_BYTECODE_CACHE = False
+    JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR')
+
+    # load the catalog and compile the templates inside create_app(); with
+    # gunicorn --preload that happens once, before the workers fork
+    WARM_UP = False
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+    DEBUG_TOOLBAR = True
+
+
+class TestConfig(Config):
+    TESTING = True
+    BCRYPT_LOG_ROUNDS = 4
+    SQLALCHEMY_DATABASE_URI = database_url('postgresql:///monsters-test')
+
+
+class ProductionConfig(Config):
+    JINJA_BYTECODE_CACHE = True
+    WARM_UP = os.environ.get('WARM_UP', '1') == '1'
+
+
+profiles = {
+    'development': DevelopmentConfig,
+    'test': TestConfig,
+    'production': ProductionConfig,
+}
@@ -0,0 +1,209 @@
+"""
+    Encounter difficulty calculations.
+
+    This is the server-side twin of the XP_TIERS / ENCOUNTER_MULTIPLIERS
+    math in static/encounter-panel.js. Encounters are flattened into NumPy
+    arrays so that any number of them can be rated with a handful of array
+    operations instead of a Python loop per encounter.
+"""
+
+import json
+
+import numpy as np
+
+# Lookup table of XP tiers.
+#   Rows represent player level (1-20).
+#   Columns represent challenge level: [easy, medium, hard, deadly]
+XP_TIERS = np.array([
+    [0, 0, 0, 0],
+    [25, 50, 75, 100],  # level 1
+    [50, 100, 150, 200],  # level 2
+    [75, 150, 225, 400],
+    [125, 250, 375, 500],
+    [250, 500, 750, 1100],
+    [300, 600, 900, 1400],
+    [350, 750, 1100, 1700],
+    [450, 900, 1400, 2100],
+    [550, 1100, 1600, 2400],
+    [600, 1200, 1900, 2800],
+    [800, 1600, 2400, 3600],
+    [1000, 2000, 3000, 4500],
+    [1100, 2200, 3400, 5100],
+    [1250, 2500, 3800, 5700],
+    [1400, 2800, 4300, 6400],
+    [1600, 3200, 4800, 7200],
+    [2000, 3900, 5900, 8800],
+    [2100, 4200, 6300, 9500],
+    [2400, 4900, 7300, 10900],
+    [2800, 5700, 8500, 12700]  # level 20
+], dtype=np.int64)
+
+MAX_LEVEL = len(XP_TIERS) - 1
+
+# Lookup table for encounter multipliers, indexed by number of monsters.
+#   Any encounter with 15 or more monsters uses the last entry.
+ENCOUNTER_MULTIPLIERS = np.array([
+    0,
+    1,                  # 1 monster
+    1.5,                # 2 monsters
+    2, 2, 2, 2,         # 3-6 monsters
+    2.5, 2.5, 2.5, 2.5,  # 7-10 monsters
+    3, 3, 3, 3,         # 11-14 monsters
+    4                   # 15 monsters or more
+])
+
+MAX_MULTIPLIER_INDEX = len(ENCOUNTER_MULTIPLIERS) - 1
+
+DIFFICULTIES = np.array(["NONE", "EASY", "MEDIUM", "HARD", "DEADLY"])
+
+# Largest head count and XP accepted for one group. Far beyond any real
+# encounter, and small enough that totals fit the int64 arrays here and
+# the integer columns encounters are stored in.
+MAX_NUM = 10_000
+MAX_XP = 1_000_000
+
+
+def parse_groups(groups):
+    """Accept a list of groups or the JSON string stored on an Encounter"""
+
+    if groups is None:
+        return []
+
+    if isinstance(groups, (str, bytes)):
+        groups = json.loads(groups) if groups else []
+
+    if not isinstance(groups, list):
+        raise ValueError("groups must be a list")
+
+    return groups
+
+
+def _to_int(value, name, high):
+    """Coerce a (possibly string) count from the client to an int"""
+
+    try:
+        result = int(value)
+    except (OverflowError, TypeError, ValueError):
+        raise ValueError(f"'{name}' must be an integer")
+
+    if result < 0:
+        raise ValueError(f"'{name}' must not be negative")
+
+    if result > high:
+        raise ValueError(f"'{name}' must be at most {high}")
+
+    return result
+
+
+def flatten(encounters):
+    """Flatten a list of (heroes, monsters) pairs into parallel arrays.
+
+    Every hero group and monster group becomes one element in the
+    returned arrays, tagged with the index of the encounter it belongs to.
+    """
+
+    h_enc, h_num, h_lvl = [], [], []
+    m_enc, m_num, m_xp = [], [], []
+
+    for i, (heroes, monsters) in enumerate(encounters):
+        for h in parse_groups(heroes):
+            h_enc.append(i)
+            h_num.append(_to_int(h.get('num'), 'num', MAX_NUM))
+            h_lvl.append(_to_int(h.get('lvl'), 'lvl', MAX_LEVEL))
+
+        for m in parse_groups(monsters):
+            m_enc.append(i)
+            m_num.append(_to_int(m.get('num'), 'num', MAX_NUM))
+            m_xp.append(_to_int(m.get('xp'), 'xp', MAX_XP))
+
+    return (
+        np.array(h_enc, dtype=np.int64),
+        np.array(h_num, dtype=np.int64),
+        np.array(h_lvl, dtype=np.int64),
+        np.array(m_enc, dtype=np.int64),
+        np.array(m_num, dtype=np.int64),
+        np.array(m_xp, dtype=np.int64),
+    )
+
+
+def multiplier(num_monsters):
+    """Encounter multiplier for a monster count (scalar or array)"""
+
+    return ENCOUNTER_MULTIPLIERS[np.minimum(num_monsters, MAX_MULTIPLIER_INDEX)]
+
+
+def evaluate(encounters):
+    """Rate a batch of encounters.
+
+    `encounters` is a sequence of (heroes, monsters) pairs, where each side
+    is a list of groups (or a JSON string of one) in the same shape the
+    encounter panel stores: heroes as {"num", "lvl"} and monsters as
+    {"xp", "num", ...}.
+
+    Returns a dictionary of NumPy arrays, one entry per encounter.
+    """
+
+    encounters = list(encounters)
+    n = len(encounters)
+
+    h_enc, h_num, h_lvl, m_enc, m_num, m_xp = flatten(encounters)
+
+    # XP goals [easy, medium, hard, deadly] summed over each party
+    thresholds = np.zeros((n, 4), dtype=np.int64)
+    np.add.at(thresholds, h_enc, h_num[:, None] * XP_TIERS[h_lvl])
+
+    hero_groups = np.bincount(h_enc, minlength=n)
+    num_heroes = np.bincount(h_enc, weights=h_num, minlength=n).astype(np.int64)
+
+    num_monsters = np.bincount(m_enc, weights=m_num, minlength=n).astype(np.int64)
+    total_xp = np.bincount(
+        m_enc, weights=m_num * m_xp, minlength=n).astype(np.int64)
+
+    adjusted_xp = total_xp * multiplier(num_monsters)
+
+    # EASY below the medium goal, then one step up for each goal reached
+    level = 1 + (adjusted_xp[:, None] >= thresholds[:, 1:]).sum(axis=1)
+    level[(adjusted_xp == 0) | (hero_groups == 0)] = 0
+
+    return {
+        'thresholds': thresholds,
+        'num_heroes': num_heroes,
+        'num_monsters': num_monsters,
+        'total_xp': total_xp,
+        'adjusted_xp': adjusted_xp,
+        'difficulty': DIFFICULTIES[level],
+    }
+
+
+def to_records(ratings):
+    """Turn the arrays returned by evaluate() into JSON-friendly dictionaries"""
+
+    thresholds = ratings['thresholds'].tolist()
+
+    return [
+        {
+            'easy': t[0],
+            'medium': t[1],
+            'hard': t[2],
+            'deadly': t[3],
+            'num_heroes': heroes,
+            'num_monsters': monsters,
+            'total_xp': total,
+            'adjusted_xp': adjusted,
+            'difficulty': difficulty,
+        }
+        for t, heroes, monsters, total, adjusted, difficulty in zip(
+            thresholds,
+            ratings['num_heroes'].tolist(),
+            ratings['num_monsters'].tolist(),
+            ratings['total_xp'].tolist(),
+            ratings['adjusted_xp'].tolist(),
+            ratings['difficulty'].tolist(),
+        )
+    ]
+
+
+def rate(heroes, monsters):
+    """Rate a single encounter"""
+
+    return to_records(evaluate([(heroes, monsters)]))[0]
@@ -0,0 +1,178 @@
+"""
+    Concurrent fetching of the dnd5eapi monster catalog, for seed.py.
+
+    Requests go through one keep-alive requests.Session shared by a small
+    thread pool. Responses are cached on disk by URL together with their
+    ETag, and later runs send If-None-Match, so a reseed only downloads
+    what changed. A checkpoint file records which monsters have been
+    stored, so an interrupted seed can resume where it stopped.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+BASE_API_URL = "https://www.dnd5eapi.co/api"
+
+
+class ResponseCache:
+    """JSON responses on disk, one file per URL, with their ETags"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory,
+                            hashlib.sha256(url.encode()).hexdigest() + ".json")
+
+    def get(self, url):
+        """Return (etag, body) for url, or (None, None)"""
+
+        try:
+            with open(self.path(url)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+
+        return entry.get('etag'), entry.get('body')
+
+    def put(self, url, etag, body):
+        """Store a response; written to a temporary file and renamed into place"""
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({'url': url, 'etag': etag, 'body': body}, f)
+
+        os.replace(tmp, self.path(url))
+
+
+class Checkpoint:
+    """Append-only record of the monster indexes already stored"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+        try:
+            with open(path) as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            self.done = set()
+
+    def __contains__(self, index):
+        return index in self.done
+
+    def add(self, index):
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(index + "\n")
+            self.done.add(index)
+
+    def clear(self):
+        with self.lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.done.clear()
+
+
+class Fetcher:
+    """Fetch dnd5eapi resources concurrently through a pooled session"""
+
+    def __init__(self, base_url=BASE_API_URL, cache_dir=None, workers=8,
+                 timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.cache = ResponseCache(cache_dir) if cache_dir else None
+        self.workers = workers
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers,
+                              max_retries=Retry(total=3, backoff_factor=0.5,
+                                                status_forcelist=(429, 502, 503, 504)))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'downloaded': 0, 'not_modified': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def get_json(self, path, params=None):
+        """GET a JSON resource, revalidating any cached copy with its ETag"""
+
+        url = requests.Request("GET", self.base_url + path, params=params).prepare().url
+
+        etag, body = self.cache.get(url) if self.cache else (None, None)
+        headers = {'If-None-Match': etag} if etag and body is not None else {}
+
+        resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        self.count('requests')
+
+        if resp.status_code == 304:
+            self.count('not_modified')
+            return body
+
+        resp.raise_for_status()
+        self.count('downloaded')
+
+        body = resp.json()
+        if self.cache and resp.headers.get('ETag'):
+            self.cache.put(url, resp.headers['ETag'], body)
+
+        return body
+
+    def monster_indexes(self, challenge_ratings):
+        """Indexes of every monster with one of the given challenge ratings"""
+
+        def list_cr(cr):
+            resp = self.get_json("/monsters", {"challenge_rating": f"{cr}"})
+            return [m['index'] for m in resp.get('results', [])]
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            return [index for indexes in pool.map(list_cr, challenge_ratings)
+                    for index in indexes]
+
+    def monster(self, index):
+        """One monster's details, or None if the API doesn't know it"""
+
+        try:
+            resp = self.get_json(f"/monsters/{index}")
+        except requests.HTTPError as err:
+            if err.response.status_code == 404:
+                return None
+            raise
+
+        if 'error' in resp:
+            return None
+
+        return resp
+
+    def monsters(self, indexes):
+        """Yield (index, details) for each monster, fetching `workers` at once
+
+        Results come back in the order of `indexes`; only a few responses
+        per worker are held in memory at a time.
+        """
+
+        with ThreadPoolExecutor(self.workers) as pool:
+            pending = deque()
+            for index in indexes:
+                pending.append((index, pool.submit(self.monster, index)))
+
+                if len(pending) >= self.workers * 4:
+                    index, future = pending.popleft()
+                    yield index, future.result()
+
+            for index, future in pending:
+                yield index, future.result()
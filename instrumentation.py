@@ -0,0 +1,208 @@
+"""
+    Per-request SQL instrumentation.
+
+    SQLAlchemy engine events record every statement a request runs: how
+    many, how long they took in total, and how often each statement shape
+    (its "fingerprint") repeats. Repeats beyond a threshold are reported
+    as likely N+1 patterns, slow statements get their EXPLAIN captured,
+    and views can declare a query budget with @query_budget.
+
+    Configuration:
+        SQL_N_PLUS_ONE_THRESHOLD  repeats of one fingerprint to flag (5)
+        SQL_SLOW_QUERY_MS         statements slower than this are EXPLAINed (250)
+        SQL_BUDGET_STRICT         raise QueryBudgetExceeded instead of logging
+        SQL_STATS_HEADERS         add X-Query-Count / X-Query-Time headers
+"""
+
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(Exception):
+    """A view ran more SQL statements than its declared budget"""
+
+
+def query_budget(max_queries):
+    """Declare the most SQL statements a view may run per request"""
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+def fingerprint(statement):
+    """Reduce a statement to its shape, so repeats can be counted"""
+
+    statement = re.sub(r"'(?:[^']|'')*'", "?", statement)
+    statement = re.sub(r"\b\d+\b", "?", statement)
+    return " ".join(statement.split())
+
+
+class QueryStats:
+    """Statements run while handling one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.slow = []
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def repeated(self, threshold):
+        """Fingerprints run at least `threshold` times (likely N+1 loads)"""
+
+        return {f: n for f, n in self.fingerprints.items() if n >= threshold}
+
+
+class EndpointTotals:
+    """Running totals per endpoint for this worker, for /_stats"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = defaultdict(lambda: {
+            'requests': 0, 'queries': 0, 'db_ms': 0.0,
+            'max_queries': 0, 'n_plus_one': 0, 'over_budget': 0})
+
+    def add(self, endpoint, stats, flagged, over_budget):
+        with self.lock:
+            t = self.totals[endpoint]
+            t['requests'] += 1
+            t['queries'] += stats.count
+            t['db_ms'] += stats.duration * 1000
+            t['max_queries'] = max(t['max_queries'], stats.count)
+            t['n_plus_one'] += bool(flagged)
+            t['over_budget'] += over_budget
+
+    def snapshot(self):
+        with self.lock:
+            return {e: dict(t, db_ms=round(t['db_ms'], 2))
+                    for e, t in self.totals.items()}
+
+
+def current_stats():
+    """QueryStats for the request being handled, if any"""
+
+    if has_request_context():
+        return g.get('_query_stats')
+
+    return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - context._query_start
+
+    stats = current_stats()
+    if stats is None:
+        return
+
+    stats.record(statement, duration)
+
+    slow_ms = current_app.config['SQL_SLOW_QUERY_MS']
+    if slow_ms is not None and duration * 1000 >= slow_ms and not executemany:
+        stats.slow.append({
+            'statement': statement,
+            'ms': round(duration * 1000, 2),
+            'plan': explain(conn, cursor, statement, parameters),
+        })
+
+
+def explain(conn, cursor, statement, parameters):
+    """Capture the plan of a slow SELECT, without disturbing the transaction"""
+
+    if not statement.lstrip().upper().startswith("SELECT"):
+        return None
+
+    dialect = conn.dialect.name
+    if dialect not in ("postgresql", "sqlite"):
+        return None
+
+    prefix = "EXPLAIN QUERY PLAN " if dialect == "sqlite" else "EXPLAIN "
+
+    # a raw DBAPI cursor keeps this statement out of the stats; the
+    # savepoint keeps a failed EXPLAIN from aborting the transaction
+    raw = cursor.connection.cursor()
+    try:
+        if dialect == "postgresql":
+            raw.execute("SAVEPOINT explain_slow_query")
+        try:
+            raw.execute(prefix + statement, parameters)
+            plan = [" ".join(str(col) for col in row) for row in raw.fetchall()]
+        except Exception as err:
+            plan = [f"EXPLAIN failed: {err}"]
+            if dialect == "postgresql":
+                raw.execute("ROLLBACK TO SAVEPOINT explain_slow_query")
+        if dialect == "postgresql":
+            raw.execute("RELEASE SAVEPOINT explain_slow_query")
+    finally:
+        raw.close()
+
+    return plan
+
+
+def init_instrumentation(app):
+    """Start recording the SQL each request runs"""
+
+    app.config.setdefault('SQL_N_PLUS_ONE_THRESHOLD', 5)
+    app.config.setdefault('SQL_SLOW_QUERY_MS', 250)
+    app.config.setdefault('SQL_BUDGET_STRICT', False)
+    app.config.setdefault('SQL_STATS_HEADERS', False)
+
+    totals = EndpointTotals()
+    app.extensions['query_totals'] = totals
+
+    @app.before_request
+    def start_query_stats():
+        g._query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('_query_stats', None)
+        if stats is None:
+            return response
+
+        endpoint = request.endpoint or request.path
+        view = app.view_functions.get(request.endpoint)
+        budget = getattr(view, 'query_budget', None)
+
+        flagged = stats.repeated(app.config['SQL_N_PLUS_ONE_THRESHOLD'])
+        over_budget = budget is not None and stats.count > budget
+
+        totals.add(endpoint, stats, flagged, over_budget)
+
+        for f, n in flagged.items():
+            app.logger.warning("Possible N+1 in %s: %d x %s", endpoint, n, f)
+
+        for slow in stats.slow:
+            app.logger.warning("Slow query in %s (%s ms): %s\n%s", endpoint,
+                               slow['ms'], slow['statement'],
+                               "\n".join(slow['plan'] or []))
+
+        if over_budget:
+            msg = f"{endpoint} ran {stats.count} queries; its budget is {budget}"
+            if app.config['SQL_BUDGET_STRICT']:
+                raise QueryBudgetExceeded(msg)
+            app.logger.warning(msg)
+
+        if app.config['SQL_STATS_HEADERS']:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time'] = f"{stats.duration * 1000:.2f}ms"
+
+        return response
@@ -0,0 +1,280 @@
+"""
+    Batched loading of monsters into the database, for seed.py.
+
+    Parsed API responses are collected into batches. Each batch is written
+    with one multi-row INSERT ... RETURNING for the monsters and one
+    multi-row insert each for their special abilities, actions and
+    legendary actions, then committed, so loading is bound by the
+    database rather than by round trips.
+
+    MonsterSync brings an existing catalog up to date instead: monsters
+    are matched by API index and compared by content hash, and only new,
+    changed and vanished monsters are written.
+"""
+
+import hashlib
+import json
+from collections import Counter, defaultdict
+
+from sqlalchemy import bindparam, delete, insert, update
+
+from models import (db, Monster, SpecialAbility, Action, LegendaryAction,
+                    CatalogVersion)
+
+MONSTER_COLUMNS = [c.name for c in Monster.__table__.columns
+                   if c.name not in ('id', 'content_hash')]
+
+CHILD_TABLES = (SpecialAbility.__table__, Action.__table__,
+                LegendaryAction.__table__)
+
+
+def parse_usage(usage):
+    """Parse the 'usage' property for actions and special abilities
+
+    According to the API, the format of usage is:
+        {'type': 'recharge on roll', 'dice': '1d6', 'min_value': 5}
+
+    Where 'type' is one of:
+        'at will', 'per day', 'recharge after rest', 'recharge on roll'
+    """
+
+    type = usage['type']
+
+    if type == 'per day':
+        response = f'({usage["times"]}/Day)'
+
+    elif type == 'recharge after rest':
+        if len(usage['rest_types']) == 2:
+            rest = "Short or Long"
+        else:
+            rest = usage['rest_types'][0].title()
+
+        response = f"(Recharges after a {rest} Rest)"
+
+    elif type == 'recharge on roll':
+        dice = '6' if usage["min_value"] == 6 else f'{usage["min_value"]}-6'
+        response = f'(Recharge {dice})'
+
+    else:
+        response = None
+
+    return response
+
+
+def parse_monster(resp):
+    """Split an API response into a monsters row and its child rows
+
+    Returns (row, special_abilities, actions, legendary_actions); the
+    child rows lack their monster_id until the monster is inserted. The
+    row's content_hash covers the row and all of its children.
+    """
+
+    row = {c: resp.get(c) for c in MONSTER_COLUMNS}
+
+    def abilities(entries, with_usage=True):
+        rows = []
+        for e in entries or []:
+            r = {'name': e['name'], 'desc': e['desc']}
+            if with_usage:
+                r['usage'] = parse_usage(e['usage']) if 'usage' in e else None
+            rows.append(r)
+        return rows
+
+    parsed = (row,
+              abilities(resp.get('special_abilities')),
+              abilities(resp.get('actions')),
+              abilities(resp.get('legendary_actions'), with_usage=False))
+
+    row['content_hash'] = hashlib.sha256(
+        json.dumps(parsed, sort_keys=True).encode()).hexdigest()
+
+    return parsed
+
+
+class MonsterLoader:
+    """Collects monsters and writes them `batch_size` at a time
+
+    Every monster is added under a key (its API index); add() and flush()
+    return the keys whose monsters have just been committed, so callers
+    can checkpoint them, and `ids` maps each loaded key to its monster id.
+    """
+
+    def __init__(self, batch_size=500, session=None):
+        self.batch_size = batch_size
+        self.session = session or db.session
+        self.pending = []
+        self.ids = {}
+
+    def add(self, key, resp):
+        """Queue a monster's API response (None to just record the key)"""
+
+        self.pending.append((key, parse_monster(resp) if resp else None))
+
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+
+        return []
+
+    def flush(self):
+        """Write and commit everything queued; return the committed keys"""
+
+        keys = [key for key, _ in self.pending]
+        loading = [(key, p) for key, p in self.pending if p is not None]
+        parsed = [p for _, p in loading]
+        self.pending = []
+
+        if parsed:
+            ids = self.insert_monsters([p[0] for p in parsed])
+            self.insert_children(ids, parsed)
+
+            # Core inserts bypass the flush hook that bumps the version
+            CatalogVersion.bump(self.session)
+
+        self.session.commit()
+
+        if parsed:
+            self.ids.update(zip((key for key, _ in loading), ids))
+
+        return keys
+
+    def insert_monsters(self, rows):
+        """Insert monster rows and return their new ids, in order"""
+
+        if self.session.connection().dialect.name == "postgresql":
+            # Postgres returns the ids of a multi-row VALUES in order
+            stmt = insert(Monster.__table__).values(rows).returning(Monster.id)
+            return [row[0] for row in self.session.execute(stmt)]
+
+        return [self.session.execute(insert(Monster.__table__).values(row))
+                .inserted_primary_key[0] for row in rows]
+
+    def insert_children(self, ids, parsed):
+        """Insert the abilities and actions of monsters that now have ids"""
+
+        for position, table in enumerate(CHILD_TABLES, 1):
+            rows = [dict(child, monster_id=monster_id)
+                    for monster_id, p in zip(ids, parsed)
+                    for child in p[position]]
+            if rows:
+                self.session.execute(insert(table), rows)
+
+
+class MonsterSync(MonsterLoader):
+    """Update the catalog in place from a full listing of the API
+
+    add() every monster the API lists (None for ones it couldn't
+    return), then call finish(). Monsters whose content hash matches
+    are left alone, changed ones are updated in place and keep their
+    ids, and ones missing from the listing are deleted. The catalog
+    version only moves if something was written. `stats` counts
+    monsters added, updated, unchanged and deleted.
+    """
+
+    def __init__(self, batch_size=500, session=None):
+        super().__init__(batch_size, session)
+
+        self.known = {}
+        self.unindexed = defaultdict(list)
+        for id, index, name, content_hash in self.session.query(
+                Monster.id, Monster.index, Monster.name, Monster.content_hash):
+            if index is None:
+                # seeded before monsters had an index; adopt them by name
+                self.unindexed[name].append(id)
+            else:
+                self.known[index] = (id, content_hash)
+
+        self.seen = set()
+        self.stats = Counter()
+
+    def add(self, key, resp):
+        self.seen.add(key)
+
+        if resp is None:
+            return []
+
+        parsed = parse_monster(resp)
+
+        known = self.known.get(key)
+        if known is not None and known[1] == parsed[0]['content_hash']:
+            self.stats['unchanged'] += 1
+            return []
+
+        self.pending.append((key, parsed))
+
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+
+        return []
+
+    def existing_id(self, key, parsed):
+        known = self.known.get(key)
+        if known is not None:
+            return known[0]
+
+        ids = self.unindexed.get(parsed[0]['name'])
+        return ids.pop() if ids else None
+
+    def flush(self):
+        keys = [key for key, _ in self.pending]
+
+        added, changed = [], []
+        for key, parsed in self.pending:
+            monster_id = self.existing_id(key, parsed)
+            if monster_id is None:
+                added.append((key, parsed))
+            else:
+                changed.append((monster_id, parsed))
+        self.pending = []
+
+        if added:
+            ids = self.insert_monsters([p[0] for _, p in added])
+            self.insert_children(ids, [p for _, p in added])
+            self.ids.update(zip((key for key, _ in added), ids))
+
+        if changed:
+            ids = [monster_id for monster_id, _ in changed]
+            table = Monster.__table__
+
+            # bound names may not clash with the column names they set
+            self.session.execute(
+                update(table).where(table.c.id == bindparam('_id'))
+                .values({c: bindparam('_' + c) for c in changed[0][1][0]}),
+                [dict({'_' + c: v for c, v in p[0].items()}, _id=monster_id)
+                 for monster_id, p in changed])
+
+            for child in CHILD_TABLES:
+                self.session.execute(delete(child).where(child.c.monster_id.in_(ids)))
+            self.insert_children(ids, [p for _, p in changed])
+
+        if added or changed:
+            CatalogVersion.bump(self.session)
+            self.stats['added'] += len(added)
+            self.stats['updated'] += len(changed)
+
+        self.session.commit()
+
+        return keys
+
+    def finish(self):
+        """Write what is left and delete monsters the API no longer lists"""
+
+        self.flush()
+
+        gone = [id for index, (id, _) in self.known.items() if index not in self.seen]
+
+        # old monsters that no listed monster adopted by name are gone too
+        gone.extend(id for ids in self.unindexed.values() for id in ids)
+
+        for start in range(0, len(gone), self.batch_size):
+            ids = gone[start:start + self.batch_size]
+            for child in CHILD_TABLES:
+                self.session.execute(delete(child).where(child.c.monster_id.in_(ids)))
+            self.session.execute(
+                delete(Monster.__table__).where(Monster.__table__.c.id.in_(ids)))
+
+        if gone:
+            CatalogVersion.bump(self.session)
+            self.stats['deleted'] += len(gone)
+            self.session.commit()
+
+        return self.stats
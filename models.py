@@ -6,28 +6,68 @@
         -- monster condition/damage immunity
 """
 
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.orm import validates
 import json
+import time
 
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+from difficulty import rate
+from routing import RoutingSQLAlchemy
+
+db = RoutingSQLAlchemy()
 
 
 def connect_db(app):
-    """Connect to database."""
+    """Connect to database.
+
+    The first app connected is also the one used outside an app context.
+    """
 
-    db.app = app
+    if db.app is None:
+        db.app = app
     db.init_app(app)
 
 
+def password_hasher():
+    """The current app's PasswordHasher (see passwords.py)"""
+
+    return db.get_app().extensions['passwords']
+
+
+def format_cr(challenge_rating):
+    """Certain challenge_ratings are fractions"""
+
+    if challenge_rating == 0.125:
+        return "1/8"
+    elif challenge_rating == 0.25:
+        return "1/4"
+    elif challenge_rating == 0.5:
+        return "1/2"
+    else:
+        return str(int(challenge_rating))
+
+
 class Monster(db.Model):
     """Model for monsters"""
 
     __tablename__ = "monsters"
 
+    # composite indexes for the orderings /api/monsters pages by; the
+    # leading columns also serve the type and size facet lists
+    __table_args__ = (
+        db.Index('ix_monsters_name_id', 'name', 'id'),
+        db.Index('ix_monsters_cr_name_id', 'challenge_rating', 'name', 'id'),
+        db.Index('ix_monsters_size_name_id', 'size', 'name', 'id'),
+        db.Index('ix_monsters_type_name_id', 'type', 'name', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
 
+    # the dnd5eapi index ("adult-red-dragon") and a hash of everything
+    # seeded from it, so a sync can tell which monsters changed
+    index = db.Column(db.String(100), unique=True)
+    content_hash = db.Column(db.String(64))
+
     name = db.Column(db.String(30), nullable=False)
     size = db.Column(db.String(30), nullable=False)
     type = db.Column(db.String(30), nullable=False)
@@ -108,14 +148,7 @@ class Monster(db.Model):
     def cr(self):
         """Certain challenge_ratings are fractions"""
 
-        if self.challenge_rating == 0.125:
-            return "1/8"
-        elif self.challenge_rating == 0.25:
-            return "1/4"
-        elif self.challenge_rating == 0.5:
-            return "1/2"
-        else:
-            return str(int(self.challenge_rating))
+        return format_cr(self.challenge_rating)
 
     def mod(self, attr):
         """Monster attributes are associated with a modifier"""
@@ -238,6 +271,98 @@ class LegendaryAction(db.Model):
         return(f"<Legendary Action: {self.name}>")
 
 
+class CatalogVersion(db.Model):
+    """Single-row counter that changes whenever monster data changes
+
+    Caches of the monster catalog compare against this to decide whether
+    they are stale.
+    """
+
+    __tablename__ = "catalog_version"
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True
+    )
+
+    version = db.Column(
+        db.BigInteger,
+        nullable=False
+    )
+
+    updated_at = db.Column(
+        db.DateTime(timezone=True),
+        nullable=False,
+        server_default=db.func.now()
+    )
+
+    def __repr__(self):
+        """Stringify the catalog version in a helpful way"""
+
+        return f"<Catalog Version: {self.version}>"
+
+    @classmethod
+    def current(cls, session=None):
+        """Return the current catalog version (0 if none has been recorded)"""
+
+        session = session or db.session
+        version = session.query(cls.version).filter_by(id=1).scalar()
+        return version or 0
+
+    @classmethod
+    def latest(cls, session=None):
+        """Return (version, updated_at) for the current catalog"""
+
+        session = session or db.session
+        row = session.query(cls.version, cls.updated_at).filter_by(id=1).first()
+        return tuple(row) if row else (0, None)
+
+    @classmethod
+    def bump(cls, session=None):
+        """Move the catalog version forward as part of the current transaction"""
+
+        session = session or db.session
+
+        updated = session.execute(
+            db.update(cls).where(cls.id == 1)
+            .values(version=cls.version + 1, updated_at=db.func.now())
+        ).rowcount
+
+        if not updated:
+            # Start from the clock rather than 1, so that a catalog rebuilt
+            # with drop_all() never reuses a version an older one had.
+            session.execute(
+                db.insert(cls).values(id=1, version=int(time.time()))
+            )
+
+        session.info['catalog_changed'] = True
+
+
+CATALOG_MODELS = (Monster, SpecialAbility, Action, LegendaryAction)
+
+
+@event.listens_for(db.session, "before_flush")
+def bump_catalog_on_flush(session, flush_context, instances):
+    """Any ORM change to monster data moves the catalog version forward"""
+
+    changed = (session.new | session.dirty | session.deleted)
+
+    if any(isinstance(obj, CATALOG_MODELS) for obj in changed):
+        CatalogVersion.bump(session)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def bump_catalog_on_bulk(orm_execute_state):
+    """Bulk updates and deletes of monster data bypass the flush"""
+
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ in CATALOG_MODELS:
+        CatalogVersion.bump(orm_execute_state.session)
+
+
 class User (db.Model):
     """Model for users"""
 
@@ -277,7 +402,7 @@ class User (db.Model):
     def signup(cls, email, username, password):
         """Sign up new user."""
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        hashed_pwd = password_hasher().hash(password)
 
         user = User(
             email=email,
@@ -293,13 +418,17 @@ class User (db.Model):
         """Find user with `username` and `password` and return that user object.
 
         If a matching user cannot be found (or if password is wrong), returns False.
+        A hash made with an old work factor is replaced; the caller commits it.
         """
 
         user = cls.query.filter_by(username=username).first()
 
         if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
+            hasher = password_hasher()
+            is_auth = hasher.check(user.password, password)
             if is_auth:
+                if hasher.needs_rehash(user.password):
+                    user.password = hasher.hash(password)
                 return user
 
         return False
@@ -310,6 +439,12 @@ class Encounter(db.Model):
 
     __tablename__ = "encounters"
 
+    # the user page lists a user's encounters newest first, by id
+    __table_args__ = (
+        db.Index('ix_encounters_user_id_id', 'user_id', 'id'),
+        db.Index('ix_encounters_user_id_difficulty', 'user_id', 'difficulty'),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -334,48 +469,310 @@ class Encounter(db.Model):
         db.Text
     )
 
+    # Computed from heroes and monsters whenever the encounter is saved
+    # (see refresh_summary), so listing encounters never parses them.
+    # All are null when the hero or monster list can't be read.
+    summary = db.Column(
+        db.Text
+    )
+
+    num_monsters = db.Column(
+        db.Integer
+    )
+
+    adjusted_xp = db.Column(
+        db.Float
+    )
+
+    difficulty = db.Column(
+        db.String(10)
+    )
+
+    # The same lists, one row per group. heroes and monsters stay the
+    # source of truth while old rows are migrated (`flask encounters
+    # migrate`); setting either one rewrites its groups.
+    hero_groups = db.relationship(
+        "EncounterHero",
+        order_by="EncounterHero.position",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+    monster_groups = db.relationship(
+        "EncounterMonster",
+        order_by="EncounterMonster.position",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
     def __repr__(self):
         """Stringify encounter in a helpful way"""
 
         return f"<Encounter {self.id}: {self.heroes} // {self.monsters}>"
 
     def serialize(self):
-        """Turn encounter object into dictionary"""
+        """Turn encounter object into dictionary, with parsed hero and monster lists"""
 
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'heroes': self.heroes,
-            'monsters': self.monsters,
+            'heroes': self.hero_list(),
+            'monsters': self.monster_list(),
         }
 
-    def summarize(self, length=50):
-        """Return a summary string for the encounter (up to 30 characters)"""
+    def hero_list(self):
+        """Hero groups as dictionaries"""
+
+        if self.hero_groups:
+            return [h.serialize() for h in self.hero_groups]
+
+        # not migrated yet
+        return [EncounterHero.from_dict(i, h).serialize()
+                for i, h in enumerate(parse_list(self.heroes))]
+
+    def monster_list(self):
+        """Monster groups as dictionaries"""
+
+        if self.monster_groups:
+            return [m.serialize() for m in self.monster_groups]
 
-        h_obj = json.loads( self.heroes )
-        m_obj = json.loads( self.monsters )
+        # not migrated yet
+        return [EncounterMonster.from_dict(i, m).serialize()
+                for i, m in enumerate(parse_list(self.monsters))]
 
-        # import pdb; pdb.set_trace()
+    @validates('heroes')
+    def write_hero_groups(self, key, heroes):
+        self.hero_groups = [EncounterHero.from_dict(i, h)
+                            for i, h in enumerate(parse_list(heroes))]
+        return heroes
+
+    @validates('monsters')
+    def write_monster_groups(self, key, monsters):
+        self.monster_groups = [EncounterMonster.from_dict(i, m)
+                               for i, m in enumerate(parse_list(monsters))]
+        return monsters
+
+    @staticmethod
+    def describe(heroes, monsters):
+        """Full summary string for the given hero and monster JSON"""
+
+        h_obj = json.loads(heroes)
+        m_obj = json.loads(monsters)
 
         numHeroes = 0
         for h in h_obj:
             numHeroes += int(h['num'])
-                
+
         response = "No Heroes" if numHeroes == 0 else f"Heroes x {numHeroes}"
         response += " vs. "
 
         if m_obj:
-            for m in m_obj:
-                # monster = Monster.query.get(m['id'])
-                response += f"{m['name']} x {m['num']}, "
-            # trim off the closing comma and whitespace
-            response = response.rstrip(', ')
-
+            response += ", ".join(f"{m['name']} x {m['num']}" for m in m_obj)
         else:
             response += "No Monsters"
 
+        return response
+
+    @staticmethod
+    def summary_columns(heroes, monsters):
+        """Values of the precomputed columns for the given heroes and monsters"""
+
+        try:
+            rating = rate(heroes, monsters)
+            return {
+                'summary': Encounter.describe(heroes, monsters),
+                'num_monsters': rating['num_monsters'],
+                'adjusted_xp': rating['adjusted_xp'],
+                'difficulty': rating['difficulty'],
+            }
+        except (AttributeError, KeyError, OverflowError, TypeError, ValueError):
+            return dict.fromkeys(('summary', 'num_monsters',
+                                  'adjusted_xp', 'difficulty'))
+
+    def refresh_summary(self):
+        """Recompute the summary columns from heroes and monsters"""
+
+        for column, value in self.summary_columns(self.heroes,
+                                                  self.monsters).items():
+            setattr(self, column, value)
+
+    def summarize(self, length=50):
+        """Return a summary string for the encounter (up to `length` characters)"""
+
+        response = self.summary
+        if response is None:
+            response = self.describe(self.heroes, self.monsters)
+
         # Trim string to 'length' characters
         if len(response) > length:
             response = response[:length-3] + "..."
 
         return response
+
+
+# Columns and indexes tables gained after they first shipped. create_all()
+# doesn't touch existing tables, so older databases get them from
+# upgrade_schema(): seed.py's sync runs MONSTER_DDL and `flask encounters
+# backfill` runs ENCOUNTER_DDL.
+MONSTER_DDL = [
+    'ALTER TABLE monsters ADD COLUMN IF NOT EXISTS "index" VARCHAR(100)',
+    "ALTER TABLE monsters ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    'CREATE UNIQUE INDEX IF NOT EXISTS monsters_index_key ON monsters ("index")',
+    "CREATE INDEX IF NOT EXISTS ix_monsters_name_id ON monsters (name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_monsters_cr_name_id"
+    " ON monsters (challenge_rating, name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_monsters_size_name_id ON monsters (size, name, id)",
+    "CREATE INDEX IF NOT EXISTS ix_monsters_type_name_id ON monsters (type, name, id)",
+]
+
+ENCOUNTER_DDL = [
+    "ALTER TABLE encounters ADD COLUMN IF NOT EXISTS summary TEXT",
+    "ALTER TABLE encounters ADD COLUMN IF NOT EXISTS num_monsters INTEGER",
+    "ALTER TABLE encounters ADD COLUMN IF NOT EXISTS adjusted_xp FLOAT",
+    "ALTER TABLE encounters ADD COLUMN IF NOT EXISTS difficulty VARCHAR(10)",
+    "CREATE INDEX IF NOT EXISTS ix_encounters_user_id_id ON encounters (user_id, id)",
+    "CREATE INDEX IF NOT EXISTS ix_encounters_user_id_difficulty"
+    " ON encounters (user_id, difficulty)",
+]
+
+
+def upgrade_schema(session, statements):
+    """Add missing columns and indexes to existing tables (Postgres only)"""
+
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+
+    for statement in statements:
+        session.execute(DDL(statement))
+
+
+def parse_list(text):
+    """Parse a stored JSON list of groups, or [] if it can't be read"""
+
+    try:
+        groups = json.loads(text)
+    except (TypeError, ValueError):
+        return []
+
+    if not isinstance(groups, list):
+        return []
+
+    return [g for g in groups if isinstance(g, dict)]
+
+
+# range of the Integer columns group values are stored in
+MIN_INT, MAX_INT = -2**31, 2**31 - 1
+
+# longest challenge rating an encounter_monsters row holds
+CR_LENGTH = 5
+
+
+def to_int(value, default=0):
+    """A group value as an int for an Integer column, or `default` if it can't be one"""
+
+    try:
+        value = int(value)
+    except (OverflowError, TypeError, ValueError):
+        return default
+
+    return value if MIN_INT <= value <= MAX_INT else default
+
+
+def fits_integer(value):
+    """False for a group value that is a number outside an Integer column's range"""
+
+    try:
+        value = int(value)
+    except OverflowError:
+        return False
+    except (TypeError, ValueError):
+        return True
+
+    return MIN_INT <= value <= MAX_INT
+
+
+class EncounterHero(db.Model):
+    """One group of same-level heroes in an encounter"""
+
+    __tablename__ = "encounter_heroes"
+
+    encounter_id = db.Column(
+        db.Integer,
+        db.ForeignKey('encounters.id', ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    position = db.Column(db.Integer, primary_key=True)
+
+    num = db.Column(db.Integer, nullable=False)
+    lvl = db.Column(db.Integer, nullable=False)
+
+    @staticmethod
+    def values(group):
+        """Column values for a group from the stored JSON list"""
+
+        return {'num': to_int(group.get('num')),
+                'lvl': to_int(group.get('lvl'), 1)}
+
+    @classmethod
+    def from_dict(cls, position, group):
+        return cls(position=position, **cls.values(group))
+
+    def serialize(self):
+        return {'num': self.num, 'lvl': self.lvl}
+
+
+class EncounterMonster(db.Model):
+    """One group of identical monsters in an encounter
+
+    Name, CR and XP are copied from the catalog when the encounter is
+    saved. monster_id is not a foreign key: reseeding the catalog must
+    not cascade into users' saved encounters.
+    """
+
+    __tablename__ = "encounter_monsters"
+
+    encounter_id = db.Column(
+        db.Integer,
+        db.ForeignKey('encounters.id', ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    position = db.Column(db.Integer, primary_key=True)
+
+    monster_id = db.Column(db.Integer, index=True)
+    name = db.Column(db.Text)
+    cr = db.Column(db.String(CR_LENGTH))
+    xp = db.Column(db.Integer, nullable=False)
+    num = db.Column(db.Integer, nullable=False)
+
+    @staticmethod
+    def values(group):
+        """Column values for a group from the stored JSON list"""
+
+        cr = group.get('cr')
+
+        return {'monster_id': to_int(group.get('id'), None),
+                'name': group.get('name'),
+                'cr': None if cr is None else str(cr),
+                'xp': to_int(group.get('xp')),
+                'num': to_int(group.get('num'))}
+
+    @classmethod
+    def from_dict(cls, position, group):
+        return cls(position=position, **cls.values(group))
+
+    def serialize(self):
+        return {
+            'id': self.monster_id,
+            'name': self.name,
+            'cr': self.cr,
+            'xp': self.xp,
+            'num': self.num,
+        }
+
+
+@event.listens_for(Encounter, "before_insert")
+@event.listens_for(Encounter, "before_update")
+def summarize_on_save(mapper, connection, encounter):
+    encounter.refresh_summary()
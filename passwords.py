@@ -0,0 +1,101 @@
+"""
+    Password hashing off the request thread.
+
+    bcrypt is slow on purpose. Hashes are computed on a small thread pool
+    (bcrypt releases the GIL while it works), so with threaded workers a
+    burst of logins occupies at most PASSWORD_HASH_WORKERS cores per
+    process while other threads keep serving the catalog. At most
+    PASSWORD_HASH_QUEUE hashes may be running or waiting at once; beyond
+    that callers get HasherBusy straight away instead of piling up.
+
+    The work factor is BCRYPT_LOG_ROUNDS. Hashes made with a different
+    factor still verify, and are replaced on the user's next login.
+
+    Each app has its own hasher, in app.extensions['passwords'].
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Too many hashes are already running or waiting"""
+
+
+class PasswordHasher:
+    """Hashes and checks passwords on a bounded pool
+
+    PASSWORD_HASH_WORKERS = 0 hashes on the calling thread, uncapped.
+    """
+
+    def __init__(self, app=None):
+        self.rounds = 12
+        self.pool = None
+        self.slots = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.rounds = app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+        self.configure(app.config.setdefault('PASSWORD_HASH_WORKERS', 2),
+                       app.config.setdefault('PASSWORD_HASH_QUEUE', 32))
+
+        app.extensions['passwords'] = self
+
+    def configure(self, workers, queue):
+        """Replace the pool; hashes already submitted finish on the old one"""
+
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+        # threads only start on first use, so a preloaded app can fork safely
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix="bcrypt") if workers else None
+        self.slots = threading.BoundedSemaphore(max(queue, workers)) if workers else None
+
+    def run(self, fn, *args):
+        """Call fn(*args) on the pool and wait for its result"""
+
+        if self.pool is None:
+            return fn(*args)
+
+        if not self.slots.acquire(blocking=False):
+            raise HasherBusy("too many passwords are being checked; try again shortly")
+
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda f: self.slots.release())
+
+        return future.result()
+
+    def hash(self, password):
+        """Hash a password with the current work factor; returns a str"""
+
+        if not password:
+            raise ValueError("Password must be non-empty.")
+
+        salt = bcrypt.gensalt(self.rounds)
+
+        return self.run(bcrypt.hashpw, password.encode('utf-8'), salt).decode('utf-8')
+
+    def check(self, hashed, password):
+        """Whether `password` matches `hashed`"""
+
+        if not password or not hashed:
+            return False
+
+        return self.run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """Whether `hashed` was made with a different work factor"""
+
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
@@ -0,0 +1,157 @@
+"""
+    Database connection pool settings and statistics.
+
+    Each worker process keeps its own pool of DB_POOL_SIZE connections,
+    plus up to DB_MAX_OVERFLOW more under load; a request that finds the
+    pool exhausted waits up to DB_POOL_TIMEOUT seconds for a connection.
+    Multiply by workers and dynos to get the number of Postgres
+    connections the app can hold open.
+
+    With DB_PGBOUNCER set, the app is safe behind PgBouncer in
+    transaction pooling mode: nothing is left on a server connection
+    between transactions, so the statement timeout is set per
+    transaction with SET LOCAL rather than at connect time, and asyncpg's
+    prepared statement caches are turned off.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that counts checkouts and the time spent waiting for them"""
+
+    def _do_get(self):
+        stats = self.__dict__.get('_stats')
+        if stats is None:
+            stats = self.__dict__.setdefault('_stats', PoolCounters())
+
+        # no idle connection and no room to open another: this will block
+        blocked = (self._max_overflow > -1 and self._overflow >= self._max_overflow
+                   and self._pool.empty())
+
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            stats.add(blocked, time.perf_counter() - start, timed_out=True)
+            raise
+
+        stats.add(blocked, time.perf_counter() - start)
+        return connection
+
+
+class PoolCounters:
+    """Running totals for one pool, since it was created"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def add(self, blocked, duration, timed_out=False):
+        with self.lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            if blocked:
+                self.waits += 1
+                self.wait_total += duration
+                self.wait_max = max(self.wait_max, duration)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'wait_ms_total': round(self.wait_total * 1000, 2),
+                'wait_ms_max': round(self.wait_max * 1000, 2),
+            }
+
+
+def engine_options(config, uri=None):
+    """create_engine() options for the app's database
+
+    `uri` defaults to SQLALCHEMY_DATABASE_URI; pass an asyncpg URL to
+    get options for asgi.py's async engine. Only Postgres is pooled this
+    way; other databases keep SQLAlchemy's defaults.
+    """
+
+    url = make_url(uri or config['SQLALCHEMY_DATABASE_URI'])
+
+    if url.get_backend_name() != "postgresql":
+        return {}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+    timeout = config['DB_STATEMENT_TIMEOUT']
+    pgbouncer = config['DB_PGBOUNCER']
+
+    if url.get_driver_name() == "asyncpg":
+        connect_args = {}
+        if pgbouncer:
+            # PgBouncer may hand each transaction a different server
+            # connection, where a cached prepared statement doesn't exist
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+        elif timeout:
+            connect_args['server_settings'] = {'statement_timeout': str(timeout)}
+    else:
+        options['poolclass'] = MeteredQueuePool
+        connect_args = {}
+        if timeout and not pgbouncer:
+            connect_args['options'] = f"-c statement_timeout={timeout}"
+
+    if connect_args:
+        options['connect_args'] = connect_args
+
+    return options
+
+
+def watch_transactions(engine, config):
+    """Set the statement timeout per transaction, where it can't be per connection"""
+
+    timeout = config['DB_STATEMENT_TIMEOUT']
+
+    if not (config['DB_PGBOUNCER'] and timeout and engine.dialect.name == "postgresql"):
+        return
+
+    @event.listens_for(engine, "begin")
+    def set_statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout)}")
+
+
+def pool_stats(engine):
+    """Current state and running totals of an engine's pool, for /_stats"""
+
+    pool = engine.pool
+
+    if not isinstance(pool, QueuePool):
+        return {'class': type(pool).__name__}
+
+    stats = {
+        'class': type(pool).__name__,
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+    }
+
+    counters = pool.__dict__.get('_stats')
+    stats.update(counters.snapshot() if counters else PoolCounters().snapshot())
+
+    return stats
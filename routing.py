@@ -0,0 +1,91 @@
+"""
+    Read-replica routing.
+
+    With REPLICA_DATABASE_URL set, views marked @replica_reads (catalog
+    browsing: the homepage, /api/monsters, monster search and stat
+    blocks) read from the replica; everything else, and every write, uses
+    the primary. The in-memory catalog those views share is always
+    loaded from the primary (see CatalogStore), so the homepage and
+    /api/monsters don't actually query the replica; search and stat
+    blocks do. After a user saves something they are kept on the primary
+    for REPLICA_STICKY_SECONDS, so they see their own writes even while
+    the replica lags behind.
+
+    Any pair of databases works, including two SQLite files standing in
+    for primary and replica in development.
+"""
+
+import time
+
+from flask import current_app, request, session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import orm
+
+REPLICA = 'replica'
+
+# session key holding the time until which this client reads from the primary
+PRIMARY_UNTIL_KEY = "primary_until"
+
+
+class RoutingSession(SignallingSession):
+    """Session that reads from the replica bind when told to
+
+    `info['replica']` is set per request (see init_routing). Flushes and
+    INSERT/UPDATE/DELETE statements always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (self.info.get(REPLICA) and not self._flushing
+                and not getattr(clause, 'is_dml', False)):
+            db = self.app.extensions['sqlalchemy'].db
+            return db.get_engine(self.app, bind=REPLICA)
+
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy whose sessions can route reads to a replica"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def replica_reads(view):
+    """Mark a read-only view as safe to serve from the replica"""
+
+    view.replica_reads = True
+    return view
+
+
+def read_primary(session):
+    """Send the rest of this request's reads to the primary"""
+
+    session.info.pop(REPLICA, None)
+
+
+def stick_to_primary():
+    """Read this client's requests from the primary for a while"""
+
+    seconds = current_app.config['REPLICA_STICKY_SECONDS']
+    session[PRIMARY_UNTIL_KEY] = time.time() + seconds
+
+
+def init_routing(app, db):
+    """Add the replica bind, if configured, and route marked views to it"""
+
+    app.config.setdefault('REPLICA_STICKY_SECONDS', 10)
+
+    url = app.config.get('REPLICA_DATABASE_URL')
+    if not url:
+        return
+
+    app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                          **{REPLICA: url})
+
+    @app.before_request
+    def route_reads():
+        view = app.view_functions.get(request.endpoint)
+
+        if (getattr(view, 'replica_reads', False)
+                and session.get(PRIMARY_UNTIL_KEY, 0) < time.time()):
+            db.session.info[REPLICA] = True
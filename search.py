@@ -0,0 +1,191 @@
+"""
+    Full-text search over the rules text of monsters' special abilities,
+    actions and legendary actions.
+
+    Each of the three tables has a generated `search_vector` tsvector
+    column (name weighted above description) with a GIN index. Postgres
+    keeps the column up to date on every insert and update, so seeding
+    and syncing maintain it without doing anything; install_search()
+    adds it to databases created before it existed. It is Postgres-only
+    DDL and isn't part of the models, so other databases (SQLite in
+    development) simply can't search.
+"""
+
+from html import escape
+
+from sqlalchemy import DDL, event, func, literal, literal_column, select, true, union_all
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+from models import Action, LegendaryAction, Monster, SpecialAbility
+
+SEARCH_CONFIG = 'english'
+
+# the key for each table's matches in search results
+SEARCH_TABLES = {
+    'special_ability': SpecialAbility.__table__,
+    'action': Action.__table__,
+    'legendary_action': LegendaryAction.__table__,
+}
+
+# ts_headline marks matches with these; the snippet is HTML-escaped, then
+# they become <mark> tags. Control characters never occur in rules text.
+START, STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = (f"StartSel={START}, StopSel={STOP}, "
+                    "MinWords=10, MaxWords=25, MaxFragments=2")
+
+# snippets returned per monster, from its best-matching abilities
+MAX_SNIPPETS = 3
+
+SEARCH_DDL = """\
+ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{config}', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('{config}', coalesce("desc", '')), 'B')
+    ) STORED;
+CREATE INDEX IF NOT EXISTS ix_{table}_search_vector
+    ON {table} USING gin (search_vector)"""
+
+
+class SearchError(ValueError):
+    """The search can't be run: no text, or a database without it"""
+
+
+def search_ddl(table):
+    return SEARCH_DDL.format(table=table.name, config=SEARCH_CONFIG)
+
+
+for _table in SEARCH_TABLES.values():
+    event.listen(_table, 'after_create',
+                 DDL(search_ddl(_table)).execute_if(dialect='postgresql'))
+
+
+def install_search(session):
+    """Add the search columns and indexes to existing tables, if missing"""
+
+    if session.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in SEARCH_TABLES.values():
+        session.execute(DDL(search_ddl(table)))
+
+
+def search_vector(table):
+    return literal_column(f"{table.name}.search_vector", TSVECTOR)
+
+
+def search_query(text, min_cr=0, max_cr=30, type=None, size=None, status='both',
+                 limit=20, offset=0):
+    """The search as a single statement
+
+    Rows are one per matching ability of each monster on the page, best
+    monster first: (monster_id, rank, total, kind, name, snippet).
+    """
+
+    try:
+        min_cr, max_cr = float(min_cr), float(max_cr)
+    except ValueError:
+        raise ValueError("min_cr and max_cr must be numbers")
+
+    tsquery = select(
+        func.websearch_to_tsquery(SEARCH_CONFIG, text).label('query')).cte('tsquery')
+
+    hits = union_all(*(
+        select(table.c.monster_id,
+               literal(kind).label('kind'),
+               table.c.name,
+               table.c.desc,
+               func.ts_rank(search_vector(table), tsquery.c.query).label('rank'))
+        .join_from(table, tsquery, true())
+        .where(search_vector(table).op('@@')(tsquery.c.query))
+        for kind, table in SEARCH_TABLES.items()
+    )).cte('hits')
+
+    score = func.sum(hits.c.rank)
+
+    monsters = (
+        select(Monster.id,
+               score.label('rank'),
+               func.count().over().label('total'),
+               func.row_number()
+               .over(order_by=(score.desc(), Monster.name, Monster.id))
+               .label('position'))
+        .join_from(Monster, hits, hits.c.monster_id == Monster.id)
+        .where(Monster.challenge_rating.between(min_cr, max_cr))
+    )
+
+    if type:
+        monsters = monsters.where(Monster.type == type)
+
+    if size:
+        monsters = monsters.where(Monster.size == size)
+
+    legendary = (select(LegendaryAction.id)
+                 .where(LegendaryAction.monster_id == Monster.id)
+                 .exists())
+
+    if status == 'ordinary':
+        monsters = monsters.where(~legendary)
+    elif status == 'legendary':
+        monsters = monsters.where(legendary)
+    # else status == 'both' and no filtering is required
+
+    page = (monsters.group_by(Monster.id)
+            .order_by('position')
+            .limit(limit).offset(offset)
+            .cte('page'))
+
+    return (
+        select(page.c.id, page.c.rank, page.c.total, hits.c.kind, hits.c.name,
+               func.ts_headline(SEARCH_CONFIG, hits.c.desc, tsquery.c.query,
+                                HEADLINE_OPTIONS).label('snippet'))
+        .join_from(page, hits, hits.c.monster_id == page.c.id)
+        .join(tsquery, true())
+        .order_by(page.c.position, hits.c.rank.desc(), hits.c.name)
+    )
+
+
+def search_monsters(session, text, limit=20, offset=0, **filters):
+    """Monsters whose abilities and actions match `text`, best first
+
+    `text` is in web search syntax: words, "quoted phrases", `or` and
+    `-excluded`, matched against each ability on its own. `filters` are
+    the monster filter form's (see MonsterCatalog.filter). Returns
+    (total, results), where each result is (monster_id, rank, matches)
+    and each match is a dict of the ability's kind and name and an HTML
+    snippet with the matching words in <mark> tags.
+
+    Raises SearchError if there is nothing to search for or the database
+    isn't Postgres, and ValueError for unusable filters.
+    """
+
+    text = text.strip()
+    if not text:
+        raise SearchError("text is required")
+
+    if session.get_bind().dialect.name != 'postgresql':
+        raise SearchError("full-text search needs Postgres")
+
+    rows = session.execute(search_query(text, limit=limit, offset=offset, **filters))
+
+    total = 0
+    results = []
+
+    for monster_id, rank, total, kind, name, snippet in rows:
+        if not results or results[-1][0] != monster_id:
+            results.append((monster_id, rank, []))
+
+        matches = results[-1][2]
+        if len(matches) < MAX_SNIPPETS:
+            matches.append({
+                'kind': kind,
+                'name': name,
+                'snippet': mark(snippet),
+            })
+
+    return total, results
+
+
+def mark(snippet):
+    """Escape a ts_headline snippet and turn its match markers into <mark> tags"""
+
+    return escape(snippet).replace(START, "<mark>").replace(STOP, "</mark>")
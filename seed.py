@@ -1,161 +1,151 @@
-"""Seed file to populate monsters database"""
+"""Seed file to populate monsters database
 
-from models import db, Monster, SpecialAbility, Action, LegendaryAction
-from app import app
-import requests
+    python seed.py            bring the monster tables up to date with the API
+    python seed.py --rebuild  drop every table and load the catalog from scratch
+    python seed.py --resume   finish an interrupted rebuild without starting over
+
+A sync only writes monsters that are new, changed or gone, keeps the ids
+of the rest, and leaves users and encounters alone. Both keep the
+full-text search columns of search.py in place.
+
+API responses are cached in SEED_CACHE_DIR (default .seed-cache), so
+reseeding only downloads monsters that changed.
+"""
 
-BASE_API_URL = "https://www.dnd5eapi.co/api"
+import argparse
+import os
+
+from models import db, Monster, MONSTER_DDL, upgrade_schema
+from app import app
+from fetcher import BASE_API_URL, Checkpoint, Fetcher
+from loader import MonsterLoader, MonsterSync
+from search import install_search
 
 CHALLENGE_RATINGS = [0, 0.125, 0.25, 0.5, *range(1, 31)]
 
+CACHE_DIR = os.environ.get('SEED_CACHE_DIR', '.seed-cache')
+
 
-def seed_monster_db():
-    """Seed the monsters database"""
+def sync_monster_db(fetcher=None, batch_size=500):
+    """Update the monsters database in place; return counts of what changed"""
 
-    # Create all tables anew
-    db.drop_all()
+    fetcher = fetcher or Fetcher(cache_dir=CACHE_DIR)
+
+    # add any missing tables, then any columns and indexes added since
     db.create_all()
+    upgrade_schema(db.session, MONSTER_DDL)
+    install_search(db.session)
+    db.session.commit()
+
+    # list everything first: a monster is only deleted if a complete
+    # listing no longer has it
+    indexes = fetcher.monster_indexes(CHALLENGE_RATINGS)
+
+    sync = MonsterSync(batch_size)
+    for index, resp in fetcher.monsters(indexes):
+        sync.add(index, resp)
+
+    return sync.finish()
+
+
+def seed_monster_db(fetcher=None, resume=False, batch_size=500):
+    """Seed the monsters database from scratch"""
+
+    fetcher = fetcher or Fetcher(cache_dir=CACHE_DIR)
+    checkpoint = Checkpoint(os.path.join(CACHE_DIR, 'seed-checkpoint.txt'))
+
+    if not resume:
+        # Create all tables anew
+        db.drop_all()
+        db.create_all()
+        checkpoint.clear()
 
     # Get data from the API
-    get_all_monsters()
+    get_all_monsters(fetcher, checkpoint, batch_size)
 
 
-def get_all_monsters():
+def get_all_monsters(fetcher=None, checkpoint=None, batch_size=500):
     """Get all the monsters"""
 
-    for cr in CHALLENGE_RATINGS:
-        get_by_cr( cr )
+    get_by_cr_range(CHALLENGE_RATINGS[0], CHALLENGE_RATINGS[-1],
+                    fetcher, checkpoint, batch_size)
 
 
-def get_by_cr_range(min_cr: int, max_cr: int):
+def get_by_cr_range(min_cr: int, max_cr: int, fetcher=None, checkpoint=None,
+                    batch_size=500):
     """Get all monsters with challenge ratings between min_cr and max_cr (inclusive)."""
 
     if min_cr not in CHALLENGE_RATINGS or max_cr not in CHALLENGE_RATINGS:
         return False
 
-    for cr in CHALLENGE_RATINGS:
-        if cr >= min_cr and cr <= max_cr:
-            get_by_cr(cr)
+    fetcher = fetcher or Fetcher(cache_dir=CACHE_DIR)
+    loader = MonsterLoader(batch_size)
 
+    crs = [cr for cr in CHALLENGE_RATINGS if min_cr <= cr <= max_cr]
+    indexes = fetcher.monster_indexes(crs)
 
-def get_by_cr(cr: int):
-    """Get all monsters with challenge rating equal to cr."""
+    if checkpoint is not None:
+        indexes = [index for index in indexes if index not in checkpoint]
 
-    if cr not in CHALLENGE_RATINGS:
-        return False
+    def committed(keys):
+        if checkpoint is not None:
+            for index in keys:
+                checkpoint.add(index)
+
+    # fetching is concurrent; writes stay on this thread, in batches
+    for index, resp in fetcher.monsters(indexes):
+        committed(loader.add(index, resp))
 
-    resp = requests.get(
-        f"{BASE_API_URL}/monsters",
-        params={"challenge_rating": f"{cr}"}
-    ).json()
+    committed(loader.flush())
 
-    # print(f"*** API returned {resp.get('count')} results ***")
+    return True
 
-    for m in resp.get('results'):
-        
-        name = m.get('name')
-        index = m.get('index')
 
-        # print(f"Fetching monster: {name}")
-        get_by_index(index)
+def get_by_cr(cr: int, fetcher=None, checkpoint=None):
+    """Get all monsters with challenge rating equal to cr."""
+
+    return get_by_cr_range(cr, cr, fetcher, checkpoint)
 
 
-def get_by_index(idx: str):
+def get_by_index(idx: str, fetcher=None):
     """Get a monster by its index (name)."""
 
-    resp = requests.get(
-        f"{BASE_API_URL}/monsters/{idx}"
-    ).json()
+    fetcher = fetcher or Fetcher(cache_dir=CACHE_DIR)
 
-    if 'error' in resp.keys():
+    resp = fetcher.monster(idx)
+    if resp is None:
         return False
 
-    # to allow for easier parsing of the remaining fields, we
-    # save these fields and remove them from the list
-    special_abilities = resp.pop('special_abilities', None)
-    actions = resp.pop('actions', None)
-    legendary_actions = resp.pop('legendary_actions', None)
-
-    # create a new monster using all of the fields on the model
-    new_monster = Monster(
-        **{k: resp[k] for k in Monster.columns() if k in resp}
-    )
+    loader = MonsterLoader()
+    loader.add(idx, resp)
+    loader.flush()
 
-    db.session.add(new_monster)
-    db.session.commit()
+    return Monster.query.get(loader.ids[idx])
 
-    # now that the monster exists in the database, we go back and
-    # create entities related to the two fields we saved earlier
-    if special_abilities:
-        for sa in special_abilities:
-            if( 'usage' in sa ):
-                usage = parse_usage( sa['usage'] )
-            else:
-                usage = None
-
-            db.session.add(
-                SpecialAbility(monster_id=new_monster.id,
-                               name=sa['name'], desc=sa['desc'], usage=usage)
-            )
-        db.session.commit()
-
-    if actions:
-        for a in actions:
-            if( 'usage' in a ):
-                usage = parse_usage( a['usage'] )
-            else:
-                usage = None
-
-            db.session.add(
-                Action(monster_id=new_monster.id,
-                       name=a['name'], desc=a['desc'], usage=usage)
-            )
-        db.session.commit()
-
-    if legendary_actions:
-        for la in legendary_actions:                
-            db.session.add(
-                LegendaryAction(monster_id=new_monster.id,
-                       name=la['name'], desc=la['desc'])
-            )
-        db.session.commit()
-
-    return new_monster
-
-def parse_usage( usage ):
-    """Parse the 'usage' property for actions and special abilities
-
-    According to the API, the format of usage is:
-        {'type': 'recharge on roll', 'dice': '1d6', 'min_value': 5}
-
-    Where 'type' is one of:
-        'at will', 'per day', 'recharge after rest', 'recharge on roll'
-    """
-    
-    type = usage['type']
-
-    if type == 'per day':
-        response = f'({usage["times"]}/Day)'
-
-    elif type == 'recharge after rest':
-        if len(usage['rest_types']) == 2:
-            rest = "Short or Long"
-        else:
-            rest = usage['rest_types'][0].title()
-
-        response = f"(Recharges after a {rest} Rest)"
-
-    elif type == 'recharge on roll':
-        dice = '6' if usage["min_value"] == 6 else f'{usage["min_value"]}-6'
-        response = f'(Recharge {dice})'
 
-    else:
-        type = None
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Populate the monsters database")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="drop all tables (users and encounters too) and reseed")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted rebuild instead of starting over")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="number of concurrent API requests (default 8)")
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help="monsters written per transaction (default 500)")
+    parser.add_argument('--base-url', default=BASE_API_URL,
+                        help="API to seed from")
+    args = parser.parse_args()
 
-    return response
+    fetcher = Fetcher(args.base_url, cache_dir=CACHE_DIR, workers=args.workers)
 
+    if args.rebuild or args.resume:
+        seed_monster_db(fetcher, resume=args.resume, batch_size=args.batch_size)
+    else:
+        stats = sync_monster_db(fetcher, batch_size=args.batch_size)
+        print(", ".join(f"{stats[k]} {k}"
+                        for k in ('added', 'updated', 'unchanged', 'deleted')))
 
-#
-# Call the function to kick it off!
-#
-seed_monster_db()
\ No newline at end of file
+    print(f"{fetcher.stats['requests']} requests: "
+          f"{fetcher.stats['downloaded']} downloaded, "
+          f"{fetcher.stats['not_modified']} unchanged")
@@ -29,9 +29,18 @@ class MonsterTable {
         this.size = "";
         this.status = "both";
 
+        this.searchText = "";
+
+        // an empty sort lets the server choose: by relevance while
+        // searching, otherwise by name
+        this.sort = "";
+
+        // cursors[i] fetches page i + 1; the server hands us each next one
+        this.cursors = [null];
+        this.total = 0;
+
         this.HTMLtable = $('#monster-table-body');
 
-        this.allMonsters = [];
         this.monsters = [];
     }
 
@@ -53,7 +62,15 @@ class MonsterTable {
         this.size = size;
         this.status = status
 
+        await this.refresh();
+    }
+
+    /**
+     *  Start again from the first page of results
+     */
+    async refresh() {
         this.page = 1;
+        this.cursors = [null];
 
         await this.queryMonsters();
         this.updateView();
@@ -68,33 +85,27 @@ class MonsterTable {
             max_cr: this.maxCR,
             type: this.type,
             size: this.size,
-            status: this.status
+            status: this.status,
+            q: this.searchText,
+            sort: this.sort,
+            limit: this.resultsPerPage,
+            after: this.cursors[this.page - 1]
         }
 
-        // get updated monster list from the api
+        // get one page of the monster list from the api
         const resp = await axios.get(`/api/monsters`, { params: params });
 
-        // this.monsters = JSON.parse(JSON.stringify(resp.data.monsters));
         this.monsters = resp.data.monsters;
+        this.total = resp.data.total;
+        this.cursors[this.page] = resp.data.next;
     }
 
     /*
      *  Update the complete table UI
      */
     updateView() {
-        let monsterList = this.monsters;
-
-        // filter based on search box input
-        const filterText = $("#text-search-input").val().toLowerCase();
-
-        if (filterText !== '') {
-            monsterList = this.monsters.filter(m =>
-                m.name.toLowerCase().indexOf(filterText) >= 0
-            );
-        }
-
         // render the new table
-        this.renderMonsterTable(monsterList)
+        this.renderMonsterTable(this.monsters)
 
         // update pagination buttons
         if (this.page === 1) {
@@ -104,8 +115,7 @@ class MonsterTable {
             $('#table-prev-btn').parent().removeClass('disabled');
         }
 
-        const maxPages = Math.ceil(monsterList.length / this.resultsPerPage);
-        if (this.page === maxPages) {
+        if (!this.cursors[this.page]) {
             $('#table-next-btn').parent().addClass('disabled');
         }
         else {
@@ -126,11 +136,8 @@ class MonsterTable {
             return;
         }
 
-        // determine starting monster based on pagination
-        const start = (this.page - 1) * (this.resultsPerPage);
-
-        for (let i = 0; i < this.resultsPerPage && start + i < monster_list.length; i++) {
-            let m = monster_list[start + i];
+        // the server already sent exactly one page
+        for (let m of monster_list) {
             this.HTMLtable.append(this.renderMonsterTableRow(m));
         }
     }
@@ -158,15 +165,29 @@ class MonsterTable {
     /* 
      *  Logic for pagination
      */
-    showNextPage() {
+    async showNextPage() {
+        if (!this.cursors[this.page]) return;
+
         this.page++;
+        await this.queryMonsters();
         this.updateView();
     }
 
-    showPrevPage() {
+    async showPrevPage() {
+        if (this.page === 1) return;
+
         this.page--;
+        await this.queryMonsters();
         this.updateView();
     }
+
+    /*
+     *  Sort by a column; choosing the same column again reverses the order
+     */
+    async sortBy(key) {
+        this.sort = (this.sort === key) ? `-${key}` : key;
+        await this.refresh();
+    }
 } // end class MonsterTable
 
 
@@ -190,24 +211,27 @@ $('#table-next-btn').on("click", function (e) {
 // Results per page input
 $("#results-per-page-input").on("change",
     function (evt) {
-        MONSTER_TABLE.resultsPerPage = $(this).val();;
-        MONSTER_TABLE.updateView();
+        MONSTER_TABLE.resultsPerPage = $(this).val();
+        MONSTER_TABLE.refresh();
     });
 
 // Text search input
 $("#text-search-input").on("keyup",
     function (evt) {
         evt.preventDefault();
-        MONSTER_TABLE.updateView();
+
+        const text = $(this).val().trim();
+        if (text === MONSTER_TABLE.searchText) return;
+
+        MONSTER_TABLE.searchText = text;
+        MONSTER_TABLE.refresh();
     });
 
-////
-//// Version 2 feature idea: click column headers to sort
-////
-// $(".column-header").on("click",
-//     function (evt) {
-//         console.log(`Column head clicked!`);
-//     });
+// Click column headers to sort
+$(".column-header").on("click",
+    function (evt) {
+        MONSTER_TABLE.sortBy($(this).data("sort"));
+    });
 
 
 /************************************************************
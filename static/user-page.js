@@ -10,8 +10,8 @@ $('#user-saved-encounters').on("click", '.load-encounter-btn', async function (e
     const heroes = resp.data.heroes
     const monsters = resp.data.monsters
 
-    sessionStorage.setItem('stored_heroes', heroes)
-    sessionStorage.setItem('stored_monsters', monsters)
+    sessionStorage.setItem('stored_heroes', JSON.stringify(heroes))
+    sessionStorage.setItem('stored_monsters', JSON.stringify(monsters))
 
     window.location.replace("/");
 });
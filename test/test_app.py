@@ -0,0 +1,52 @@
+"""
+    Application factory tests
+"""
+
+from unittest import TestCase
+
+from models import db
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app, create_app
+
+db.create_all()
+
+
+class AppFactoryTestCase(TestCase):
+    """Test the configuration profiles and the readiness probe"""
+
+    def tearDown(self):
+        res = super().tearDown()
+        app.extensions['ready'] = False
+        return res
+
+    def test_profiles(self):
+        dev = create_app('development')
+        prod = create_app('production')
+
+        self.assertIn('debugtoolbar', dev.blueprints)
+        self.assertNotIn('debugtoolbar', prod.blueprints)
+        self.assertIsNone(dev.jinja_env.bytecode_cache)
+        self.assertIsNotNone(prod.jinja_env.bytecode_cache)
+
+        self.assertTrue(app.testing)
+        self.assertFalse(app.extensions['ready'])
+
+    def test_own_hasher(self):
+        prod = create_app('production')
+
+        # a new app doesn't reconfigure the others
+        self.assertIsNot(prod.extensions['passwords'], app.extensions['passwords'])
+        self.assertEqual(app.extensions['passwords'].rounds, 4)
+        self.assertIs(db.get_app(), app)
+
+    def test_ready(self):
+        with app.test_client() as c:
+            resp = c.get("/ready")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertTrue(resp.json['ready'])
+            self.assertTrue(app.extensions['ready'])
@@ -0,0 +1,132 @@
+"""
+    Async catalog API tests
+"""
+
+import asyncio
+from unittest import TestCase
+
+from models import db, Monster, LegendaryAction, Encounter, User
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+from asgi import CatalogAPI
+from test_catalog import make_monster
+
+db.create_all()
+
+
+async def call(api, path, query="", headers=()):
+    """Send one GET through the ASGI app; return (status, headers, body)"""
+
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'root_path': '', 'query_string': query.encode(),
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 1234),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await api(scope, receive, send)
+
+    start = messages[0]
+    body = b"".join(m.get('body', b"") for m in messages[1:])
+    return (start['status'],
+            {k.decode().lower(): v.decode() for k, v in start['headers']},
+            body)
+
+
+class AsyncCatalogTestCase(TestCase):
+    """Compare the async catalog views with the Flask ones"""
+
+    def setUp(self):
+        Encounter.query.delete()
+        User.query.delete()
+        LegendaryAction.query.delete()
+        Monster.query.delete()
+
+        db.session.add_all([
+            make_monster(1, "Wolf", "Medium", "beast", 0.25, 50),
+            make_monster(2, "Ancient Red Dragon", "Gargantuan", "dragon", 24, 62000),
+            make_monster(3, "Bat", "Tiny", "beast", 0, 10),
+        ])
+        db.session.add(LegendaryAction(monster_id=2, name="Tail Attack",
+                                       desc="The dragon makes a tail attack."))
+
+        user = User(id=5, username="asgi", email="asgi@test.com", password="HASHED")
+        db.session.add(user)
+        db.session.add(Encounter(
+            id=7, user_id=5, heroes='[{"num": 4, "lvl": 3}]',
+            monsters='[{"id": 1, "name": "Wolf", "cr": "1/4", "xp": 50, "num": 2}]'))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def run_api(self, test):
+        """Run `test(api)` on a fresh API and loop, then close its pool"""
+
+        async def main():
+            api = CatalogAPI(app)
+            try:
+                await test(api)
+            finally:
+                await api.engine.dispose()
+
+        asyncio.run(main())
+
+    def test_same_as_flask(self):
+        cases = [
+            ("/api/monsters", ""),
+            ("/api/monsters", "type=beast&sort=-cr&limit=1"),
+            ("/api/monsters", "q=wolf"),
+            ("/api/monsters", "min_cr=lots"),
+            ("/api/monsters/2", ""),
+            ("/api/encounters/7", ""),
+        ]
+
+        async def test(api):
+            for path, query in cases:
+                status, headers, body = await call(api, path, query)
+                expected = self.client.get(path, query_string=query)
+
+                self.assertEqual(status, expected.status_code, path + "?" + query)
+                self.assertEqual(body, expected.data, path + "?" + query)
+                self.assertEqual(headers.get('etag'), expected.headers.get('ETag'))
+
+        self.run_api(test)
+
+    def test_not_modified(self):
+        async def test(api):
+            status, headers, _ = await call(api, "/api/monsters")
+
+            status, _, body = await call(api, "/api/monsters",
+                                         headers=[("If-None-Match", headers['etag'])])
+            self.assertEqual((status, body), (304, b""))
+
+            status, _, _ = await call(api, "/api/monsters/99")
+            self.assertEqual(status, 404)
+
+        self.run_api(test)
+
+    def test_other_paths_go_to_flask(self):
+        async def test(api):
+            status, _, body = await call(api, "/ready")
+
+            self.assertEqual(status, 200)
+            self.assertIn(b'"ready"', body)
+
+        self.run_api(test)
@@ -0,0 +1,142 @@
+"""
+    Encounter builder tests
+"""
+
+from unittest import TestCase
+
+from models import db, Monster, LegendaryAction
+from builder import XPIndex, difficulty_band, parse_party, search, suggest
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+from test_catalog import make_monster
+
+db.create_all()
+
+
+class BuilderTestCase(TestCase):
+    """Test the encounter search"""
+
+    def setUp(self):
+        self.monsters = [
+            (1, "Bat", "0", 10),
+            (2, "Skeleton", "1/4", 50),
+            (3, "Zombie", "1/4", 50),
+            (4, "Ghoul", "1", 200),
+            (5, "Owlbear", "3", 700),
+        ]
+        # 4 level 1 heroes
+        self.thresholds = [100, 200, 300, 400]
+
+    def test_parse_party(self):
+        self.assertEqual(parse_party("4x1, 1x3"),
+                         [{'num': 4, 'lvl': 1}, {'num': 1, 'lvl': 3}])
+
+        with self.assertRaises(ValueError):
+            parse_party("4")
+
+        with self.assertRaises(ValueError):
+            parse_party("")
+
+    def test_band(self):
+        self.assertEqual(difficulty_band(self.thresholds, 'hard'), (300, 400))
+        self.assertEqual(difficulty_band(self.thresholds, 'deadly'), (400, 600))
+
+        with self.assertRaises(ValueError):
+            difficulty_band(self.thresholds, 'impossible')
+
+    def test_suggest_in_band(self):
+        results = suggest(self.monsters, self.thresholds, 'hard')
+
+        self.assertTrue(results)
+
+        for r in results:
+            self.assertGreaterEqual(r['adjusted_xp'], 300)
+            self.assertLess(r['adjusted_xp'], 400)
+            self.assertEqual(r['difficulty'], 'HARD')
+            self.assertLessEqual(len(r['monsters']), 2)
+
+    def test_suggest_single_group(self):
+        results = suggest(self.monsters, self.thresholds, 'hard', max_groups=1)
+
+        for r in results:
+            self.assertEqual(len(r['monsters']), 1)
+
+        # 3 x 50 XP is 300 adjusted, right at the "hard" goal
+        groups = [(r['monsters'][0]['xp'], r['monsters'][0]['num'])
+                  for r in results]
+        self.assertIn((50, 3), groups)
+        self.assertNotIn((200, 2), groups)
+
+    def test_suggest_limit(self):
+        results = suggest(self.monsters, self.thresholds, 'deadly', limit=3)
+        self.assertEqual(len(results), 3)
+
+    def test_suggest_closest(self):
+        """the best suggestions are found among every matching combination"""
+
+        monsters = [(i, f"Monster {i}", "1", xp)
+                    for i, xp in enumerate(range(13, 613, 7))]
+
+        everything = sorted(abs(adjusted - 500) for _, adjusted in
+                            search(XPIndex(monsters), 400, 600, max_groups=3))
+        self.assertGreater(len(everything), 1000)
+
+        results = suggest(monsters, self.thresholds, 'deadly', limit=10,
+                          max_groups=3)
+        self.assertEqual([abs(r['adjusted_xp'] - 500) for r in results],
+                         everything[:10])
+
+
+class SuggestViewTestCase(TestCase):
+    """Test the suggestion endpoint"""
+
+    def setUp(self):
+        LegendaryAction.query.delete()
+        Monster.query.delete()
+
+        db.session.add_all([
+            make_monster(1, "Skeleton", "medium", "undead", 0.25, 50),
+            make_monster(2, "Ghoul", "medium", "undead", 1, 200),
+            make_monster(3, "Wolf", "medium", "beast", 0.25, 50),
+        ])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_suggest(self):
+        with self.client as c:
+            resp = c.get("/api/encounters/suggest",
+                         query_string={'party': '4x1', 'difficulty': 'hard',
+                                       'type': 'undead'})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['thresholds']['hard'], 300)
+
+            names = {m['name'] for e in resp.json['encounters']
+                     for m in e['monsters']}
+            self.assertIn("Skeleton", names)
+            self.assertNotIn("Wolf", names)
+
+    def test_suggest_limit(self):
+        with self.client as c:
+            resp = c.get("/api/encounters/suggest",
+                         query_string={'party': '4x1', 'limit': -1})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(len(resp.json['encounters']), 1)
+
+    def test_suggest_bad_party(self):
+        with self.client as c:
+            resp = c.get("/api/encounters/suggest",
+                         query_string={'party': 'lots'})
+
+            self.assertEqual(resp.status_code, 400)
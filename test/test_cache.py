@@ -0,0 +1,46 @@
+"""
+    Cache tests
+"""
+
+from unittest import TestCase
+
+from cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+    """Test the LRU cache"""
+
+    def test_get_put(self):
+        cache = LRUCache(maxsize=2)
+
+        self.assertIsNone(cache.get('a'))
+
+        cache.put('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_eviction(self):
+        cache = LRUCache(maxsize=2)
+
+        cache.put('a', 1)
+        cache.put('b', 2)
+
+        # touching 'a' makes 'b' the least recently used
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_version(self):
+        cache = LRUCache().at_version(1)
+        cache.put('a', 1)
+
+        self.assertEqual(cache.at_version(1).get('a'), 1)
+        self.assertIsNone(cache.at_version(2).get('a'))
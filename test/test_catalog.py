@@ -0,0 +1,129 @@
+"""
+    Monster catalog tests
+"""
+
+from unittest import TestCase
+
+from models import db, Monster, LegendaryAction, CatalogVersion
+from catalog import MonsterCatalog, to_bits, from_bits
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+
+db.create_all()
+
+
+def make_monster(id, name, size, type, cr, xp):
+    return Monster(
+        id=id,
+        name=name,
+        size=size,
+        type=type,
+        armor_class=12,
+        hit_points=20,
+        hit_dice="3d8",
+        strength=10,
+        dexterity=10,
+        constitution=10,
+        intelligence=10,
+        wisdom=10,
+        charisma=10,
+        challenge_rating=cr,
+        xp=xp
+    )
+
+
+class CatalogTestCase(TestCase):
+    """Test the in-memory monster catalog"""
+
+    def setUp(self):
+        LegendaryAction.query.delete()
+        Monster.query.delete()
+
+        db.session.add_all([
+            make_monster(1, "Wolf", "Medium", "beast", 0.25, 50),
+            make_monster(2, "Ancient Red Dragon", "Gargantuan", "dragon", 24, 62000),
+            make_monster(3, "Bat", "Tiny", "beast", 0, 10),
+        ])
+        db.session.add(LegendaryAction(monster_id=2, name="Tail Attack",
+                                       desc="The dragon makes a tail attack."))
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def names(self, catalog, **filters):
+        return [catalog.names[i] for i in catalog.filter(**filters)]
+
+    def test_filter(self):
+        catalog = MonsterCatalog.load()
+
+        self.assertEqual(self.names(catalog),
+                         ["Ancient Red Dragon", "Bat", "Wolf"])
+        self.assertEqual(self.names(catalog, type="beast"), ["Bat", "Wolf"])
+        self.assertEqual(self.names(catalog, size="Tiny"), ["Bat"])
+        self.assertEqual(self.names(catalog, size="Huge"), [])
+        self.assertEqual(self.names(catalog, min_cr="0.25", max_cr="30"),
+                         ["Ancient Red Dragon", "Wolf"])
+        self.assertEqual(self.names(catalog, status="legendary"),
+                         ["Ancient Red Dragon"])
+        self.assertEqual(self.names(catalog, status="ordinary"), ["Bat", "Wolf"])
+
+    def test_bitmaps(self):
+        catalog = MonsterCatalog.load()
+
+        self.assertEqual(catalog.legendary_bits, 0b001)
+        self.assertEqual(catalog.type_bits[catalog.types.index("beast")], 0b110)
+        self.assertEqual(self.names(catalog, min_cr=5, max_cr=1), [])
+        self.assertEqual(self.names(catalog, min_cr=0.1, max_cr=0.3), ["Wolf"])
+
+    def test_bits_round_trip(self):
+        mask = [True, False, False, True] * 5 + [True]
+
+        bits = to_bits(mask)
+
+        self.assertEqual(from_bits(bits, len(mask)).tolist(),
+                         [i for i, m in enumerate(mask) if m])
+        self.assertEqual(from_bits(0, 10).tolist(), [])
+
+    def test_lookup(self):
+        catalog = MonsterCatalog.load()
+
+        self.assertEqual(catalog.lookup(1), {'name': "Wolf", 'cr': "1/4", 'xp': 50})
+        self.assertIsNone(catalog.lookup(99))
+        self.assertIsNone(catalog.lookup(2**40))
+
+    def test_version_bump(self):
+        """changing monster data moves the catalog version forward"""
+
+        before = CatalogVersion.current()
+
+        wolf = Monster.query.get(1)
+        wolf.hit_points = 11
+        db.session.commit()
+
+        self.assertGreater(CatalogVersion.current(), before)
+
+    def test_api_sees_changes(self):
+        with self.client as c:
+            resp = c.get("/api/monsters")
+            self.assertNotIn("Owlbear", str(resp.data))
+
+            db.session.add(make_monster(4, "Owlbear", "Large", "monstrosity", 3, 700))
+            db.session.commit()
+
+            resp = c.get("/api/monsters", query_string={'type': 'monstrosity'})
+            self.assertEqual([m['name'] for m in resp.json['monsters']],
+                             ["Owlbear"])
+
+    def test_api_bad_cr(self):
+        with self.client as c:
+            resp = c.get("/api/monsters", query_string={'min_cr': 'lots'})
+            self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,113 @@
+"""
+    Memory-mapped catalog file tests
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+
+from models import db, Monster, LegendaryAction, CatalogVersion
+from catalog import CatalogStore, MonsterCatalog
+from catalog_file import CatalogFileError, read_catalog_file, write_catalog_file
+
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+from test_catalog import make_monster
+
+db.create_all()
+
+
+class CatalogFileTestCase(TestCase):
+    """Test writing and mapping the shared catalog file"""
+
+    def setUp(self):
+        LegendaryAction.query.delete()
+        Monster.query.delete()
+
+        db.session.add_all([
+            make_monster(1, "Wolf", "Medium", "beast", 0.25, 50),
+            make_monster(2, "Ancient Red Dragon", "Gargantuan", "dragon", 24, 62000),
+            make_monster(3, "Bat", "Tiny", "beast", 0, 10),
+            make_monster(4, "Clay Golem", "Large", "construct", 3, 700),
+        ])
+        db.session.add(LegendaryAction(monster_id=2, name="Tail Attack",
+                                       desc="The dragon makes a tail attack."))
+        db.session.commit()
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "catalog.bin")
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        self.dir.cleanup()
+        return res
+
+    def test_round_trip(self):
+        loaded = MonsterCatalog.load()
+        write_catalog_file(loaded, self.path)
+        mapped = MonsterCatalog(*read_catalog_file(self.path))
+
+        self.assertEqual(mapped.version, loaded.version)
+        self.assertEqual(mapped.updated_at, loaded.updated_at)
+        self.assertEqual(list(mapped.names), list(loaded.names))
+
+        for filters in ({}, {'type': "beast"}, {'status': "legendary"},
+                        {'min_cr': 1, 'max_cr': 30}):
+            rows = loaded.filter(**filters)
+            self.assertEqual(list(mapped.filter(**filters)), list(rows))
+            self.assertEqual(mapped.to_json(rows), loaded.to_json(rows))
+
+        rows = loaded.filter()
+        for sort in ('name', '-cr', 'size'):
+            expected, cursor = loaded.page(rows, sort, limit=2)
+            actual, mapped_cursor = mapped.page(rows, sort, limit=2)
+            self.assertEqual(actual.tolist(), expected.tolist())
+            self.assertEqual(mapped_cursor, cursor)
+
+        self.assertEqual(mapped.search(rows, "golem")[0].tolist(),
+                         loaded.search(rows, "golem")[0].tolist())
+        self.assertEqual(mapped.lookup(4), {'name': "Clay Golem", 'cr': "3", 'xp': 700})
+        self.assertIsNone(mapped.lookup(99))
+
+    def test_replace_keeps_old_mapping(self):
+        write_catalog_file(MonsterCatalog.load(), self.path)
+        old = MonsterCatalog(*read_catalog_file(self.path))
+
+        Monster.query.get(3).name = "Giant Bat"
+        db.session.commit()
+        write_catalog_file(MonsterCatalog.load(), self.path)
+        new = MonsterCatalog(*read_catalog_file(self.path))
+
+        self.assertIn("Bat", list(old.names))
+        self.assertIn("Giant Bat", list(new.names))
+        self.assertGreater(new.version, old.version)
+
+    def test_not_a_catalog_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"this is not a catalog file")
+
+        with self.assertRaises(CatalogFileError):
+            read_catalog_file(self.path)
+
+    def test_store_uses_file(self):
+        other = Flask(__name__)
+        other.config['CATALOG_FILE'] = self.path
+
+        with app.app_context():
+            store = CatalogStore(other)
+
+            catalog = store.get()
+            self.assertTrue(os.path.exists(self.path))
+            self.assertEqual(catalog.version, CatalogVersion.current())
+
+            db.session.add(make_monster(5, "Owlbear", "Large", "monstrosity", 3, 700))
+            db.session.commit()
+
+            catalog = store.get()
+            self.assertIn("Owlbear", list(catalog.names))
+            self.assertEqual(read_catalog_file(self.path)[0], catalog.version)
@@ -0,0 +1,149 @@
+"""
+    Encounter difficulty tests
+"""
+
+from unittest import TestCase
+
+from models import db, Monster
+from difficulty import evaluate, rate
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+
+db.create_all()
+
+
+class DifficultyTestCase(TestCase):
+    """Test the difficulty calculations"""
+
+    def test_rate(self):
+        """matches the encounter panel math for a single encounter"""
+
+        r = rate(
+            '[{"num":"4","lvl":"1"}]',
+            '[{"id":72,"name":"Skeleton","cr":"1/4","xp":50,"num":2}]'
+        )
+
+        self.assertEqual(r['easy'], 100)
+        self.assertEqual(r['medium'], 200)
+        self.assertEqual(r['hard'], 300)
+        self.assertEqual(r['deadly'], 400)
+        self.assertEqual(r['total_xp'], 100)
+        self.assertEqual(r['adjusted_xp'], 150)
+        self.assertEqual(r['difficulty'], 'EASY')
+
+    def test_evaluate_batch(self):
+        """each encounter in a batch is rated independently"""
+
+        party = [{"num": 4, "lvl": 1}]
+
+        ratings = evaluate([
+            (party, []),
+            (party, [{"xp": 200, "num": 1}]),
+            (party, [{"xp": 50, "num": 2}, {"xp": 50, "num": 1}]),
+            (party, [{"xp": 450, "num": 1}]),
+            (party, [{"xp": 10, "num": 20}]),
+            ([], [{"xp": 450, "num": 1}]),
+        ])
+
+        self.assertEqual(
+            ratings['difficulty'].tolist(),
+            ['NONE', 'MEDIUM', 'HARD', 'DEADLY', 'DEADLY', 'NONE']
+        )
+        self.assertEqual(ratings['num_monsters'].tolist(), [0, 1, 3, 1, 20, 1])
+        self.assertEqual(ratings['adjusted_xp'].tolist(),
+                         [0, 200, 300, 450, 800, 450])
+
+    def test_invalid_level(self):
+        with self.assertRaises(ValueError):
+            rate([{"num": 1, "lvl": 21}], [])
+
+    def test_counts_too_large(self):
+        with self.assertRaises(ValueError):
+            rate([{"num": 10**20, "lvl": 1}], [])
+
+        with self.assertRaises(ValueError):
+            rate([], [{"num": 1, "xp": float("inf")}])
+
+
+class EvaluateViewTestCase(TestCase):
+    """Test the batch evaluation endpoint"""
+
+    def setUp(self):
+        Monster.query.delete()
+
+        m1 = Monster(
+            id=111,
+            name="Python",
+            size="medium",
+            type="beast",
+            armor_class=15,
+            hit_points=50,
+            hit_dice="5d6+7",
+            strength=8,
+            dexterity=10,
+            constitution=12,
+            intelligence=15,
+            wisdom=17,
+            charisma=19,
+            challenge_rating=0.5,
+            xp=100
+        )
+        db.session.add(m1)
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_evaluate(self):
+        with self.client as c:
+            resp = c.post("/api/encounters/evaluate", json={
+                "encounters": [
+                    {"heroes": [{"num": 4, "lvl": 1}],
+                     "monsters": [{"xp": 50, "num": 2}]},
+                    {"heroes": [{"num": 4, "lvl": 1}],
+                     "monsters": [{"id": 111, "num": 2}]},
+                ]
+            })
+
+            self.assertEqual(resp.status_code, 200)
+
+            results = resp.json['results']
+            self.assertEqual(len(results), 2)
+            self.assertEqual(results[0]['difficulty'], 'EASY')
+            self.assertEqual(results[1]['total_xp'], 200)
+            self.assertEqual(results[1]['adjusted_xp'], 300)
+            self.assertEqual(results[1]['difficulty'], 'HARD')
+
+    def test_evaluate_bad_input(self):
+        with self.client as c:
+            resp = c.post("/api/encounters/evaluate", json={"encounters": "nope"})
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post("/api/encounters/evaluate", json={
+                "encounters": [{"heroes": [{"num": 4, "lvl": "x"}]}]
+            })
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post("/api/encounters/evaluate", json={
+                "encounters": [{"monsters": [{"id": 999, "num": 1}]}]
+            })
+            self.assertEqual(resp.status_code, 400)
+
+            for monster_id in ("abc", 10**20, [111]):
+                resp = c.post("/api/encounters/evaluate", json={
+                    "encounters": [{"monsters": [{"id": monster_id, "num": 1}]}]
+                })
+                self.assertEqual(resp.status_code, 400)
+
+            resp = c.post("/api/encounters/evaluate", json={
+                "encounters": [{"monsters": [{"xp": 50, "num": 10**20}]}]
+            })
+            self.assertEqual(resp.status_code, 400)
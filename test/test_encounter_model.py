@@ -4,12 +4,15 @@
 
 from unittest import TestCase
 
-from models import db, User, Encounter
+from sqlalchemy import inspect, text
+
+from models import db, User, Encounter, EncounterMonster
 
 # from sqlalchemy.exc import IntegrityError, PendingRollbackError
 
 import os
 os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
 
 from app import app
 
@@ -100,11 +103,11 @@ class EncounterModelTestCase(TestCase):
         self.assertEqual(s1['user_id'], self.uid1)
         self.assertEqual(
             s1['heroes'],
-            '[{"num":"4","lvl":"1"}]'
+            [{"num": 4, "lvl": 1}]
         )
         self.assertEqual(
             s1['monsters'],
-            '[{"id":72,"name":"Skeleton","cr":"1/4","xp":50,"num":2}]'
+            [{"id": 72, "name": "Skeleton", "cr": "1/4", "xp": 50, "num": 2}]
         )
 
     def test_encounter_summarize(self):
@@ -125,3 +128,75 @@ class EncounterModelTestCase(TestCase):
         self.assertEqual(summ,
             'Heroes x 4 vs. Copper Dragon Wyrmling x 1, Swar...'
         )
+
+    def test_summary_columns(self):
+        """summary, size and difficulty are stored when the encounter is saved"""
+
+        e = Encounter.query.get(self.e1id)
+
+        self.assertEqual(e.summary, 'Heroes x 4 vs. Skeleton x 2')
+        self.assertEqual(e.num_monsters, 2)
+        self.assertEqual(e.adjusted_xp, 150)
+        self.assertEqual(e.difficulty, 'EASY')
+
+        e.monsters = '[]'
+        db.session.commit()
+
+        self.assertEqual(e.summary, 'Heroes x 4 vs. No Monsters')
+        self.assertEqual(e.num_monsters, 0)
+        self.assertEqual(e.difficulty, 'NONE')
+
+    def test_unreadable_groups(self):
+        """lists that can't be rated are stored with null summary columns"""
+
+        e = Encounter(user_id=self.uid1, heroes='[1]',
+                      monsters='[{"num": 1e999, "xp": 99999999999}]')
+        db.session.add(e)
+        db.session.commit()
+
+        self.assertIsNone(e.summary)
+        self.assertIsNone(e.difficulty)
+        # and group values that don't fit their columns aren't kept
+        self.assertEqual(e.monster_list()[0]['num'], 0)
+        self.assertEqual(e.monster_list()[0]['xp'], 0)
+
+    def test_backfill_adds_columns(self):
+        """the backfill brings an encounters table from before the summaries up to date"""
+
+        db.session.execute(text("DROP INDEX ix_encounters_user_id_id"))
+        db.session.execute(text("ALTER TABLE encounters DROP COLUMN summary, "
+                                "DROP COLUMN num_monsters, DROP COLUMN adjusted_xp, "
+                                "DROP COLUMN difficulty"))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=["encounters", "backfill"])
+        self.assertIsNone(result.exception)
+        self.assertIn("Updated 2 encounters", result.output)
+
+        db.session.expire_all()
+        self.assertEqual(Encounter.query.get(self.e1id).difficulty, 'EASY')
+        self.assertIn('ix_encounters_user_id_id',
+                      {i['name'] for i in inspect(db.engine).get_indexes('encounters')})
+
+    def test_encounter_groups(self):
+        """hero and monster lists are also stored one row per group"""
+
+        e2 = Encounter.query.get(self.e2id)
+
+        self.assertEqual([(h.num, h.lvl) for h in e2.hero_groups],
+                         [(2, 1), (2, 2)])
+        self.assertEqual([m.name for m in e2.monster_groups],
+                         ["Copper Dragon Wyrmling", "Swarm of Poisonous Snakes",
+                          "Warhorse Skeleton", "Acolyte"])
+
+        # which encounters use a monster
+        using = (db.session.query(EncounterMonster.encounter_id)
+                 .filter_by(monster_id=72).all())
+        self.assertEqual(using, [(self.e1id,)])
+
+        e2.monsters = '[{"id":4,"name":"Bat","cr":0,"xp":10,"num":5}]'
+        db.session.commit()
+
+        self.assertEqual(Encounter.query.get(self.e2id).monster_list(),
+                         [{"id": 4, "name": "Bat", "cr": "0", "xp": 10, "num": 5}])
+
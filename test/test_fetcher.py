@@ -0,0 +1,170 @@
+"""
+    Seed fetcher tests, against a local stand-in for dnd5eapi
+"""
+
+from unittest import TestCase
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import inspect, text
+
+from models import db, Monster, SpecialAbility, Action, LegendaryAction
+from fetcher import Checkpoint, Fetcher
+
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+import seed
+
+db.create_all()
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "dnd5eapi.json")
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    """Serves recorded API responses, with ETags"""
+
+    protocol_version = "HTTP/1.1"
+
+    with open(FIXTURES) as f:
+        fixtures = json.load(f)
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        self.server.clients.add(self.client_address)
+
+        if self.path in self.fixtures:
+            status, body = 200, self.fixtures[self.path]
+        elif self.path.startswith("/api/monsters?"):
+            status, body = 200, {"count": 0, "results": []}
+        else:
+            status, body = 404, {"error": "Not found"}
+
+        data = json.dumps(body).encode()
+        etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class FetcherTestCase(TestCase):
+    """Test concurrent fetching, the response cache and checkpoints"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+        self.server.paths = []
+        self.server.clients = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/api"
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.cache_dir)
+
+    def fetcher(self):
+        return Fetcher(self.base_url, cache_dir=self.cache_dir, workers=4)
+
+    def test_fetch(self):
+        fetcher = self.fetcher()
+
+        indexes = fetcher.monster_indexes(seed.CHALLENGE_RATINGS)
+        self.assertEqual(indexes, ["skeleton", "wolf", "adult-red-dragon",
+                                   "ghost-of-a-monster"])
+
+        monsters = dict(fetcher.monsters(indexes))
+        self.assertEqual(monsters["wolf"]["xp"], 50)
+        self.assertIsNone(monsters["ghost-of-a-monster"])
+
+        # pooled keep-alive connections, not one per request
+        self.assertLessEqual(len(self.server.clients), 4)
+
+    def test_cache(self):
+        first = self.fetcher()
+        first.monster_indexes(seed.CHALLENGE_RATINGS)
+        self.assertEqual(first.stats['not_modified'], 0)
+
+        second = self.fetcher()
+        indexes = second.monster_indexes(seed.CHALLENGE_RATINGS)
+
+        self.assertEqual(second.stats['downloaded'], 0)
+        self.assertEqual(second.stats['not_modified'], len(seed.CHALLENGE_RATINGS))
+        self.assertIn("wolf", indexes)
+
+    def test_checkpoint(self):
+        path = os.path.join(self.cache_dir, "checkpoint.txt")
+
+        checkpoint = Checkpoint(path)
+        checkpoint.add("wolf")
+
+        self.assertIn("wolf", Checkpoint(path))
+        self.assertNotIn("skeleton", Checkpoint(path))
+
+    def test_seed_resume(self):
+        LegendaryAction.query.delete()
+        Action.query.delete()
+        SpecialAbility.query.delete()
+        Monster.query.delete()
+        db.session.commit()
+
+        checkpoint = Checkpoint(os.path.join(self.cache_dir, "checkpoint.txt"))
+        checkpoint.add("skeleton")
+
+        seed.get_all_monsters(self.fetcher(), checkpoint)
+
+        names = sorted(m.name for m in Monster.query.all())
+        self.assertEqual(names, ["Adult Red Dragon", "Wolf"])
+
+        dragon = Monster.query.filter_by(name="Adult Red Dragon").one()
+        self.assertEqual(dragon.actions[0].usage, "(Recharge 5-6)")
+        self.assertEqual(len(dragon.legendary_actions), 1)
+
+        # a second pass has nothing left to store
+        self.server.paths.clear()
+        seed.get_all_monsters(self.fetcher(), checkpoint)
+
+        self.assertEqual(Monster.query.count(), 2)
+        self.assertFalse(any(p.startswith("/api/monsters/") for p in self.server.paths))
+
+    def test_sync_upgrades_schema(self):
+        """a sync adds the columns and indexes an older monsters table lacks"""
+
+        LegendaryAction.query.delete()
+        Action.query.delete()
+        SpecialAbility.query.delete()
+        Monster.query.delete()
+        db.session.execute(text('ALTER TABLE monsters DROP COLUMN "index", '
+                                'DROP COLUMN content_hash'))
+        db.session.execute(text("DROP INDEX ix_monsters_name_id"))
+        db.session.commit()
+
+        stats = seed.sync_monster_db(self.fetcher())
+
+        self.assertEqual(stats['added'], 3)
+        self.assertEqual(Monster.query.filter_by(index="wolf").one().name, "Wolf")
+
+        indexes = {i['name'] for i in inspect(db.engine).get_indexes('monsters')}
+        self.assertIn('ix_monsters_name_id', indexes)
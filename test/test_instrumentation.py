@@ -0,0 +1,90 @@
+"""
+    SQL instrumentation tests
+"""
+
+from unittest import TestCase
+
+from models import db, User, Encounter
+from instrumentation import QueryStats, QueryBudgetExceeded, fingerprint
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app, CURR_USER_KEY
+
+db.create_all()
+
+
+class InstrumentationTestCase(TestCase):
+    """Test per-request query recording and budgets"""
+
+    def setUp(self):
+        Encounter.query.delete()
+        User.query.delete()
+
+        u1 = User.signup("test1@test.com", "username_abc", "password")
+        u1.id = 777
+        db.session.commit()
+
+        self.client = app.test_client()
+
+        app.config['SQL_STATS_HEADERS'] = True
+        app.config['SQL_BUDGET_STRICT'] = True
+
+    def tearDown(self):
+        app.config['SQL_STATS_HEADERS'] = False
+        app.config['SQL_BUDGET_STRICT'] = False
+
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT *  FROM actions\n WHERE id = 12 AND name = 'it''s'"),
+            "SELECT * FROM actions WHERE id = ? AND name = ?"
+        )
+
+    def test_repeated(self):
+        stats = QueryStats()
+
+        for i in range(6):
+            stats.record(f"SELECT * FROM actions WHERE monster_id = {i}", 0.001)
+        stats.record("SELECT * FROM monsters", 0.001)
+
+        self.assertEqual(stats.count, 7)
+        self.assertEqual(stats.repeated(5),
+                         {"SELECT * FROM actions WHERE monster_id = ?": 6})
+
+    def test_headers(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 777
+
+            resp = c.get("/users/777")
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertLessEqual(int(resp.headers['X-Query-Count']), 3)
+            self.assertTrue(resp.headers['X-Query-Time'].endswith('ms'))
+
+    def test_budget(self):
+        view = app.view_functions['main.get_encounter_by_id']
+        budget = view.query_budget
+
+        try:
+            view.query_budget = 0
+            app.config['PROPAGATE_EXCEPTIONS'] = True
+
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/encounters/1")
+        finally:
+            view.query_budget = budget
+            app.config['PROPAGATE_EXCEPTIONS'] = None
+
+    def test_stats_endpoint(self):
+        with self.client as c:
+            c.get("/api/encounters/1")
+            resp = c.get("/_stats")
+
+            self.assertIn('main.get_encounter_by_id', resp.json['queries'])
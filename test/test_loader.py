@@ -0,0 +1,139 @@
+"""
+    Monster loader tests
+"""
+
+from unittest import TestCase
+
+from models import (db, Monster, SpecialAbility, Action, LegendaryAction,
+                    CatalogVersion)
+from loader import MonsterLoader, MonsterSync, parse_usage
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+
+db.create_all()
+
+
+def api_monster(index, name, actions=()):
+    return {
+        "index": index, "name": name, "size": "Medium", "type": "beast",
+        "subtype": None, "armor_class": 12, "hit_points": 20, "hit_dice": "3d8",
+        "strength": 10, "dexterity": 10, "constitution": 10,
+        "intelligence": 10, "wisdom": 10, "charisma": 10,
+        "challenge_rating": 1, "xp": 200,
+        "actions": [{"name": a, "desc": f"{name} uses {a}."} for a in actions],
+    }
+
+
+class LoaderTestCase(TestCase):
+    """Test batched monster loading"""
+
+    def setUp(self):
+        LegendaryAction.query.delete()
+        Action.query.delete()
+        SpecialAbility.query.delete()
+        Monster.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_parse_usage(self):
+        self.assertEqual(parse_usage({'type': 'per day', 'times': 3}), "(3/Day)")
+        self.assertEqual(parse_usage({'type': 'recharge on roll', 'min_value': 6}),
+                         "(Recharge 6)")
+        self.assertEqual(parse_usage({'type': 'recharge after rest',
+                                      'rest_types': ['short', 'long']}),
+                         "(Recharges after a Short or Long Rest)")
+        self.assertIsNone(parse_usage({'type': 'at will'}))
+
+    def test_batches(self):
+        before = CatalogVersion.current()
+
+        loader = MonsterLoader(batch_size=2)
+
+        self.assertEqual(loader.add("wolf", api_monster("wolf", "Wolf", ["Bite"])), [])
+        self.assertEqual(loader.add("bear", api_monster("bear", "Bear", ["Bite", "Claw"])),
+                         ["wolf", "bear"])
+        self.assertEqual(loader.add("ghost", None), [])
+        loader.add("bat", api_monster("bat", "Bat"))
+        loader.add("owl", api_monster("owl", "Owl"))
+        self.assertEqual(loader.flush(), ["owl"])
+
+        self.assertEqual(Monster.query.count(), 4)
+        self.assertGreater(CatalogVersion.current(), before)
+
+        bear = Monster.query.get(loader.ids["bear"])
+        self.assertEqual(sorted(a.name for a in bear.actions), ["Bite", "Claw"])
+
+    def sync(self, *monsters):
+        sync = MonsterSync(batch_size=2)
+        for m in monsters:
+            sync.add(m["index"], m)
+        return sync.finish()
+
+    def test_sync(self):
+        wolf = api_monster("wolf", "Wolf", ["Bite"])
+        bear = api_monster("bear", "Bear", ["Claw"])
+
+        stats = self.sync(wolf, bear)
+        self.assertEqual(stats['added'], 2)
+
+        wolf_id = Monster.query.filter_by(index="wolf").one().id
+        version = CatalogVersion.current()
+
+        # nothing changed: nothing is written
+        stats = self.sync(wolf, bear)
+        self.assertEqual(stats['unchanged'], 2)
+        self.assertEqual(CatalogVersion.current(), version)
+
+        # the wolf changes and the bear disappears
+        wolf = api_monster("wolf", "Wolf", ["Bite", "Howl"])
+        stats = self.sync(wolf)
+
+        self.assertEqual((stats['updated'], stats['deleted']), (1, 1))
+        self.assertGreater(CatalogVersion.current(), version)
+
+        wolf = Monster.query.filter_by(index="wolf").one()
+        self.assertEqual(wolf.id, wolf_id)
+        self.assertEqual(sorted(a.name for a in wolf.actions), ["Bite", "Howl"])
+        self.assertEqual(Monster.query.count(), 1)
+        self.assertEqual(Action.query.count(), 2)
+
+    def test_sync_adopts_unindexed(self):
+        """monsters seeded before they had an index are matched by name"""
+
+        loader = MonsterLoader()
+        loader.add("wolf", api_monster("wolf", "Wolf"))
+        loader.flush()
+
+        Monster.query.update({'index': None, 'content_hash': None})
+        db.session.commit()
+
+        stats = self.sync(api_monster("wolf", "Wolf"))
+
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(Monster.query.get(loader.ids["wolf"]).index, "wolf")
+
+    def test_sync_deletes_unadopted(self):
+        """old monsters that no listed monster adopts are deleted"""
+
+        loader = MonsterLoader()
+        loader.add("wolf", api_monster("wolf", "Wolf"))
+        loader.add("bear", api_monster("bear", "Bear", ["Claw"]))
+        loader.flush()
+
+        Monster.query.update({'index': None, 'content_hash': None})
+        db.session.commit()
+
+        stats = self.sync(api_monster("wolf", "Wolf"))
+
+        self.assertEqual((stats['updated'], stats['deleted']), (1, 1))
+        self.assertEqual([m.name for m in Monster.query.all()], ["Wolf"])
+        self.assertEqual(Action.query.count(), 0)
+
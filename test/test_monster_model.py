@@ -10,6 +10,7 @@ from models import db, Monster, SpecialAbility, Action, LegendaryAction
 
 import os
 os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
 
 from app import app
 
@@ -11,6 +11,7 @@ from flask import request
 
 import os
 os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
 
 from app import app
 
@@ -153,4 +154,102 @@ class MonsterViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
 
             # check for monster data
-            self.assertIn( f"Challenge {self.m1.cr()} ({self.m1.xp} XP)", str(resp.data))
\ No newline at end of file
+            self.assertIn( f"Challenge {self.m1.cr()} ({self.m1.xp} XP)", str(resp.data))
+
+    def test_api_paginate(self):
+        with self.client as c:
+            resp = c.get("/api/monsters", query_string={'limit': 1})
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['total'], 2)
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Python"])
+            self.assertIsNotNone(resp.json['next'])
+
+            resp = c.get("/api/monsters",
+                         query_string={'limit': 1, 'after': resp.json['next']})
+
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Unicorn"])
+            self.assertIsNone(resp.json['next'])
+
+    def test_api_sort(self):
+        with self.client as c:
+            resp = c.get("/api/monsters", query_string={'sort': '-cr', 'limit': 1})
+
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Unicorn"])
+
+            resp = c.get("/api/monsters",
+                         query_string={'sort': '-cr', 'limit': 1, 'after': resp.json['next']})
+
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Python"])
+
+            resp = c.get("/api/monsters", query_string={'sort': 'weight'})
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.get("/api/monsters", query_string={'limit': 1, 'after': 'garbage'})
+            self.assertEqual(resp.status_code, 400)
+
+    def test_api_name_search(self):
+        with self.client as c:
+            resp = c.get("/api/monsters", query_string={'q': 'corn'})
+
+            self.assertNotIn("Python", str(resp.data))
+            self.assertIn("Unicorn", str(resp.data))
+
+    def test_api_name_search_ranked(self):
+        with self.client as c:
+            # a typo still finds the monster
+            resp = c.get("/api/monsters", query_string={'q': 'unicron'})
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Unicorn"])
+
+            resp = c.get("/api/monsters", query_string={'q': 'zzzzzz'})
+            self.assertEqual(resp.json['monsters'], [])
+
+    def test_api_name_search_punctuation(self):
+        with self.client as c:
+            # nothing left to search for: the plain listing
+            resp = c.get("/api/monsters", query_string={'q': ' -- ', 'limit': 1})
+            self.assertEqual(resp.json, c.get("/api/monsters?limit=1").json)
+
+    def test_api_conditional_get(self):
+        with self.client as c:
+            resp = c.get("/api/monsters")
+            etag = resp.headers['ETag']
+
+            self.assertIn('max-age', resp.headers['Cache-Control'])
+            self.assertIn('Last-Modified', resp.headers)
+
+            # same catalog version: not modified
+            resp = c.get("/api/monsters", headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+            self.assertEqual(resp.data, b'')
+
+            resp = c.get(f"/api/monsters/{self.m1_id}", headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 304)
+
+            # changing monster data changes the version
+            Monster.query.get(self.m1_id).hit_points = 51
+            db.session.commit()
+
+            resp = c.get("/api/monsters", headers={'If-None-Match': etag})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotEqual(resp.headers['ETag'], etag)
+
+    def test_api_missing_monster(self):
+        with self.client as c:
+            resp = c.get("/api/monsters/999999")
+
+            self.assertEqual(resp.status_code, 404)
+            self.assertNotIn('ETag', resp.headers)
+
+    def test_api_monster_page_cached(self):
+        with self.client as c:
+            before = c.get("/_stats").json['stat_blocks']
+
+            first = c.get(f"/api/monsters/{self.m2_id}")
+            second = c.get(f"/api/monsters/{self.m2_id}")
+
+            self.assertEqual(first.data, second.data)
+
+            after = c.get("/_stats").json['stat_blocks']
+            self.assertEqual(after['hits'], before['hits'] + 1)
+            self.assertEqual(after['misses'], before['misses'] + 1)
@@ -0,0 +1,101 @@
+"""
+    Password hashing tests
+"""
+
+import threading
+from unittest import TestCase
+
+from models import db, User
+from passwords import HasherBusy, PasswordHasher
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+
+db.create_all()
+
+# Don't have WTForms use CSRF
+app.config["WTF_CSRF_ENABLED"] = False
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test hashing on the bounded pool"""
+
+    def setUp(self):
+        User.query.delete()
+        db.session.commit()
+
+        # a fresh hasher for the app, as the tests reconfigure it
+        self.hasher = PasswordHasher(app)
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        return res
+
+    def test_hash_and_check(self):
+        hashed = self.hasher.hash("password")
+
+        self.assertTrue(hashed.startswith("$2b$04$"))
+        self.assertTrue(self.hasher.check(hashed, "password"))
+        self.assertFalse(self.hasher.check(hashed, "passw0rd"))
+        self.assertFalse(self.hasher.needs_rehash(hashed))
+
+        with self.assertRaises(ValueError):
+            self.hasher.hash("")
+
+    def test_upgrade_on_login(self):
+        User.signup("email1@email.com", "testuser1", "password")
+        db.session.commit()
+
+        self.hasher.rounds = 5
+
+        user = User.authenticate("testuser1", "password")
+        db.session.commit()
+
+        self.assertTrue(User.query.get(user.id).password.startswith("$2b$05$"))
+        self.assertTrue(User.authenticate("testuser1", "password"))
+
+        # a wrong password never touches the stored hash
+        self.assertFalse(User.authenticate("testuser1", "wrong"))
+
+    def test_busy(self):
+        busy = PasswordHasher()
+        busy.configure(workers=1, queue=1)
+
+        started, release = threading.Event(), threading.Event()
+
+        def hold():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=busy.run, args=(hold,))
+        thread.start()
+        started.wait(5)
+
+        try:
+            with self.assertRaises(HasherBusy):
+                busy.hash("password")
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertTrue(busy.check(busy.hash("password"), "password"))
+
+    def test_login_when_busy(self):
+        User.signup("email1@email.com", "testuser1", "password")
+        db.session.commit()
+
+        self.hasher.configure(workers=1, queue=1)
+        self.hasher.slots.acquire()
+
+        try:
+            with app.test_client() as c:
+                resp = c.post("/login", data={"username": "testuser1",
+                                              "password": "password"})
+                self.assertEqual(resp.status_code, 503)
+                self.assertEqual(resp.headers['Retry-After'], "5")
+        finally:
+            self.hasher.slots.release()
@@ -0,0 +1,90 @@
+"""
+    Connection pool settings and statistics tests
+"""
+
+from unittest import TestCase
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError, TimeoutError
+
+from models import db
+from pooling import MeteredQueuePool, engine_options, pool_stats, watch_transactions
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+
+db.create_all()
+
+
+class PoolingTestCase(TestCase):
+    """Test the pool options and the pool statistics"""
+
+    def config(self, **overrides):
+        return dict(app.config, **overrides)
+
+    def engine(self, **overrides):
+        config = self.config(**overrides)
+        engine = create_engine(config['SQLALCHEMY_DATABASE_URI'], **engine_options(config))
+        watch_transactions(engine, config)
+        self.addCleanup(engine.dispose)
+        return engine
+
+    def test_options(self):
+        options = engine_options(self.config(DB_STATEMENT_TIMEOUT=1500))
+
+        self.assertIs(options['poolclass'], MeteredQueuePool)
+        self.assertEqual(options['pool_size'], app.config['DB_POOL_SIZE'])
+        self.assertEqual(options['connect_args'], {'options': "-c statement_timeout=1500"})
+
+        options = engine_options(self.config(DB_STATEMENT_TIMEOUT=1500, DB_PGBOUNCER=True))
+        self.assertNotIn('connect_args', options)
+
+        options = engine_options(self.config(DB_PGBOUNCER=True),
+                                 "postgresql+asyncpg:///monsters-test")
+        self.assertEqual(options['connect_args'], {'statement_cache_size': 0,
+                                                   'prepared_statement_cache_size': 0})
+        self.assertNotIn('poolclass', options)
+
+        self.assertEqual(engine_options(self.config(), "sqlite:///monsters.db"), {})
+
+    def test_statement_timeout(self):
+        for pgbouncer in (False, True):
+            engine = self.engine(DB_STATEMENT_TIMEOUT=1500, DB_PGBOUNCER=pgbouncer)
+
+            with engine.begin() as conn:
+                self.assertEqual(conn.exec_driver_sql("SHOW statement_timeout").scalar(),
+                                 "1500ms")
+
+    def test_pool_stats(self):
+        engine = self.engine(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT=0.05)
+
+        with engine.connect():
+            stats = pool_stats(engine)
+            self.assertEqual((stats['checked_out'], stats['checkouts']), (1, 1))
+
+            with self.assertRaises(TimeoutError):
+                engine.connect()
+
+        stats = pool_stats(engine)
+        self.assertEqual(stats['checked_out'], 0)
+        self.assertEqual((stats['waits'], stats['timeouts']), (1, 1))
+        self.assertGreater(stats['wait_ms_max'], 0)
+
+    def test_failed_connect_is_not_a_timeout(self):
+        engine = self.engine(SQLALCHEMY_DATABASE_URI="postgresql:///monsters-missing")
+
+        with self.assertRaises(OperationalError):
+            engine.connect()
+
+        self.assertEqual(pool_stats(engine)['timeouts'], 0)
+
+    def test_stats_endpoint(self):
+        with app.test_client() as c:
+            c.get("/api/monsters")
+            resp = c.get("/_stats")
+
+            self.assertEqual(resp.json['pool']['class'], "MeteredQueuePool")
+            self.assertGreater(resp.json['pool']['checkouts'], 0)
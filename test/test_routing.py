@@ -0,0 +1,115 @@
+"""
+    Read-replica routing tests, with two SQLite files as primary and replica
+"""
+
+import os
+import tempfile
+from unittest import TestCase
+
+from sqlalchemy.orm import Session
+
+from models import db, CatalogVersion, Encounter, Monster, User
+from routing import replica_reads
+
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app, create_app, CURR_USER_KEY
+from config import TestConfig
+from test_catalog import make_monster
+
+
+class RoutingTestCase(TestCase):
+    """Test that marked views read from the replica, and writes stick"""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+        class Config(TestConfig):
+            SQLALCHEMY_DATABASE_URI = f"sqlite:///{self.dir.name}/primary.db"
+            REPLICA_DATABASE_URL = f"sqlite:///{self.dir.name}/replica.db"
+            WTF_CSRF_ENABLED = False
+
+        self.app = create_app(Config)
+
+        @self.app.route("/_first_monster")
+        @replica_reads
+        def first_monster():
+            return db.session.query(Monster.name).order_by(Monster.id).scalar()
+
+        with self.app.app_context():
+            db.create_all()
+            db.Model.metadata.create_all(db.get_engine(self.app, 'replica'))
+
+            db.session.add(make_monster(1, "Primary Wolf", "Medium", "beast", 0.25, 50))
+            db.session.add(User(id=5, username="router", email="router@test.com",
+                                password="HASHED"))
+            db.session.commit()
+
+            with Session(db.get_engine(self.app, 'replica')) as replica:
+                replica.add(make_monster(1, "Replica Wolf", "Medium", "beast", 0.25, 50))
+                replica.commit()
+
+    def tearDown(self):
+        res = super().tearDown()
+        with self.app.app_context():
+            db.session.remove()
+            db.get_engine(self.app).dispose()
+            db.get_engine(self.app, 'replica').dispose()
+        self.dir.cleanup()
+        return res
+
+    def test_marked_views(self):
+        for endpoint in ('main.root', 'main.get_monsters', 'main.get_monster_by_id'):
+            self.assertTrue(self.app.view_functions[endpoint].replica_reads)
+
+        self.assertFalse(hasattr(self.app.view_functions['main.save_encounter'],
+                                 'replica_reads'))
+
+    def test_reads_go_to_replica(self):
+        with self.app.test_client() as c:
+            self.assertEqual(c.get("/_first_monster").data, b"Replica Wolf")
+
+    def test_stat_block_replica_behind(self):
+        with self.app.app_context():
+            with Session(db.get_engine(self.app, 'replica')) as replica:
+                replica.add(CatalogVersion(id=1, version=CatalogVersion.current()))
+                replica.commit()
+
+        with self.app.test_client() as c:
+            self.assertIn(b"Replica Wolf", c.get("/api/monsters/1").data)
+
+            # a catalog change the replica hasn't caught up with
+            with self.app.app_context():
+                CatalogVersion.bump()
+                db.session.commit()
+
+            self.assertIn(b"Primary Wolf", c.get("/api/monsters/1").data)
+
+    def test_catalog_from_primary(self):
+        with self.app.test_client() as c:
+            # /api/monsters reads from the replica, but the shared catalog doesn't
+            resp = c.get("/api/monsters")
+            self.assertEqual([m['name'] for m in resp.json['monsters']], ["Primary Wolf"])
+
+    def test_read_your_writes(self):
+        with self.app.test_client() as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = 5
+
+            resp = c.post("/users/5/save", json={
+                'heroes': '[{"num": 4, "lvl": 3}]',
+                'monsters': '[{"id": 1, "name": "Wolf", "cr": "1/4", "xp": 50, "num": 2}]',
+            })
+            self.assertEqual(resp.status_code, 200)
+
+            # the encounter went to the primary, and so do this user's reads
+            self.assertEqual(c.get("/_first_monster").data, b"Primary Wolf")
+
+            with self.app.app_context():
+                self.assertEqual(Encounter.query.count(), 1)
+
+            with c.session_transaction() as sess:
+                sess['primary_until'] = 0
+
+            self.assertEqual(c.get("/_first_monster").data, b"Replica Wolf")
@@ -0,0 +1,167 @@
+"""
+    Full-text search tests
+"""
+
+import time
+from unittest import TestCase
+
+from models import db, Monster, SpecialAbility, Action, LegendaryAction
+
+import os
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+from search import SearchError, install_search, mark, search_monsters
+from test_catalog import make_monster
+
+db.create_all()
+install_search(db.session)
+db.session.commit()
+
+
+class SearchTestCase(TestCase):
+    """Test searching monsters' abilities and actions"""
+
+    def setUp(self):
+        SpecialAbility.query.delete()
+        Action.query.delete()
+        LegendaryAction.query.delete()
+        Monster.query.delete()
+
+        wolf = make_monster(1, "Wolf", "Medium", "beast", 0.25, 50)
+        wolf.special_abilities.append(SpecialAbility(
+            name="Pack Tactics",
+            desc="The wolf has advantage on an attack roll against a creature "
+                 "if at least one of the wolf's allies is within 5 feet."))
+        wolf.actions.append(Action(
+            name="Bite", desc="Melee Weapon Attack: +4 to hit, one target."))
+
+        kobold = make_monster(2, "Kobold", "Small", "humanoid", 0.125, 25)
+        kobold.special_abilities.append(SpecialAbility(
+            name="Sunlight Sensitivity",
+            desc="While in sunlight, the kobold has disadvantage on attack rolls."))
+        kobold.special_abilities.append(SpecialAbility(
+            name="Pack Tactics",
+            desc="The kobold has advantage on an attack roll against a creature "
+                 "if at least one of the kobold's allies is within 5 feet."))
+
+        dragon = make_monster(3, "Red Dragon", "Huge", "dragon", 17, 18000)
+        dragon.actions.append(Action(
+            name="Fire Breath",
+            desc="The dragon exhales fire in a 60-foot cone. Each creature "
+                 "in that area must make a DC 21 Dexterity saving throw."))
+        dragon.legendary_actions.append(LegendaryAction(
+            name="Wing Attack",
+            desc="The dragon beats its wings. Each creature within 10 feet "
+                 "must succeed on a saving throw."))
+
+        db.session.add_all([wolf, kobold, dragon])
+        db.session.commit()
+
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_ranked_with_snippets(self):
+        total, results = search_monsters(db.session, "pack tactics")
+
+        self.assertEqual(total, 2)
+        # equal ranks are broken by name
+        self.assertEqual([r[0] for r in results], [2, 1])
+
+        matches = results[1][2]
+        self.assertEqual(matches[0]['kind'], 'special_ability')
+        self.assertEqual(matches[0]['name'], "Pack Tactics")
+
+        total, results = search_monsters(db.session, "fire breath")
+        self.assertEqual([r[0] for r in results], [3])
+        self.assertIn("exhales <mark>fire</mark>", results[0][2][0]['snippet'])
+
+        wolf = Monster.query.get(1)
+        wolf.actions[0].desc = "Melee Weapon Attack: [[see the bite]] rules."
+        db.session.commit()
+
+        _, results = search_monsters(db.session, "bite")
+        self.assertIn("[[see the <mark>bite</mark>]]", results[0][2][0]['snippet'])
+
+    def test_stemming_and_web_syntax(self):
+        _, results = search_monsters(db.session, "saving throws")
+        self.assertEqual([r[0] for r in results], [3])
+        # both the action and the legendary action match
+        self.assertEqual({m['kind'] for m in results[0][2]},
+                         {'action', 'legendary_action'})
+
+        _, results = search_monsters(db.session, '"attack roll" or dexterity')
+        self.assertEqual({r[0] for r in results}, {1, 2, 3})
+
+        # exclusions apply to each ability, not to the whole monster
+        _, results = search_monsters(db.session, "advantage -sunlight")
+        self.assertEqual([r[0] for r in results], [2, 1])
+
+    def test_filters(self):
+        _, results = search_monsters(db.session, "attack", min_cr=1)
+        self.assertEqual([r[0] for r in results], [3])
+
+        _, results = search_monsters(db.session, "attack", type="beast")
+        self.assertEqual([r[0] for r in results], [1])
+
+        _, results = search_monsters(db.session, "attack", size="Small")
+        self.assertEqual([r[0] for r in results], [2])
+
+        _, results = search_monsters(db.session, "attack", status="legendary")
+        self.assertEqual([r[0] for r in results], [3])
+
+        total, results = search_monsters(db.session, "attack", status="ordinary",
+                                         limit=1)
+        self.assertEqual(total, 2)
+        self.assertEqual(len(results), 1)
+
+    def test_no_text(self):
+        with self.assertRaises(SearchError):
+            search_monsters(db.session, "  ")
+
+    def test_mark(self):
+        self.assertEqual(mark("a \x02b\x03 & <c> [[d]]"),
+                         "a <mark>b</mark> &amp; &lt;c&gt; [[d]]")
+
+    def test_search_view(self):
+        resp = self.client.get("/api/monsters/search?text=advantage&type=beast")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers['Access-Control-Allow-Origin'], '*')
+
+        data = resp.json
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(data['monsters'][0]['name'], "Wolf")
+        self.assertEqual(data['monsters'][0]['cr'], "1/4")
+        self.assertEqual(data['monsters'][0]['matches'][0]['name'], "Pack Tactics")
+        self.assertIn("<mark>", data['monsters'][0]['matches'][0]['snippet'])
+
+    def test_search_view_stale_catalog(self):
+        store = app.extensions['catalog']
+        with app.app_context():
+            store.invalidate()
+            stale = store.get()
+
+        jackal = make_monster(4, "Jackal", "Small", "beast", 0, 10)
+        jackal.special_abilities.append(SpecialAbility(
+            name="Pack Tactics", desc="The jackal has advantage on an attack roll."))
+        db.session.add(jackal)
+        db.session.commit()
+
+        # as if another worker had added the jackal since this one's last check
+        store.catalog, store.checked = stale, time.monotonic()
+
+        resp = self.client.get("/api/monsters/search?text=pack+tactics")
+
+        self.assertEqual(resp.json['total'], 2)
+        self.assertEqual([m['name'] for m in resp.json['monsters']], ["Kobold", "Wolf"])
+
+    def test_search_view_errors(self):
+        self.assertEqual(self.client.get("/api/monsters/search").status_code, 400)
+
+        resp = self.client.get("/api/monsters/search?text=bite&min_cr=x")
+        self.assertEqual(resp.status_code, 400)
+        self.assertIn("min_cr", resp.json['error'])
@@ -0,0 +1,88 @@
+"""
+    Catalog snapshot tests
+"""
+
+from unittest import TestCase
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from models import (db, Monster, SpecialAbility, Action, LegendaryAction,
+                    CatalogVersion)
+from snapshot import SnapshotError, export_snapshot, import_snapshot
+
+os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
+
+from app import app
+from test_catalog import make_monster
+
+db.create_all()
+
+
+class SnapshotTestCase(TestCase):
+    """Test catalog export and import"""
+
+    def setUp(self):
+        LegendaryAction.query.delete()
+        Action.query.delete()
+        SpecialAbility.query.delete()
+        Monster.query.delete()
+
+        db.session.add_all([
+            make_monster(1, "Wolf", "Medium", "beast", 0.25, 50),
+            make_monster(2, "Dragon", "Medium", "beast", 17, 18000),
+        ])
+        db.session.add_all([
+            Action(monster_id=1, name="Bite", desc="Tab\there,\nnewline \\ slash"),
+            SpecialAbility(monster_id=2, name="Legendary Resistance",
+                           desc="Succeed instead.", usage="(3/Day)"),
+            LegendaryAction(monster_id=2, name="Tail Attack", desc="Tail."),
+        ])
+        db.session.commit()
+
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "catalog.ndjson.gz")
+
+    def tearDown(self):
+        res = super().tearDown()
+        db.session.rollback()
+        shutil.rmtree(self.dir)
+        return res
+
+    def test_round_trip(self):
+        self.assertEqual(export_snapshot(self.path), 2)
+
+        with self.assertRaises(SnapshotError):
+            import_snapshot(self.path)
+
+        before = CatalogVersion.current()
+        self.assertEqual(import_snapshot(self.path, replace=True, batch_size=1), 2)
+        self.assertGreater(CatalogVersion.current(), before)
+
+        wolf = Monster.query.get(1)
+        self.assertEqual(wolf.name, "Wolf")
+        self.assertEqual(wolf.actions[0].desc, "Tab\there,\nnewline \\ slash")
+
+        dragon = Monster.query.get(2)
+        self.assertEqual(dragon.special_abilities[0].usage, "(3/Day)")
+        self.assertIsNone(dragon.subtype)
+        self.assertEqual(len(dragon.legendary_actions), 1)
+
+        # the id sequence moved past the imported ids
+        db.session.add(make_monster(None, "Bat", "Medium", "beast", 0, 10))
+        db.session.commit()
+        self.assertEqual(Monster.query.filter_by(name="Bat").one().id, 3)
+
+    def test_bad_version(self):
+        with gzip.open(self.path, "wt") as f:
+            f.write(json.dumps({'format': "combat-kitchen-catalog", 'version': 99}) + "\n")
+
+        with self.assertRaises(SnapshotError):
+            import_snapshot(self.path, replace=True)
+
+        # a failed import leaves the catalog alone
+        self.assertEqual(Monster.query.count(), 2)
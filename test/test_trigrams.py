@@ -0,0 +1,66 @@
+"""
+    Trigram name index tests
+"""
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from trigrams import TrigramIndex, edit_distance, normalize
+
+
+class TrigramIndexTestCase(TestCase):
+    """Test the monster name index"""
+
+    def setUp(self):
+        self.names = [
+            "Goblin",
+            "Goblin Boss",
+            "Hobgoblin",
+            "Adult Red Dragon",
+            "Red Dragon Wyrmling",
+            "Dragon Turtle",
+            "Gnoll",
+        ]
+        self.index = TrigramIndex(self.names)
+        self.all = list(range(len(self.names)))
+
+    def search(self, query, rows=None):
+        rows, scores = self.index.search(query, self.all if rows is None else rows)
+        ranked = sorted(zip(scores.tolist(), rows.tolist()))
+        return [self.names[r] for _, r in ranked]
+
+    def test_normalize(self):
+        self.assertEqual(normalize("  Half-Red  DRAGON "), "half red dragon")
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("goblin", "goblim", 2), 1)
+        self.assertEqual(edit_distance("goblin", "gnoll", 2), 3)
+
+    def test_ranking(self):
+        """exact, then prefix, then word prefix, then substring"""
+
+        self.assertEqual(self.search("goblin"),
+                         ["Goblin", "Goblin Boss", "Hobgoblin"])
+
+        self.assertEqual(self.search("dragon"),
+                         ["Dragon Turtle", "Adult Red Dragon", "Red Dragon Wyrmling"])
+
+    def test_short_query(self):
+        self.assertEqual(self.search("gn"), ["Gnoll"])
+        self.assertEqual(self.search("tu"), ["Dragon Turtle"])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.search("goblim"), ["Goblin", "Goblin Boss"])
+        self.assertEqual(self.search("red dragn"),
+                         ["Adult Red Dragon", "Red Dragon Wyrmling"])
+
+    def test_rows_filter(self):
+        self.assertEqual(self.search("goblin", rows=[2, 6]), ["Hobgoblin"])
+
+    def test_short_words(self):
+        """words too short for inner trigrams don't make every name a candidate"""
+
+        with patch.object(TrigramIndex, 'score', wraps=self.index.score) as score:
+            self.search("go bo")
+
+        self.assertEqual(score.call_count, 1)
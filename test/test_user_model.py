@@ -10,6 +10,7 @@ from sqlalchemy.exc import IntegrityError, PendingRollbackError
 
 import os
 os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
 
 from app import app
 
@@ -7,10 +7,14 @@ from unittest import TestCase
 from models import db, User, Encounter
 
 # from sqlalchemy.exc import IntegrityError, PendingRollbackError
-from flask import request
+from flask import g, request
+import csv
+import io
+import json
 
 import os
 os.environ["DATABASE_URL"] = "postgresql:///monsters-test"
+os.environ["APP_CONFIG"] = "test"
 
 from app import app, CURR_USER_KEY
 
@@ -87,3 +91,230 @@ class UserViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             
             self.assertIn('username_abc', str(resp.data))
+
+    def test_anonymous_api_skips_user_query(self):
+        """catalog APIs never load the logged-in user"""
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            c.get("/api/monsters")
+            self.assertNotIn('_current_user', g)
+
+    def test_cached_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            c.get(f"/users/{self.u1_id}")
+            self.assertIsNotNone(app.extensions['users'].cache.get(self.u1_id))
+
+            # renaming the user drops the cached row
+            user = User.query.get(self.u1_id)
+            user.username = "username_xyz"
+            db.session.commit()
+            self.assertIsNone(app.extensions['users'].cache.get(self.u1_id))
+
+            resp = c.get(f"/users/{self.u1_id}")
+            self.assertIn('username_xyz', str(resp.data))
+
+    def test_logout_forgets_user(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            c.get(f"/users/{self.u1_id}")
+            c.get("/logout")
+
+            self.assertIsNone(app.extensions['users'].cache.get(self.u1_id))
+
+            resp = c.get(f"/users/{self.u1_id}")
+            self.assertEqual(resp.status_code, 302)
+
+    def test_user_page_pagination(self):
+        app.config['USER_PAGE_SIZE'] = 2
+
+        try:
+            for i in range(3):
+                db.session.add(Encounter(
+                    user_id=self.u1_id,
+                    heroes='[{"num":"4","lvl":"1"}]',
+                    monsters=f'[{{"id":{i},"name":"Monster {i}","cr":"1/4","xp":50,"num":1}}]'
+                ))
+            db.session.commit()
+
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.u1_id
+
+                resp = c.get(f"/users/{self.u1_id}")
+                html = str(resp.data)
+
+                # newest first
+                self.assertIn('Monster 2', html)
+                self.assertIn('Monster 1', html)
+                self.assertNotIn('Monster 0', html)
+                self.assertIn('Older encounters', html)
+
+                older = Encounter.query.filter_by(user_id=self.u1_id) \
+                    .order_by(Encounter.id).all()[1]
+                resp = c.get(f"/users/{self.u1_id}?before={older.id}")
+                html = str(resp.data)
+
+                self.assertIn('Monster 0', html)
+                self.assertNotIn('Monster 1', html)
+                self.assertNotIn('Older encounters', html)
+        finally:
+            app.config['USER_PAGE_SIZE'] = 25
+
+    def test_user_page_without_summary(self):
+        for i in range(3):
+            db.session.add(Encounter(
+                user_id=self.u1_id,
+                heroes='[{"num":"4","lvl":"1"}]',
+                monsters=f'[{{"id":{i},"name":"Monster {i}","cr":"1/4","xp":50,"num":1}}]'
+            ))
+        db.session.commit()
+
+        # as if saved before the summary column existed
+        Encounter.query.update({'summary': None})
+        db.session.commit()
+
+        app.config['SQL_STATS_HEADERS'] = True
+
+        try:
+            with self.client as c:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.u1_id
+
+                resp = c.get(f"/users/{self.u1_id}")
+
+                self.assertIn('Encounter #', str(resp.data))
+                self.assertLessEqual(int(resp.headers['X-Query-Count']), 3)
+        finally:
+            app.config['SQL_STATS_HEADERS'] = False
+
+    def test_save(self):
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post(f"/users/{self.u1_id}/save", json={
+                "heroes": '[{"num":"4","lvl":"1"}]',
+                "monsters": '[{"id":72,"name":"Skeleton","cr":"1/4","xp":50,"num":2}]'})
+            self.assertEqual(resp.status_code, 200)
+
+            resp = c.post(f"/users/{self.u1_id}/save", json={
+                "heroes": '[{"num":"4","lvl":"1"}]',
+                "monsters": '[{"id":72,"name":"Skeleton","xp":50,"num":99999999999}]'})
+            self.assertEqual(resp.status_code, 400)
+
+            resp = c.post(f"/users/{self.u1_id}/save", json={
+                "heroes": '[{"num":"4","lvl":"1"}]',
+                "monsters": '[{"id":72,"name":"Skeleton","cr":"1/2 or so","xp":50,"num":2}]'})
+            self.assertEqual(resp.status_code, 400)
+
+            self.assertEqual(Encounter.query.filter_by(user_id=self.u1_id).count(), 1)
+
+    def test_bulk_save(self):
+        encounters = [
+            {"heroes": [{"num": "4", "lvl": "1"}],
+             "monsters": [{"id": 72, "name": "Skeleton", "cr": "1/4", "xp": 50, "num": 2}]},
+            {"heroes": [{"num": "4", "lvl": "99"}], "monsters": []},
+            {"heroes": '[{"num":"2","lvl":"3"}]',
+             "monsters": '[{"id":4,"name":"Bat","cr":0,"xp":10,"num":5}]'},
+        ]
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post(f"/users/{self.u1_id}/encounters/bulk", json=encounters)
+
+            self.assertEqual(resp.json['saved'], 2)
+            self.assertEqual([e['index'] for e in resp.json['errors']], [1])
+
+            saved = Encounter.query.get(resp.json['ids'][0])
+            self.assertEqual(saved.summary, 'Heroes x 4 vs. Skeleton x 2')
+            self.assertEqual(saved.difficulty, 'EASY')
+            self.assertEqual(saved.serialize()['monsters'][0]['name'], 'Skeleton')
+
+    def test_bulk_save_out_of_range(self):
+        party = [{"num": 4, "lvl": 1}]
+        encounters = [
+            {"heroes": party, "monsters": [{"name": "Bat", "xp": 10, "num": 10**20}]},
+            {"heroes": party, "monsters": [{"name": "Bat", "xp": 10, "num": 2**40}]},
+            {"heroes": party, "monsters": [{"id": 2**40, "name": "Bat", "xp": 10, "num": 1}]},
+            {"heroes": party, "monsters": [{"name": "Bat", "cr": "1/2 or so", "xp": 10,
+                                            "num": 1}]},
+            {"heroes": party, "monsters": [{"id": 4, "name": "Bat", "xp": 10, "num": 1}]},
+        ]
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post(f"/users/{self.u1_id}/encounters/bulk", json=encounters)
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertEqual(resp.json['saved'], 1)
+            self.assertEqual([e['index'] for e in resp.json['errors']], [0, 1, 2, 3])
+
+    def test_bulk_save_ndjson(self):
+        body = "\n".join([
+            '{"heroes": [{"num": 1, "lvl": 1}], "monsters": []}',
+            '{"heroes": [',
+            '',
+            '{"heroes": [], "monsters": [{"name": "Bat", "xp": 10, "num": 1}]}',
+        ])
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.post(f"/users/{self.u1_id}/encounters/bulk", data=body,
+                          content_type="application/x-ndjson")
+
+            self.assertEqual(resp.json['saved'], 2)
+            self.assertEqual(resp.json['errors'],
+                             [{'index': 1, 'error': 'invalid JSON'}])
+
+    def test_bulk_save_unauthorized(self):
+        with self.client as c:
+            resp = c.post(f"/users/{self.u1_id}/encounters/bulk", json=[])
+            self.assertEqual(resp.status_code, 401)
+
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u2_id
+
+            resp = c.post(f"/users/{self.u1_id}/encounters/bulk", json=[])
+            self.assertEqual(resp.status_code, 403)
+
+    def test_export(self):
+        for name in ("Bat", "Wolf"):
+            db.session.add(Encounter(
+                user_id=self.u1_id,
+                heroes='[{"num":"4","lvl":"1"}]',
+                monsters=f'[{{"id":9999,"name":"{name}","cr":"1/4","xp":50,"num":1}}]'
+            ))
+        db.session.commit()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.u1_id
+
+            resp = c.get(f"/users/{self.u1_id}/encounters/export")
+            records = [json.loads(line) for line in resp.data.splitlines()]
+
+            self.assertEqual(resp.mimetype, "application/x-ndjson")
+            self.assertEqual([r['monsters'][0]['name'] for r in records],
+                             ["Bat", "Wolf"])
+            self.assertEqual(records[0]['heroes'], [{"num": "4", "lvl": "1"}])
+
+            resp = c.get(f"/users/{self.u1_id}/encounters/export?format=csv")
+            rows = list(csv.DictReader(io.StringIO(resp.data.decode())))
+
+            self.assertEqual(len(rows), 2)
+            self.assertEqual(rows[1]['summary'], "Heroes x 4 vs. Wolf x 1")
+
@@ -0,0 +1,194 @@
+"""
+    Trigram index over monster names.
+
+    Works like Postgres' pg_trgm: every word of a name is padded with
+    spaces and cut into three-letter pieces, and each trigram points at
+    the names containing it. A search only looks at names that share
+    enough trigrams with the query, then ranks them (queries too short to
+    have trigrams are looked up in a sorted word list and only match by
+    prefix):
+
+        0  exact name
+        1  name starts with the query
+        2  a word of the name starts with the query
+        3  name contains the query
+        4+ fuzzy match, within a small edit distance of the query
+"""
+
+import math
+import re
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+
+EXACT, PREFIX, WORD_PREFIX, SUBSTRING, FUZZY = range(5)
+
+# share of the query's trigrams a name needs before it is even considered
+MIN_SHARED = 0.4
+
+
+def normalize(text):
+    """Lower-case and reduce to words of letters and digits"""
+
+    return " ".join(re.findall(r"[^\W_]+", text.casefold()))
+
+
+def trigrams(text):
+    """Padded trigrams of every word in already-normalized text"""
+
+    result = set()
+
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    return result
+
+
+def inner_trigrams(text):
+    """Unpadded trigrams; any name containing `text` contains all of these"""
+
+    return {text[i:i + 3] for i in range(len(text) - 2)
+            if " " not in text[i:i + 3]}
+
+
+def max_edits(text):
+    """How many typos a query of this length tolerates"""
+
+    return 1 if len(text) <= 5 else 2
+
+
+def edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 if it exceeds limit"""
+
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+
+    return min(previous[-1], limit + 1)
+
+
+class TrigramIndex:
+    """Trigram postings for a list of names; row i is names[i]"""
+
+    def __init__(self, names):
+        self.names = [normalize(n) for n in names]
+
+        postings = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for t in trigrams(name):
+                postings[t].append(i)
+
+        self.postings = {t: np.array(rows, dtype=np.int32)
+                         for t, rows in postings.items()}
+
+        # every word of every name, sorted, for prefix lookups
+        words = sorted((word, i, position)
+                       for i, name in enumerate(self.names)
+                       for position, word in enumerate(name.split()))
+
+        self.words = [w[0] for w in words]
+        self.word_rows = np.array([w[1] for w in words], dtype=np.intp)
+        self.word_positions = np.array([w[2] for w in words], dtype=np.intp)
+        self.lengths = np.array([len(n) for n in self.names], dtype=np.intp)
+
+    def shared(self, grams):
+        """Count, for every row, how many of `grams` its name contains"""
+
+        lists = [self.postings[t] for t in grams if t in self.postings]
+        if not lists:
+            return np.zeros(len(self.names), dtype=np.intp)
+
+        return np.bincount(np.concatenate(lists), minlength=len(self.names))
+
+    def score(self, name, query):
+        """Rank of one name against a query, or None if it doesn't match"""
+
+        if name == query:
+            return EXACT
+        if name.startswith(query):
+            return PREFIX
+        if (" " + name).find(" " + query) >= 0:
+            return WORD_PREFIX
+        if query in name:
+            return SUBSTRING
+
+        # compare against every run of as many words as the query has
+        limit = max_edits(query)
+        words = name.split()
+        width = len(query.split())
+
+        best = min((edit_distance(query, " ".join(words[i:i + width]), limit)
+                    for i in range(max(len(words) - width + 1, 1))),
+                   default=limit + 1)
+
+        if best <= limit:
+            return FUZZY + best
+
+        return None
+
+    def search(self, query, rows):
+        """Rank the names at `rows` against `query`.
+
+        Returns the matching rows (in row order) and their scores, as
+        arrays.
+        """
+
+        query = normalize(query)
+
+        allowed = np.zeros(len(self.names), dtype=bool)
+        allowed[rows] = True
+
+        if len(query) < 3:
+            return self.search_prefix(query, allowed)
+
+        grams = trigrams(query)
+        inner = inner_trigrams(query)
+
+        close = self.shared(grams) >= math.ceil(MIN_SHARED * len(grams))
+        candidates = allowed & close
+
+        # with every word under three letters there are no inner trigrams,
+        # and "containing all of them" would admit every name
+        if inner:
+            candidates |= allowed & (self.shared(inner) >= len(inner))
+
+        candidates = np.flatnonzero(candidates)
+
+        matched, scores = [], []
+        for i in candidates.tolist():
+            s = self.score(self.names[i], query)
+            if s is not None:
+                matched.append(i)
+                scores.append(s)
+
+        return np.array(matched, dtype=np.intp), np.array(scores, dtype=np.intp)
+
+    def search_prefix(self, query, allowed):
+        """Match names with a word starting with `query`, via the word list"""
+
+        lo = bisect_left(self.words, query)
+        hi = bisect_left(self.words, query + "\uffff", lo=lo)
+
+        rows = self.word_rows[lo:hi]
+        scores = np.where(self.word_positions[lo:hi] == 0, PREFIX, WORD_PREFIX)
+
+        # a name may have several matching words; keep its best score
+        best = np.full(len(self.names), FUZZY, dtype=np.intp)
+        np.minimum.at(best, rows, scores)
+        best[(best == PREFIX) & (self.lengths == len(query))] = EXACT
+
+        matched = np.flatnonzero(allowed & (best < FUZZY))
+        return matched, best[matched]
@@ -0,0 +1,89 @@
+"""
+    Cached loading of the logged-in user.
+
+    Most requests never look at the current user (the catalog APIs are
+    anonymous), so g.user is a lazy proxy that only loads the user when a
+    view or template touches it. Loaded users are kept for a short while
+    in a TTL cache as plain column values, and turned back into a session
+    object without a query. Changes made by this process drop the cached
+    row at once; changes made elsewhere show up within USER_CACHE_TTL
+    seconds.
+"""
+
+import weakref
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+
+from cache import TTLCache
+from models import db, User
+
+# columns kept in the cache; the password hash is loaded on demand
+CACHED_COLUMNS = ('id', 'email', 'username')
+
+# every UserStore in this process, so a local change can reach them all
+_stores = weakref.WeakSet()
+
+
+class UserStore:
+    """TTL cache of user rows for one app"""
+
+    def __init__(self, app):
+        ttl = app.config.setdefault('USER_CACHE_TTL', 30)
+        maxsize = app.config.setdefault('USER_CACHE_SIZE', 1024)
+
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+        app.extensions['users'] = self
+        _stores.add(self)
+
+    def get(self, user_id):
+        """Return the user with this id in the current session, or None"""
+
+        values = self.cache.get(user_id)
+
+        if values is None:
+            user = User.query.get(user_id)
+            if user is not None:
+                self.cache.put(user_id, {c: getattr(user, c)
+                                         for c in CACHED_COLUMNS})
+            return user
+
+        user = User(**values)
+        make_transient_to_detached(user)
+
+        # load=False attaches the cached state without a round trip
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        self.cache.pop(user_id)
+
+    def clear(self):
+        self.cache.clear()
+
+
+def get_user(user_id):
+    """Load a user through the current app's cache"""
+
+    return current_app.extensions['users'].get(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def forget_changed_user(mapper, connection, user):
+    for store in list(_stores):
+        store.invalidate(user.id)
+
+
+@event.listens_for(db.session, "do_orm_execute")
+def forget_bulk_changed_users(orm_execute_state):
+    """Bulk updates and deletes don't say which users they touched"""
+
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and mapper.class_ is User:
+        for store in list(_stores):
+            store.clear()
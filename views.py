@@ -0,0 +1,693 @@
+"""
+    The site's views: pages, the JSON API and user accounts.
+
+    Registered on the app by create_app() in app.py.
+"""
+
+import json
+from functools import wraps
+from flask import (Blueprint, Response, current_app, flash, g, jsonify, redirect,
+                   render_template, request, session, stream_with_context)
+
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import load_only, selectinload
+from werkzeug.local import LocalProxy
+
+from models import (Monster, User, Encounter, CR_LENGTH, fits_integer, parse_list,
+                    to_int)
+from models import db, CatalogVersion
+from passwords import HasherBusy
+from pooling import pool_stats
+from routing import read_primary, replica_reads, stick_to_primary
+from forms import SignupForm, LoginForm
+from difficulty import evaluate, parse_groups, rate, to_records
+from builder import DIFFICULTY_LEVELS, parse_party, suggest
+from bulk import export_records, import_encounters, read_items, to_csv, to_ndjson
+from catalog import decode_cursor, get_catalog
+from instrumentation import query_budget
+from search import search_monsters
+from trigrams import normalize
+from users import get_user
+
+CURR_USER_KEY = "current_user"
+
+bp = Blueprint('main', __name__)
+
+
+#
+# HOMEPAGE
+#
+@bp.route("/")
+@replica_reads
+def root():
+    """Render the homepage"""
+
+    catalog = get_catalog()
+
+    return render_template('index.html',
+                           monsters=catalog.names[:10],
+                           monster_types=catalog.types,
+                           monster_sizes=catalog.sizes
+                           )
+
+
+#
+# API FUNCTIONALITY
+#
+def catalog_cached(view):
+    """Make a catalog view cacheable and conditional on the catalog version
+
+    Responses carry a strong ETag and Last-Modified derived from the
+    catalog version; a request that already has the current version is
+    answered with a 304 without running the view.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        catalog = get_catalog()
+        etag = catalog_etag(catalog, current_app.config['CATALOG_ETAG_SALT'])
+
+        if is_fresh(catalog, etag, request.if_none_match, request.if_modified_since):
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+
+            if response.status_code != 200:
+                return response
+
+        response.set_etag(etag)
+        response.last_modified = catalog.updated_at
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['CATALOG_MAX_AGE']
+        response.headers['Access-Control-Allow-Origin'] = '*'
+
+        return response
+
+    return wrapper
+
+
+def catalog_etag(catalog, salt):
+    return f"catalog-{catalog.version}{salt}"
+
+
+def is_fresh(catalog, etag, if_none_match, if_modified_since):
+    """Whether a client sending these (parsed) validators has `catalog` already"""
+
+    if if_none_match:
+        return if_none_match.contains(etag)
+
+    return (if_modified_since is not None
+            and catalog.updated_at is not None
+            and catalog.updated_at.replace(microsecond=0) <= if_modified_since)
+
+
+@bp.route("/api/monsters")
+@replica_reads
+@query_budget(4)
+@catalog_cached
+def get_monsters():
+    """Get monsters from the database according to filters in the query string
+
+    Besides the filter form parameters, accepts
+        q      -- name search; matches by prefix, substring or near-miss
+                  spelling and, unless `sort` is given, orders by relevance
+        sort   -- name, cr, size or type; prefix with "-" to reverse
+        limit  -- page size; without it every match is returned
+        after  -- the "next" cursor from the previous page
+    """
+
+    try:
+        body = list_monsters(get_catalog(), request.args)
+    except (TypeError, ValueError) as err:
+        return jsonify(error=str(err)), 400
+
+    response = current_app.response_class(body, mimetype='application/json')
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+def list_monsters(catalog, args):
+    """JSON body of a /api/monsters response for the query string `args`
+
+    Raises ValueError (or TypeError) if the parameters can't be used.
+    """
+
+    try:
+        rows = catalog.filter(**monster_filters(args))
+    except ValueError:
+        raise ValueError("min_cr and max_cr must be numbers")
+
+    # punctuation alone leaves nothing to search for
+    q = normalize(args.get('q', ''))
+    sort = args.get('sort', '')
+
+    limit = args.get('limit', None, type=int)
+    limit = max(limit, 1) if limit else None
+
+    after = args.get('after', None)
+    if after is not None:
+        after = decode_cursor(after)
+
+    if q:
+        rows, scores = catalog.search(rows, q)
+
+    if q and not sort:
+        page, cursor = catalog.page_ranked(rows, scores, after, limit)
+    else:
+        page, cursor = catalog.page(rows, sort or 'name', after, limit)
+
+    body = '{"monsters": ' + catalog.to_json(page)
+    if limit:
+        body += f', "total": {len(rows)}, "next": {json.dumps(cursor)}'
+
+    return body + '}'
+
+
+def monster_filters(args):
+    """Read the monster filter form parameters from a query string"""
+
+    return {
+        'min_cr': args.get('min_cr', 0),
+        'max_cr': args.get('max_cr', 30),
+        'type': args.get('type', None),
+        'size': args.get('size', None),
+        'status': args.get('status', 'both'),
+    }
+
+
+@bp.route("/api/monsters/search")
+@replica_reads
+@query_budget(4)
+@catalog_cached
+def monster_search():
+    """Search the rules text of monsters' special abilities and actions
+
+    Accepts the filter form parameters, and
+        text   -- what to search for: words, "quoted phrases", or, -word
+        limit  -- page size (default 20, at most 100)
+        offset -- number of monsters to skip
+    Monsters come best match first, each with its `rank` and up to three
+    `matches`: the ability's kind and name, and a snippet of its text
+    with the matching words in <mark> tags.
+    """
+
+    catalog = get_catalog()
+
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    try:
+        total, results = search_monsters(db.session, request.args.get('text', ''),
+                                         limit=limit, offset=offset,
+                                         **monster_filters(request.args))
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    monsters = []
+    for monster_id, rank, matches in results:
+        i = catalog.row(monster_id)
+        if i is None:
+            # added since this worker's catalog was loaded
+            total -= 1
+            continue
+
+        monster = json.loads(catalog.json[i])
+        monster.update(rank=round(rank, 4), matches=matches)
+        monsters.append(monster)
+
+    response = jsonify(monsters=monsters, total=total)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+@bp.route("/api/monsters/<int:monster_id>")
+@replica_reads
+@query_budget(9)
+@catalog_cached
+def get_monster_by_id(monster_id):
+    """Get a monster's rendered stat block
+
+    Stat blocks are cached per worker, keyed by monster and catalog
+    version, so they are rendered again after the catalog changes. A
+    replica that hasn't caught up with the catalog version isn't used.
+    """
+
+    catalog = get_catalog()
+    stat_blocks = current_app.extensions['stat_blocks'].at_version(catalog.version)
+
+    key = (monster_id, catalog.version)
+    html = stat_blocks.get(key)
+
+    if html is None:
+        if CatalogVersion.current() != catalog.version:
+            read_primary(db.session)
+
+        monster = (Monster.query
+                   .options(selectinload(Monster.special_abilities),
+                            selectinload(Monster.actions),
+                            selectinload(Monster.legendary_actions))
+                   .filter_by(id=monster_id)
+                   .first_or_404())
+
+        html = render_template('monster.html', monster=monster)
+        stat_blocks.put(key, html)
+
+    response = jsonify(html)
+
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+@bp.route("/api/encounters/<int:enc_id>")
+@query_budget(4)
+def get_encounter_by_id(enc_id):
+
+    encounter = (Encounter.query
+                 .options(selectinload(Encounter.hero_groups),
+                          selectinload(Encounter.monster_groups))
+                 .filter_by(id=enc_id)
+                 .first_or_404())
+
+    # import pdb
+    # pdb.set_trace()
+
+    serialized = encounter.serialize()
+
+    response = jsonify(serialized)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+@bp.route("/api/encounters/evaluate", methods=["POST"])
+def evaluate_encounters():
+    """Rate a batch of hero/monster compositions in a single request
+
+    Expects JSON of the form
+        {"encounters": [{"heroes": [...], "monsters": [...]}, ...]}
+    using the same group shapes as a saved encounter. Monster groups that
+    only carry an "id" have their XP looked up in the catalog.
+    """
+
+    data = request.get_json(silent=True) or {}
+    encounters = data.get('encounters')
+
+    if not isinstance(encounters, list):
+        return jsonify(error="'encounters' must be a list"), 400
+
+    if len(encounters) > current_app.config['EVALUATE_MAX_ENCOUNTERS']:
+        return jsonify(
+            error=f"at most {current_app.config['EVALUATE_MAX_ENCOUNTERS']} encounters per request"), 400
+
+    try:
+        pairs = [(parse_groups(e.get('heroes')), parse_groups(e.get('monsters')))
+                 for e in encounters]
+        fill_monster_xp([m for heroes, monsters in pairs for m in monsters])
+        ratings = evaluate(pairs)
+
+    except (AttributeError, TypeError, ValueError) as err:
+        return jsonify(error=str(err)), 400
+
+    response = jsonify(results=to_records(ratings))
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+@bp.route("/api/encounters/suggest")
+@replica_reads
+def suggest_encounters():
+    """Suggest monster groups for a party and a target difficulty
+
+    Takes the same filters as /api/monsters plus
+        party       -- hero groups as "num x level", e.g. "4x3,1x4"
+        difficulty  -- easy, medium, hard or deadly (default hard)
+        limit       -- number of suggestions (default 10)
+        groups      -- most distinct monsters per suggestion (default 2)
+    """
+
+    try:
+        party = parse_party(request.args.get('party', ''))
+        difficulty = request.args.get('difficulty', 'hard').lower()
+        limit = min(max(int(request.args.get('limit', 10)), 1), 100)
+        max_groups = min(max(int(request.args.get('groups', 2)), 1), 3)
+
+        thresholds = rate(party, [])
+        thresholds = [thresholds[d] for d in DIFFICULTY_LEVELS]
+
+        catalog = get_catalog()
+        candidates = catalog.candidates(
+            catalog.filter(**monster_filters(request.args)))
+
+        suggestions = suggest(candidates, thresholds, difficulty,
+                              limit=limit, max_groups=max_groups)
+
+    except ValueError as err:
+        return jsonify(error=str(err)), 400
+
+    response = jsonify(party=party,
+                       thresholds=dict(zip(DIFFICULTY_LEVELS, thresholds)),
+                       encounters=suggestions)
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    return response
+
+
+def fill_monster_xp(monster_groups):
+    """Fill in catalog XP for monster groups that only reference a monster id"""
+
+    catalog = None
+
+    for m in monster_groups:
+        if m.get('xp') is None:
+            catalog = catalog or get_catalog()
+            monster = catalog.lookup(to_int(m.get('id'), None))
+            if monster is None:
+                raise ValueError(f"unknown monster id {m.get('id')}")
+            m['xp'] = monster['xp']
+
+
+#
+# INSTRUMENTATION
+#
+@bp.route("/_stats")
+def get_stats():
+    """Report this worker's cache, per-endpoint query and pool statistics"""
+
+    return jsonify(stat_blocks=current_app.extensions['stat_blocks'].stats(),
+                   users=current_app.extensions['users'].cache.stats(),
+                   queries=current_app.extensions['query_totals'].snapshot(),
+                   pool=pool_stats(db.engine))
+
+
+def warm_up(app):
+    """Load the catalog and compile the templates ahead of the first request
+
+    Returns whether it worked; a worker that couldn't reach the database
+    stays unready and tries again on the next /ready.
+    """
+
+    with app.app_context():
+        try:
+            get_catalog()
+        except SQLAlchemyError:
+            app.logger.exception("Catalog warm-up failed")
+            return False
+        finally:
+            db.session.remove()
+
+        for name in app.jinja_env.list_templates(extensions=['html']):
+            app.jinja_env.get_template(name)
+
+    app.extensions['ready'] = True
+    return True
+
+
+@bp.route("/ready")
+def ready():
+    """Readiness probe: 503 until this worker has warmed up"""
+
+    if not current_app.extensions['ready'] and not warm_up(current_app._get_current_object()):
+        return jsonify(ready=False), 503
+
+    return jsonify(ready=True, catalog_version=get_catalog().version)
+
+
+#
+# USER SIGNUP / LOGIN / LOGOUT
+#
+def load_current_user():
+    """The logged-in user (or None), loaded at most once per request"""
+
+    if '_current_user' not in g:
+        user_id = session.get(CURR_USER_KEY)
+        g._current_user = get_user(user_id) if user_id is not None else None
+
+    return g._current_user
+
+
+@bp.before_app_request
+def add_user_to_g():
+    """Add the logged-in user to Flask global, loaded on first use"""
+
+    g.user = LocalProxy(load_current_user)
+
+
+def login_user(user):
+    session[CURR_USER_KEY] = user.id
+    g.pop('_current_user', None)
+
+
+def logout_user():
+    if CURR_USER_KEY in session:
+        current_app.extensions['users'].invalidate(session.pop(CURR_USER_KEY))
+    g.pop('_current_user', None)
+
+
+def busy(template, form):
+    """Turn a login away while the password hashers are saturated"""
+
+    flash("We're very busy right now. Please try again in a moment.", "warning")
+
+    response = current_app.make_response((render_template(template, form=form), 503))
+    response.retry_after = 5
+
+    return response
+
+
+@bp.route("/signup", methods=["GET", "POST"])
+def signup():
+    """Handle user signup"""
+
+    form = SignupForm()
+
+    if form.validate_on_submit():
+        try:
+            user = User.signup(
+                email=form.email.data,
+                username=form.username.data,
+                password=form.password.data
+            )
+            db.session.commit()
+
+        except HasherBusy:
+            return busy('signup.html', form)
+
+        except IntegrityError as err:
+            db.session.rollback()
+
+            if "username" in err.orig.diag.message_detail:
+                msg = "Sorry, that username is already in use."
+            elif "email" in err.orig.diag.message_detail:
+                msg = "Sorry, that email is already in use."
+            else:
+                msg = "Sorry, we are unable to register you at this time. Please try again later."
+
+            flash(msg, "danger")
+
+        else:
+            login_user(user)
+            flash("Account created. Welcome!", "success")
+            return redirect('/')
+
+    return render_template('signup.html', form=form)
+
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    """Handle user login"""
+
+    form = LoginForm()
+
+    if form.validate_on_submit():
+        try:
+            user = User.authenticate(
+                form.username.data,
+                form.password.data
+            )
+        except HasherBusy:
+            return busy('login.html', form)
+
+        if user:
+            # saves the password hash if it was upgraded
+            db.session.commit()
+            login_user(user)
+            flash(f"Welcome back {user.username}!", "success")
+            return redirect('/')
+        else:
+            flash("Invalid username or password.", "danger")
+
+    return render_template('login.html', form=form)
+
+
+@bp.route("/logout")
+def logout():
+    """Handle user logout"""
+
+    logout_user()
+    flash("Successfully logged out.", "success")
+    return redirect('/login')
+
+
+@bp.route("/users/<int:user_id>")
+@query_budget(3)
+def user_page(user_id):
+    """Show user page, with one page of saved encounters (newest first)
+
+    ?before=<encounter id> continues the list after that encounter.
+    """
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect('/login')
+
+    if g.user.id != user_id:
+        flash("Access unauthorized. Redirecting to your own page.", "danger")
+
+    before = request.args.get('before', type=int)
+    page_size = current_app.config['USER_PAGE_SIZE']
+
+    query = (Encounter.query
+             .options(load_only(Encounter.id, Encounter.summary,
+                                Encounter.num_monsters, Encounter.adjusted_xp,
+                                Encounter.difficulty))
+             .filter(Encounter.user_id == g.user.id))
+
+    if before is not None:
+        query = query.filter(Encounter.id < before)
+
+    # one extra row tells us whether there is another page
+    encounters = query.order_by(Encounter.id.desc()).limit(page_size + 1).all()
+
+    next_before = None
+    if len(encounters) > page_size:
+        encounters = encounters[:page_size]
+        next_before = encounters[-1].id
+
+    return render_template('user.html', user=g.user, encounters=encounters,
+                           before=before, next_before=next_before)
+
+
+@bp.route("/users/<int:user_id>/save", methods=["POST"])
+def save_encounter(user_id):
+    """Save an encounter to the database"""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect('/login')
+
+    if g.user.id != user_id:
+        flash("Access unauthorized. Redirecting to your own page.", "danger")
+
+    #user = User.query.get_or_404(user_id)
+
+    heroes = request.json.get("heroes")
+    monsters = request.json.get("monsters")
+
+    if not all(fits_integer(group.get(key))
+               for group in parse_list(heroes) + parse_list(monsters)
+               for key in ('id', 'num', 'lvl', 'xp')):
+        return jsonify(error="hero or monster numbers are out of range"), 400
+
+    if any(group.get('cr') is not None and len(str(group['cr'])) > CR_LENGTH
+           for group in parse_list(monsters)):
+        return jsonify(error="monster challenge ratings are too long"), 400
+
+    new_enc = Encounter(user_id=user_id, heroes=heroes, monsters=monsters)
+    db.session.add(new_enc)
+    db.session.commit()
+    stick_to_primary()
+
+    response = jsonify({'response': 'success'})
+    response.headers.add('Access-Control-Allow-Origin', '*')
+
+    flash("Encounter saved!", "success")
+    return response
+
+
+@bp.route("/users/<int:user_id>/encounters/bulk", methods=["POST"])
+def bulk_save_encounters(user_id):
+    """Save many encounters in one request and one transaction
+
+    Accepts a JSON array of encounters (or {"encounters": [...]}), or
+    NDJSON with one encounter per line, each shaped like a saved
+    encounter: {"heroes": [...], "monsters": [...]}. Invalid encounters
+    are skipped and reported by position; the rest are saved.
+    """
+
+    if not g.user:
+        return jsonify(error="login required"), 401
+
+    if g.user.id != user_id:
+        return jsonify(error="you can only import your own encounters"), 403
+
+    try:
+        ids, errors = import_encounters(
+            user_id, read_items(request),
+            batch_size=current_app.config['BULK_BATCH_SIZE'],
+            max_items=current_app.config['BULK_MAX_ENCOUNTERS'])
+    except ValueError as err:
+        db.session.rollback()
+        return jsonify(error=str(err)), 400
+    except Exception:
+        db.session.rollback()
+        raise
+
+    db.session.commit()
+    stick_to_primary()
+
+    return jsonify(saved=len(ids), ids=ids, errors=errors)
+
+
+@bp.route("/users/<int:user_id>/encounters/export")
+def export_encounters(user_id):
+    """Stream all of a user's encounters as NDJSON (default) or ?format=csv
+
+    Monsters carry their current catalog name, CR and XP.
+    """
+
+    if not g.user:
+        return jsonify(error="login required"), 401
+
+    if g.user.id != user_id:
+        return jsonify(error="you can only export your own encounters"), 403
+
+    formats = {
+        'ndjson': (to_ndjson, 'application/x-ndjson'),
+        'csv': (to_csv, 'text/csv'),
+    }
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in formats:
+        return jsonify(error="format must be ndjson or csv"), 400
+
+    writer, mimetype = formats[fmt]
+    records = export_records(user_id, get_catalog())
+
+    response = Response(stream_with_context(writer(records)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="encounters.{fmt}"'
+
+    return response
+
+
+@bp.route("/encounters/<int:enc_id>/delete", methods=["POST"])
+def delete_encounter(enc_id):
+    """Delete an encounter from the database"""
+
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect('/login')
+
+    enc = Encounter.query.get_or_404(enc_id)
+
+    if g.user.id != enc.user_id:
+        flash("Access unauthorized. Redirecting to your own page.", "danger")
+
+    db.session.delete(enc)
+    db.session.commit()
+    stick_to_primary()
+
+    return redirect(f'/users/{g.user.id}')